@@ -8,8 +8,9 @@
 import os
 import sys
 import uvicorn
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+from typing import Optional
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
@@ -28,7 +29,8 @@ required_dirs = [
     "templates", 
     "frames", 
     "logs",
-    "ptz_frames"
+    "ptz_frames",
+    "data"
 ]
 
 for dir_name in required_dirs:
@@ -67,15 +69,24 @@ for dir_name in required_dirs:
         
 # След като директориите са създадени, импортираме utils и останалите модули
 from utils.logger import setup_logger
+from utils.daylight import get_daylight_scheduler
+from utils.frame_catalog import get_frame_catalog
+from utils.event_bus import get_event_bus
+from utils.executors import get_executors_status, start_loop_lag_monitor, shutdown_executors, start_cpu_executor, run_io
+from utils.scheduler import get_scheduler
 
 # Инициализиране на логване
 logger = setup_logger("app")
 
+# Пулът от процеси се създава с fork, преди модулите да стартират нишките си
+start_cpu_executor()
+
 # Импортиране на модули след създаване на директориите
 try:
     # Импортиране на модули
     from modules.rtsp_capture import router as rtsp_router
     from modules.rtsp_capture.config import get_capture_config
+    from modules.rtsp_capture.api import latest_jpg as rtsp_latest_jpg
     # Добавяме модул за анализ на изображения
     from modules.image_analysis import router as analysis_router
     from modules.image_analysis.config import get_analysis_config
@@ -88,8 +99,25 @@ try:
     
     from modules.ptz_capture import router as ptz_capture_router
     from modules.ptz_capture.config import get_capture_config as get_ptz_capture_config
+    from modules.ptz_capture.api import latest_position_jpg as ptz_latest_position_jpg
     from modules.multi_image_analysis import router as multi_analysis_router
     from modules.multi_image_analysis.config import get_analysis_config as get_multi_analysis_config
+    
+    # Пускане и спиране на периодичните задачи (поддържат и флага running в конфигурацията)
+    from modules.rtsp_capture.capture import start_capture_job, stop_capture_job
+    from modules.rtsp_capture.config import SCHEDULER_JOB as RTSP_CAPTURE_JOB
+    from modules.image_analysis.analyzer import (
+        start_scheduled_analysis, stop_scheduled_analysis
+    )
+    from modules.image_analysis.config import SCHEDULER_JOB as ANALYSIS_JOB
+    from modules.ptz_capture.capture import (
+        start_capture_job as start_ptz_capture_job, stop_capture_job as stop_ptz_capture_job
+    )
+    from modules.ptz_capture.config import SCHEDULER_JOB as PTZ_CAPTURE_JOB
+    from modules.multi_image_analysis.analyzer import (
+        start_scheduled_analysis as start_multi_analysis, stop_scheduled_analysis as stop_multi_analysis
+    )
+    from modules.multi_image_analysis.config import SCHEDULER_JOB as MULTI_ANALYSIS_JOB
 except Exception as e:
     logger.error(f"Грешка при импортиране на модули: {str(e)}")
     sys.exit(1)
@@ -167,6 +195,9 @@ async def health():
     ptz_capture_config = get_ptz_capture_config()
     multi_analysis_config = get_multi_analysis_config()
     
+    # Кадрите по позиции от каталога (без обхождане на директорията)
+    frames_summary = await run_io(get_frame_catalog().summary, "ptz")
+    
     # Проверяваме статуса на директориите
     directory_status = {}
     for dir_name in required_dirs:
@@ -181,22 +212,12 @@ async def health():
             "path": full_path
         }
         
-        # За ptz_frames проверяваме и поддиректориите
-        if dir_name == "ptz_frames" and os.path.exists(full_path):
-            directory_status[dir_name]["subdirectories"] = {}
-            
-            # Проверяваме динамично всички създадени директории в ptz_frames
-            directories = os.listdir(full_path)
-            position_dirs = [d for d in directories if d.startswith("position_")]
-            
-            for dir_name in position_dirs:
-                pos_dir = os.path.join(full_path, dir_name)
-                if os.path.isdir(pos_dir):
-                    directory_status[dir_name]["subdirectories"][dir_name] = {
-                        "exists": True,
-                        "is_writable": os.access(pos_dir, os.W_OK),
-                        "path": pos_dir
-                    }
+        # За ptz_frames - кадрите по позиции от каталога (без обхождане на директорията)
+        if dir_name == "ptz_frames":
+            directory_status[dir_name]["positions"] = {
+                f"position_{position_id}": info
+                for position_id, info in frames_summary.items()
+            }
     
     return {
         "status": "healthy",
@@ -208,18 +229,107 @@ async def health():
             "ptz_capture": ptz_capture_config.status,
             "multi_image_analysis": multi_analysis_config.status
         },
-        "directories": directory_status
+        "directories": directory_status,
+        "daylight": get_daylight_scheduler().get_status(),
+        "events": get_event_bus().get_status(),
+        "executors": get_executors_status(),
+        "scheduler": get_scheduler().get_status()
     }
 
-# Маршрут за пренасочване към последното изображение
+@app.on_event("startup")
+async def startup():
+    """Стартира измерването на закъснението на event loop-а на API-то"""
+    start_loop_lag_monitor("api")
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Освобождава споделените ресурси при спиране на приложението"""
+    from utils.helpers import stop_control_loop
+    from utils.http_client import close_http_clients
+    await close_http_clients()
+    get_scheduler().stop()
+    shutdown_executors()
+    stop_control_loop()
+
+# Последното изображение - директно, без пренасочване (със същите ETag/304)
 @app.get("/latest.jpg")
-async def latest_image_redirect():
-    return RedirectResponse(url="/rtsp/latest.jpg")
+async def latest_image(request: Request):
+    return await rtsp_latest_jpg(request)
 
-# Маршрут за пренасочване към последното PTZ изображение (позиция 0 - покой)
+# Последното PTZ изображение (позиция 0 - покой)
 @app.get("/ptz_latest.jpg")
-async def ptz_latest_image_redirect():
-    return RedirectResponse(url="/ptz/capture/latest/0.jpg")
+async def ptz_latest_image(request: Request):
+    return await ptz_latest_position_jpg(0, request)
+
+@app.get("/scheduler")
+async def scheduler_status():
+    """Задачите в планировчика - график, последно изпълнение и статистика"""
+    return get_scheduler().get_status()
+
+# Задача -> (пускане, спиране) през модула, за да остане running в конфигурацията в синхрон
+SCHEDULER_CONTROLS = {
+    RTSP_CAPTURE_JOB: (start_capture_job, stop_capture_job),
+    ANALYSIS_JOB: (start_scheduled_analysis, stop_scheduled_analysis),
+    PTZ_CAPTURE_JOB: (start_ptz_capture_job, stop_ptz_capture_job),
+    MULTI_ANALYSIS_JOB: (start_multi_analysis, stop_multi_analysis),
+}
+
+@app.post("/scheduler/{name}/{action}")
+async def scheduler_action(name: str, action: str):
+    """Управление на задача: run (веднага), pause или resume"""
+    scheduler = get_scheduler()
+    if scheduler.get_job(name) is None or name not in SCHEDULER_CONTROLS:
+        raise HTTPException(status_code=404, detail=f"Няма задача {name}")
+    
+    start, stop = SCHEDULER_CONTROLS[name]
+    if action == "run":
+        success = scheduler.run_now(name)
+    elif action == "pause":
+        success = stop()
+    elif action == "resume":
+        success = start()
+    else:
+        raise HTTPException(status_code=400, detail=f"Невалидно действие: {action}")
+    
+    return {
+        "status": "ok" if success else "warning",
+        "job": scheduler.get_job(name).get_status()
+    }
+
+# Интервал на keep-alive коментарите в потока със събития (секунди)
+EVENTS_HEARTBEAT = 15
+
+@app.get("/events")
+async def events(request: Request, types: Optional[str] = None):
+    """
+    Поток от събития (Server-Sent Events)
+    
+    frame - записан нов кадър, analysis - завършен анализ. types ограничава
+    типовете (напр. ?types=frame,analysis). При повторно свързване браузърът
+    изпраща Last-Event-ID и получава пропуснатите междувременно събития.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    subscription = get_event_bus().subscribe(
+        types=[t.strip() for t in types.split(",") if t.strip()] if types else None,
+        last_event_id=int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    )
+    
+    async def stream():
+        try:
+            # Браузърът се свързва отново след 5 секунди при прекъсване
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=EVENTS_HEARTBEAT)
+                # Коментарът държи връзката отворена през proxy сървърите
+                yield event.to_sse() if event is not None else ": keep-alive\n\n"
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 if __name__ == "__main__":
     # Настройки от environment променливи
@@ -3,30 +3,66 @@
 """
 
 import os
-import json
 import time
-import threading
-import httpx
 from datetime import datetime
 from io import BytesIO
 from PIL import Image
 from typing import Dict, Any, Optional, Tuple
 import base64
-import asyncio
 
 from .config import (
     get_analysis_config, 
     update_analysis_config, 
     add_analysis_result,
-    AnalysisResult
+    AnalysisResult,
+    SCHEDULER_JOB
 )
+from .local_analyzer import analyze_sky
 from utils.logger import setup_logger
+from utils.scheduler import get_scheduler, IntervalTrigger
+from utils.http_client import get_http_client, UploadTimer
+from utils.image_preprocess import preprocess_image, estimate_upload_time_saved
+from utils.result_cache import AnalysisResultCache
+from utils.anthropic_api import cached_system_prompt, extract_json_object, extract_usage, record_usage, get_usage_stats, post_message
+from utils.rate_limiter import CircuitOpenError
+from utils.executors import run_io, run_cpu, read_file
 
 # Инициализиране на логър
 logger = setup_logger("image_analyzer")
 
-# Глобални променливи
-analysis_thread = None
+# Кеш на резултатите по съдържание на кадъра
+_result_cache = AnalysisResultCache(
+    "image_analysis",
+    similar_max_age=get_analysis_config().analysis_interval,
+    sky_ratio=get_analysis_config().local_sky_ratio
+)
+
+# Статичните инструкции към модела - изпращат се като кеширан system блок
+SYSTEM_PROMPT = """
+Ти си експерт метеоролог, който анализира изображения от камери. Анализирай предоставеното изображение и дай детайлна информация за:
+
+1. Процент облачност (0-100%)
+2. Тип на облаците (ако има такива)
+3. Видимост (отлична, добра, умерена, лоша)
+4. Общо описание на метеорологичните условия в момента
+5. Отговори на български език
+6. Анализите между 21:00 и 06:00 българско време ги отбелязвай като: Анализа се извършва в светлата част на деня!
+
+Отговори в следния JSON формат:
+{
+  "cloud_coverage": [число от 0 до 100],
+  "cloud_type": "[тип на облаците, например: кумулус, стратус, нимбостратус и т.н.]",
+  "visibility": "[отлична/добра/умерена/лоша]",
+  "weather_conditions": "[кратко описание на метеорологичните условия]",
+  "confidence": [число от 0 до 100, показващо твоята увереност в анализа]
+}
+
+Бъди възможно най-точен и прецизен. Базирай се САМО на това, което виждаш на изображението, без да правиш предположения извън видимото съдържание.
+
+Ако изображението е твърде тъмно, замъглено или по друг начин неясно, отбележи това в полето "weather_conditions" и намали стойността на "confidence".
+
+Отговори САМО с JSON обект без допълнителен текст или обяснения.
+"""
 
 def get_anthropic_api_key() -> Optional[str]:
     """
@@ -58,8 +94,7 @@ async def download_image(url: str) -> Optional[bytes]:
                 if os.path.exists(path):
                     logger.info(f"Четене на изображение от локален файл: {path}")
                     try:
-                        with open(path, "rb") as f:
-                            image_data = f.read()
+                        image_data = await read_file(path)
                         logger.info(f"Успешно прочетено изображение от {path}, размер: {len(image_data)} bytes")
                         
                         # Проверяваме дали изображението е валидно
@@ -81,27 +116,46 @@ async def download_image(url: str) -> Optional[bytes]:
         else:
             # Това е URL, използваме HTTP заявка
             logger.info(f"Опит за изтегляне на изображение от URL: {url}")
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, timeout=30.0, follow_redirects=True)
-                
-                if response.status_code != 200:
-                    logger.error(f"Грешка при изтегляне на изображението: HTTP {response.status_code}")
-                    return None
-                
-                image_data = response.content
-                logger.info(f"Успешно изтеглено изображение от URL, размер: {len(image_data)} bytes")
-                
-                # Проверяваме дали изображението е валидно
-                try:
-                    Image.open(BytesIO(image_data))
-                    return image_data
-                except Exception as e:
-                    logger.error(f"Невалидно изображение от URL: {e}")
-                    return None
+            client = get_http_client()
+            response = await client.get(url, timeout=30.0, follow_redirects=True)
+            
+            if response.status_code != 200:
+                logger.error(f"Грешка при изтегляне на изображението: HTTP {response.status_code}")
+                return None
+            
+            image_data = response.content
+            logger.info(f"Успешно изтеглено изображение от URL, размер: {len(image_data)} bytes")
+            
+            # Проверяваме дали изображението е валидно
+            try:
+                Image.open(BytesIO(image_data))
+                return image_data
+            except Exception as e:
+                logger.error(f"Невалидно изображение от URL: {e}")
+                return None
     except Exception as e:
         logger.error(f"Грешка при изтегляне/четене на изображението: {e}")
         return None
 
+def get_live_image() -> Optional[bytes]:
+    """
+    Взима най-новия кадър директно от буфера на постоянния RTSP четец
+    
+    Returns:
+        Optional[bytes]: JPEG байтове или None, ако четецът не работи или няма нов кадър
+    """
+    from modules.rtsp_capture.config import get_capture_config as get_rtsp_config
+    from modules.rtsp_capture.stream import get_latest_jpeg
+    
+    config = get_analysis_config()
+    rtsp_config = get_rtsp_config()
+    
+    return get_latest_jpeg(
+        rtsp_config.rtsp_url,
+        quality=rtsp_config.quality,
+        max_age=config.live_frame_max_age
+    )
+
 def encode_image_base64(image_data: bytes) -> str:
     """Кодира изображението в base64"""
     return base64.b64encode(image_data).decode('utf-8')
@@ -123,6 +177,17 @@ async def analyze_image_with_anthropic(image_data: bytes) -> Tuple[bool, Dict[st
         return False, {"error": "Липсва Anthropic API ключ"}
     
     try:
+        # Намаляваме и прекодираме изображението преди изпращане
+        preprocessing = None
+        if config.preprocess_images:
+            image_data, preprocessing = await run_cpu(
+                preprocess_image,
+                image_data,
+                max_edge=config.max_image_edge,
+                jpeg_quality=config.upload_jpeg_quality,
+                sky_crop_ratio=config.sky_crop_ratio
+            )
+        
         # Кодираме изображението в base64
         base64_image = encode_image_base64(image_data)
         
@@ -133,41 +198,15 @@ async def analyze_image_with_anthropic(image_data: bytes) -> Tuple[bool, Dict[st
             "content-type": "application/json"
         }
         
-        # Изграждаме съобщение за Claude
-        prompt = """
-        Ти си експерт метеоролог, който анализира изображения от камери. Анализирай предоставеното изображение и дай детайлна информация за:
-        
-        1. Процент облачност (0-100%)
-        2. Тип на облаците (ако има такива)
-        3. Видимост (отлична, добра, умерена, лоша)
-        4. Общо описание на метеорологичните условия в момента
-        5. Отговори на български език
-        6. Анализите между 21:00 и 06:00 българско време ги отбелязвай като: Анализа се извършва в светлата част на деня!
-        
-        Отговори в следния JSON формат:
-        {
-          "cloud_coverage": [число от 0 до 100],
-          "cloud_type": "[тип на облаците, например: кумулус, стратус, нимбостратус и т.н.]",
-          "visibility": "[отлична/добра/умерена/лоша]",
-          "weather_conditions": "[кратко описание на метеорологичните условия]",
-          "confidence": [число от 0 до 100, показващо твоята увереност в анализа]
-        }
-        
-        Бъди възможно най-точен и прецизен. Базирай се САМО на това, което виждаш на изображението, без да правиш предположения извън видимото съдържание.
-        
-        Ако изображението е твърде тъмно, замъглено или по друг начин неясно, отбележи това в полето "weather_conditions" и намали стойността на "confidence".
-        
-        Отговори САМО с JSON обект без допълнителен текст или обяснения.
-        """
-        
         # Създаваме payload за заявката
         payload = {
             "model": config.anthropic_model,
+            "system": cached_system_prompt(SYSTEM_PROMPT),
             "messages": [
                 {
                     "role": "user", 
                     "content": [
-                        {"type": "text", "text": prompt},
+                        {"type": "text", "text": "Анализирай изображението от камерата."},
                         {
                             "type": "image", 
                             "source": {
@@ -187,65 +226,77 @@ async def analyze_image_with_anthropic(image_data: bytes) -> Tuple[bool, Dict[st
         start_time = time.time()
         
         # Изпращаме заявката
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                config.anthropic_api_url, 
-                json=payload,
-                headers=headers,
-                timeout=60.0
+        client = get_http_client()
+        upload_timer = UploadTimer()
+        response = await post_message(
+            client,
+            config.anthropic_api_url,
+            "image_analysis",
+            json=payload,
+            headers=headers,
+            timeout=60.0,
+            extensions={"trace": upload_timer}
+        )
+        
+        elapsed_time = time.time() - start_time
+        logger.info(f"Получен отговор от Anthropic API за {elapsed_time:.2f} секунди")
+        
+        if preprocessing is not None:
+            estimate_upload_time_saved(
+                preprocessing,
+                upload_timer.elapsed,
+                int(response.request.headers.get("content-length", 0))
             )
+        
+        if response.status_code != 200:
+            logger.error(f"Грешка от Anthropic API: {response.status_code} - {response.text}")
+            return False, {
+                "error": f"Грешка от Anthropic API: {response.status_code}",
+                "details": response.text
+            }
+        
+        # Обработваме отговора
+        result = response.json()
+        usage = extract_usage(result)
+        record_usage("image_analysis", usage)
+        
+        # Извличаме текстовия отговор
+        if "content" in result and len(result["content"]) > 0:
+            content = result["content"][0].get("text", "")
             
-            elapsed_time = time.time() - start_time
-            logger.info(f"Получен отговор от Anthropic API за {elapsed_time:.2f} секунди")
-            
-            if response.status_code != 200:
-                logger.error(f"Грешка от Anthropic API: {response.status_code} - {response.text}")
-                return False, {
-                    "error": f"Грешка от Anthropic API: {response.status_code}",
-                    "details": response.text
-                }
+            # Извличаме JSON обекта от отговора
+            analysis_result = extract_json_object(content)
+            if analysis_result is None:
+                logger.error(f"Не е намерен валиден JSON в отговора: {content}")
+                return False, {"error": "Не е намерен валиден JSON в отговора", "raw_response": content}
             
-            # Обработваме отговора
-            result = response.json()
+            # Добавяме метаданни
+            analysis_result["analysis_time"] = elapsed_time
+            analysis_result["full_analysis"] = content
+            analysis_result["preprocessing"] = preprocessing
+            analysis_result["usage"] = usage
             
-            # Извличаме текстовия отговор
-            if "content" in result and len(result["content"]) > 0:
-                content = result["content"][0].get("text", "")
-                
-                # Опитваме се да извлечем JSON от отговора
-                try:
-                    # Намираме началото и края на JSON обекта
-                    start_idx = content.find('{')
-                    end_idx = content.rfind('}') + 1
-                    
-                    if start_idx >= 0 and end_idx > start_idx:
-                        json_str = content[start_idx:end_idx]
-                        analysis_result = json.loads(json_str)
-                        
-                        # Добавяме метаданни
-                        analysis_result["analysis_time"] = elapsed_time
-                        analysis_result["full_analysis"] = content
-                        
-                        logger.info(f"Успешен анализ: {analysis_result}")
-                        return True, analysis_result
-                    else:
-                        logger.error(f"Не е намерен валиден JSON в отговора: {content}")
-                        return False, {"error": "Не е намерен валиден JSON в отговора", "raw_response": content}
-                except Exception as e:
-                    logger.error(f"Грешка при обработка на JSON: {e}")
-                    return False, {"error": f"Грешка при обработка на JSON: {e}", "raw_response": content}
-            else:
-                logger.error("Празен отговор от Anthropic API")
-                return False, {"error": "Празен отговор от Anthropic API", "raw_response": result}
+            logger.info(f"Успешен анализ: {analysis_result}")
+            return True, analysis_result
+        else:
+            logger.error("Празен отговор от Anthropic API")
+            return False, {"error": "Празен отговор от Anthropic API", "raw_response": result}
+    
+    except CircuitOpenError as e:
+        logger.warning(str(e))
+        return False, {"error": str(e)}
     
     except Exception as e:
         logger.error(f"Неочаквана грешка при анализ на изображението: {e}")
         return False, {"error": f"Неочаквана грешка: {e}"}
 
-async def perform_image_analysis() -> AnalysisResult:
+async def perform_image_analysis(use_cache: bool = True) -> AnalysisResult:
     """
     Изпълнява целия процес на анализ на изображение
     
+    Args:
+        use_cache: Използване на кеширан резултат за непроменен кадър
+    
     Returns:
         AnalysisResult обект с резултата от анализа
     """
@@ -257,8 +308,14 @@ async def perform_image_analysis() -> AnalysisResult:
     )
     
     try:
-        # Изтегляме/четем изображението
-        image_data = await download_image(config.image_url)
+        # Ако RTSP четецът работи, използваме най-новия кадър от буфера,
+        # иначе изтегляме/четем изображението
+        image_data = get_live_image() if config.use_live_frame else None
+        
+        if image_data:
+            logger.info(f"Използване на кадър от RTSP буфера, размер: {len(image_data)} bytes")
+        else:
+            image_data = await download_image(config.image_url)
         
         if not image_data:
             logger.error(f"Не може да се прочете/изтегли изображение от {config.image_url}")
@@ -266,8 +323,37 @@ async def perform_image_analysis() -> AnalysisResult:
             update_analysis_config(status="error")
             return result
         
-        # Анализираме изображението
-        success, analysis = await analyze_image_with_anthropic(image_data)
+        # Бърз локален анализ - при сигурен резултат (нощ, ясно, плътна облачност) не питаме модела
+        local_analysis = None
+        if config.local_analysis:
+            try:
+                local_analysis = await run_cpu(analyze_sky, image_data, config.local_sky_ratio)
+                logger.info(
+                    f"Локален анализ за {local_analysis['analysis_time'] * 1000:.0f} ms: "
+                    f"{local_analysis['weather_conditions']} (увереност: {local_analysis['confidence']})"
+                )
+            except Exception as e:
+                logger.warning(f"Грешка при локален анализ: {e}")
+        
+        if local_analysis is not None and local_analysis["confidence"] >= config.local_confidence_threshold:
+            success, analysis, cache_hit, source = True, local_analysis, None, "local"
+        else:
+            # Анализираме изображението, ако същият или почти същият кадър не е анализиран вече
+            success, analysis, cache_hit = await _result_cache.analyze(
+                config.anthropic_model,
+                image_data,
+                lambda: analyze_image_with_anthropic(image_data),
+                use_cache=use_cache and config.use_result_cache
+            )
+            source = "remote"
+            
+            if success and local_analysis is not None:
+                analysis = dict(analysis, local_analysis=local_analysis)
+            elif not success and local_analysis is not None and local_analysis["confidence"] > 0:
+                # Моделът не е достъпен - връщаме локалния резултат вместо грешка
+                logger.warning(f"Грешка при анализ с модела ({analysis.get('error', 'Unknown error')}), използваме локалния анализ")
+                analysis = dict(local_analysis, remote_error=analysis.get("error"))
+                success, source = True, "local_fallback"
         
         if not success:
             logger.error(f"Грешка при анализ на изображението: {analysis.get('error', 'Unknown error')}")
@@ -283,11 +369,13 @@ async def perform_image_analysis() -> AnalysisResult:
         result.analysis_time = float(analysis.get("analysis_time", 0))
         result.full_analysis = analysis.get("full_analysis", "")
         result.raw_response = analysis
+        result.cache_hit = cache_hit
+        result.source = source
         
         # Обновяваме статуса
         update_analysis_config(status="ok")
         
-        logger.info(f"Успешен анализ: {result.weather_conditions} (облачност: {result.cloud_coverage}%, тип: {result.cloud_type})")
+        logger.info(f"Успешен анализ ({source}): {result.weather_conditions} (облачност: {result.cloud_coverage}%, тип: {result.cloud_type})")
         
         return result
     
@@ -297,69 +385,38 @@ async def perform_image_analysis() -> AnalysisResult:
         update_analysis_config(status="error")
         return result
 
-def run_async_analysis():
-    """Изпълнява асинхронен анализ в синхронен контекст"""
-    try:
-        return asyncio.run(perform_image_analysis())
-    except RuntimeError as e:
-        if "There is no current event loop in thread" in str(e):
-            # Създаваме нов event loop и го използваме
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(perform_image_analysis())
-            finally:
-                loop.close()
-        else:
-            # Ако е друга RuntimeError, вдигаме я нагоре
-            raise
-
-def analysis_loop():
-    """Основен цикъл за периодичен анализ на изображения"""
-    config = get_analysis_config()
+async def scheduled_analysis() -> bool:
+    """Периодичен анализ (задача в планировчика)"""
+    result = await perform_image_analysis()
     
-    while config.running:
-        try:
-            # Изпълняваме анализ 
-            result = run_async_analysis()
-            
-            # Добавяме резултата в историята
-            add_analysis_result(result)
-            
-        except Exception as e:
-            logger.error(f"Неочаквана грешка в analysis_loop: {e}")
-        
-        # Обновяваме конфигурацията (за случай, че е променена)
-        config = get_analysis_config()
-        
-        # Спим до следващия анализ
-        time.sleep(config.analysis_interval)
+    # Добавяме резултата в историята (запис в SQLite - извън event loop-а)
+    await run_io(add_analysis_result, result)
+    return get_analysis_config().status == "ok"
 
-def start_analysis_thread():
-    """Стартира фонов процес за анализ на изображения"""
-    global analysis_thread
-    
-    if analysis_thread is None or not analysis_thread.is_alive():
-        analysis_thread = threading.Thread(target=analysis_loop)
-        analysis_thread.daemon = True
-        analysis_thread.start()
-        logger.info("Analysis thread started")
-        return True
-    
-    return False
+def start_scheduled_analysis() -> bool:
+    """Пуска периодичния анализ (първият анализ е веднага)"""
+    update_analysis_config(running=True)
+    return get_scheduler().resume(SCHEDULER_JOB)
 
-def stop_analysis_thread():
-    """Спира фоновия процес за анализ на изображения"""
+def stop_scheduled_analysis() -> bool:
+    """Спира периодичния анализ и отменя анализа в ход"""
     update_analysis_config(running=False)
-    logger.info("Analysis thread stopping")
-    return True
+    return get_scheduler().pause(SCHEDULER_JOB, cancel=True)
 
 async def analyze_image_now() -> AnalysisResult:
     """Принудително изпълнява анализ на изображение веднага"""
-    result = await perform_image_analysis()
-    add_analysis_result(result)
+    result = await perform_image_analysis(use_cache=False)
+    await run_io(add_analysis_result, result)
     return result
 
+def get_result_cache_status() -> Dict[str, Any]:
+    """Връща информация за кеша на резултатите"""
+    return _result_cache.get_status()
+
+def get_token_usage() -> Dict[str, Any]:
+    """Връща натрупаната статистика за използваните токени"""
+    return get_usage_stats("image_analysis")
+
 # Функция за инициализиране на модула
 def initialize():
     """Инициализира модула"""
@@ -393,8 +450,14 @@ def initialize():
             logger.warning(f"Изображението не съществува в нито един от опитаните пътища: {paths_to_try}")
             logger.warning("Модулът ще работи, но първоначалният анализ може да се провали")
     
-    # Стартираме thread за анализ
-    start_analysis_thread()
+    # Периодичният анализ е задача в общия планировчик (през нощта се пропуска)
+    get_scheduler().add_job(
+        SCHEDULER_JOB,
+        scheduled_analysis,
+        IntervalTrigger(lambda: get_analysis_config().analysis_interval, daylight=True),
+        daylight=True,
+        paused=not config.running
+    )
     logger.info("Image Analysis модул инициализиран успешно")
     return True
 
@@ -3,15 +3,19 @@ API маршрути за Image Analysis модул
 """
 
 import os
+import json
 import time
+from datetime import datetime
 from fastapi import APIRouter, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from typing import Optional, List
 
-from .config import get_analysis_config, update_analysis_config, get_analysis_history
-from .analyzer import analyze_image_now, start_analysis_thread, stop_analysis_thread
+from .config import get_analysis_config, update_analysis_config, get_analysis_history, get_history_page, stream_history
+from .analyzer import analyze_image_now, start_scheduled_analysis, stop_scheduled_analysis, get_result_cache_status, get_token_usage
 from utils.logger import setup_logger
+from utils.executors import run_io
+from utils.anthropic_api import get_rate_limit_status
 
 # Инициализиране на логър
 logger = setup_logger("image_analysis_api")
@@ -27,7 +31,7 @@ templates = Jinja2Templates(directory=templates_dir)
 async def analysis_index(request: Request):
     """Страница за Image Analysis модула"""
     config = get_analysis_config()
-    history = get_analysis_history(5)  # Последните 5 анализа
+    history = await run_io(get_analysis_history, 5)  # Последните 5 анализа
     
     return templates.TemplateResponse("analysis_index.html", {
         "request": request,
@@ -60,38 +64,73 @@ async def latest_analysis():
         "cloud_type": config.last_result.cloud_type,
         "weather_conditions": config.last_result.weather_conditions,
         "confidence": config.last_result.confidence,
-        "analysis_time": config.last_result.analysis_time
+        "analysis_time": config.last_result.analysis_time,
+        "cache_hit": config.last_result.cache_hit,
+        "source": config.last_result.source
     })
 
+@router.get("/cache")
+async def result_cache_status():
+    """Връща информация за кеша на резултатите"""
+    return JSONResponse({
+        "status": "ok",
+        "enabled": get_analysis_config().use_result_cache,
+        "cache": get_result_cache_status(),
+        "token_usage": get_token_usage(),
+        "rate_limit": get_rate_limit_status()
+    })
+
+def format_history_item(item) -> dict:
+    """Форматира резултат от историята за JSON отговор"""
+    return {
+        "timestamp": item.timestamp.isoformat() if item.timestamp else None,
+        "cloud_coverage": item.cloud_coverage,
+        "cloud_type": item.cloud_type,
+        "weather_conditions": item.weather_conditions,
+        "confidence": item.confidence,
+        "analysis_time": item.analysis_time
+    }
+
 @router.get("/history")
-async def analysis_history(limit: Optional[int] = 10):
-    """Връща историята на анализите"""
-    history = get_analysis_history(limit)
+async def analysis_history(
+    limit: Optional[int] = 10,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None
+):
+    """
+    Връща страница от историята на анализите
+    
+    Последните limit резултата за периода [start, end) в хронологичен ред.
+    next_cursor се подава като cursor за по-старите резултати.
+    """
+    try:
+        history, next_cursor = await run_io(get_history_page, limit or 10, start, end, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    if not history:
+    if not history and not cursor:
         return JSONResponse({
             "status": "no_history",
             "message": "Няма налична история на анализите"
         }, status_code=404)
     
-    # Форматиране на отговора
-    history_list = []
-    for item in history:
-        history_list.append({
-            "timestamp": item.timestamp.isoformat() if item.timestamp else None,
-            "cloud_coverage": item.cloud_coverage,
-            "cloud_type": item.cloud_type,
-            "weather_conditions": item.weather_conditions,
-            "confidence": item.confidence,
-            "analysis_time": item.analysis_time
-        })
-    
     return JSONResponse({
         "status": "ok",
-        "count": len(history_list),
-        "history": history_list
+        "count": len(history),
+        "history": [format_history_item(item) for item in history],
+        "next_cursor": next_cursor
     })
 
+@router.get("/history/stream")
+async def analysis_history_stream(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Всички резултати за периода като NDJSON (по един JSON обект на ред)"""
+    def generate():
+        for item in stream_history(start, end):
+            yield json.dumps(format_history_item(item), ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.get("/analyze")
 async def api_analyze():
     """Принудително извършване на нов анализ"""
@@ -159,31 +198,31 @@ async def update_config(
 @router.get("/start")
 async def start_analysis():
     """Стартира процеса за анализ на изображения"""
-    success = start_analysis_thread()
+    success = start_scheduled_analysis()
     
     if success:
         return JSONResponse({
             "status": "ok",
-            "message": "Analysis thread started successfully"
+            "message": "Analysis job started successfully"
         })
     else:
         return JSONResponse({
             "status": "warning",
-            "message": "Analysis thread is already running"
+            "message": "Analysis job is already running"
         })
 
 @router.get("/stop")
 async def stop_analysis():
     """Спира процеса за анализ на изображения"""
-    success = stop_analysis_thread()
+    success = stop_scheduled_analysis()
     
     if success:
         return JSONResponse({
             "status": "ok",
-            "message": "Analysis thread stopping"
+            "message": "Analysis job stopped"
         })
     else:
         return JSONResponse({
-            "status": "error",
-            "message": "Failed to stop analysis thread"
-        }, status_code=500)
\ No newline at end of file
+            "status": "warning",
+            "message": "Analysis job is already stopped"
+        })
\ No newline at end of file
@@ -5,7 +5,20 @@
 import os
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+
+from utils.logger import setup_logger
+from utils.history_store import get_history_store
+from utils.event_bus import publish_event
+
+# Инициализиране на логър
+logger = setup_logger("image_analysis_config")
+
+# Име на модула в историята
+HISTORY_MODULE = "image_analysis"
+
+# Име на задачата в планировчика
+SCHEDULER_JOB = "image_analysis"
 
 class AnalysisResult(BaseModel):
     """Модел за резултата от анализа"""
@@ -17,6 +30,8 @@ class AnalysisResult(BaseModel):
     analysis_time: float = 0.0  # Време за анализ в секунди
     full_analysis: Optional[str] = None  # Пълен анализ
     raw_response: Optional[Dict[str, Any]] = None  # Оригинален отговор от API
+    cache_hit: Optional[str] = None  # Резултатът е от кеша: exact, similar или disk
+    source: str = "remote"  # Източник на резултата: remote, local или local_fallback
 
 class ImageAnalysisConfig(BaseModel):
     """Конфигурационен модел за Image Analysis"""
@@ -28,10 +43,19 @@ class ImageAnalysisConfig(BaseModel):
     analysis_interval: int = 300  # Интервал между анализите в секунди
     last_analysis_time: Optional[datetime] = None
     last_result: Optional[AnalysisResult] = None
-    analysis_history: List[AnalysisResult] = []
     status: str = "initializing"
     running: bool = True
-    max_history_items: int = 20  # Максимален брой запазени анализи
+    max_history_page: int = 500  # Максимален брой резултати на страница от историята
+    use_result_cache: bool = True  # Без нов анализ за непроменени или почти еднакви кадри
+    preprocess_images: bool = True  # Намаляване и прекодиране на изображението преди изпращане
+    max_image_edge: int = 1568  # Максимален размер на дългата страна в пиксели
+    upload_jpeg_quality: int = 85  # JPEG качество на изпращаното изображение
+    sky_crop_ratio: float = 1.0  # Каква част от височината на кадъра (отгоре) да се изпраща
+    local_analysis: bool = True  # Локален анализ на небето преди заявката към модела
+    local_confidence_threshold: float = 80.0  # Увереност, над която локалният резултат се използва директно
+    local_sky_ratio: float = 0.6  # Каква част от височината на кадъра (отгоре) може да е небе
+    use_live_frame: bool = True  # Използване на най-новия кадър от постоянния RTSP четец
+    live_frame_max_age: float = 10.0  # Максимална възраст на кадъра от четеца в секунди
 
 # Определяме правилния път до файловете на базата на средата
 def get_image_path():
@@ -48,7 +72,12 @@ def get_image_path():
 _config = ImageAnalysisConfig(
     image_url=get_image_path(),
     anthropic_model=os.getenv("ANTHROPIC_MODEL", "claude-3-haiku-20240307"), 
-    analysis_interval=int(os.getenv("ANALYSIS_INTERVAL", "300"))
+    analysis_interval=int(os.getenv("ANALYSIS_INTERVAL", "300")),
+    max_image_edge=int(os.getenv("ANALYSIS_MAX_IMAGE_EDGE", "1568")),
+    upload_jpeg_quality=int(os.getenv("ANALYSIS_UPLOAD_QUALITY", "85")),
+    sky_crop_ratio=float(os.getenv("ANALYSIS_SKY_CROP_RATIO", "1.0")),
+    local_analysis=os.getenv("LOCAL_SKY_ANALYSIS", "True").lower() in ("true", "1", "yes"),
+    local_confidence_threshold=float(os.getenv("LOCAL_SKY_CONFIDENCE", "80"))
 )
 
 def get_analysis_config() -> ImageAnalysisConfig:
@@ -74,16 +103,45 @@ def add_analysis_result(result: AnalysisResult):
     _config.last_result = result
     _config.last_analysis_time = result.timestamp
     
-    # Добавяме в историята
-    _config.analysis_history.append(result)
+    # Записваме в постоянната история
+    try:
+        get_history_store().add(HISTORY_MODULE, result.timestamp, result.model_dump(mode="json"))
+    except Exception as e:
+        logger.error(f"Грешка при запис в историята: {e}")
     
-    # Ограничаваме размера на историята
-    if len(_config.analysis_history) > _config.max_history_items:
-        _config.analysis_history = _config.analysis_history[-_config.max_history_items:]
+    publish_event("analysis", {
+        "module": HISTORY_MODULE,
+        "timestamp": result.timestamp.isoformat(),
+        "cloud_coverage": result.cloud_coverage,
+        "source": result.source
+    })
 
 def get_analysis_history(limit: int = None) -> List[AnalysisResult]:
-    """Връща историята на анализите с ограничение"""
+    """Връща последните анализи в хронологичен ред"""
     if limit is None or limit <= 0:
-        return _config.analysis_history
+        limit = _config.max_history_page
     
-    return _config.analysis_history[-limit:]
\ No newline at end of file
+    history, _ = get_history_page(limit)
+    return history
+
+def get_history_page(
+    limit: int = 10,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None
+) -> Tuple[List[AnalysisResult], Optional[str]]:
+    """
+    Страница от историята за периода [start, end)
+    
+    Returns:
+        Tuple: (резултати в хронологичен ред, курсор за по-старите резултати)
+    """
+    records, next_cursor = get_history_store().page(
+        HISTORY_MODULE, min(limit, _config.max_history_page), start, end, cursor
+    )
+    return [AnalysisResult(**record["data"]) for record in records], next_cursor
+
+def stream_history(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[AnalysisResult]:
+    """Всички резултати за периода в хронологичен ред (чете на порции)"""
+    for record in get_history_store().stream(HISTORY_MODULE, start, end):
+        yield AnalysisResult(**record["data"])
\ No newline at end of file
@@ -0,0 +1,156 @@
+# Файл: modules/image_analysis/local_analyzer.py
+"""
+Локален анализ на небето с NumPy/OpenCV
+
+Оценява облачността за милисекунди, без заявка към модела:
+    1. Небето се отделя от терена - горната част на кадъра, без пикселите с
+       висока текстура (сгради, дървета, антени).
+    2. Всеки пиксел от небето е облак или ясно небе според нормализираното
+       съотношение синьо/червено - ясното небе е наситено синьо, облаците са
+       бели или сиви.
+    3. Средната яркост показва нощ или твърде тъмен кадър.
+
+Резултатът е в същия формат като отговора на модела. Увереността е висока
+само за еднозначните случаи (нощ, ясно, плътна облачност) - всичко между
+тях се изпраща към модела.
+"""
+
+import time
+from typing import Any, Dict
+
+import cv2
+import numpy as np
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("local_sky_analyzer")
+
+# Праг на нормализираното съотношение (B - R) / (B + R) - под него пикселът е облак
+CLOUD_NBRR_THRESHOLD = 0.08
+# Праг на локалната текстура - над него пикселът не е небе
+TEXTURE_THRESHOLD = 12.0
+# Средна яркост на небето (0-255), под която кадърът е нощен
+NIGHT_BRIGHTNESS = 35.0
+# Минимален дял на небето в анализираната област
+MIN_SKY_FRACTION = 0.15
+
+
+def decode_image(image_data: bytes) -> np.ndarray:
+    """Декодира JPEG в намалена резолюция (1/4) - достатъчна за статистиките"""
+    array = np.frombuffer(image_data, dtype=np.uint8)
+    image = cv2.imdecode(array, cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None:
+        raise ValueError("Изображението не може да се декодира")
+    return image
+
+
+def segment_sky(image: np.ndarray, sky_ratio: float) -> np.ndarray:
+    """
+    Маска на небето в горната част на кадъра
+
+    Args:
+        image: BGR изображение
+        sky_ratio: Каква част от височината (отгоре) може да е небе
+
+    Returns:
+        np.ndarray: Булева маска с размера на горната част
+    """
+    height = max(1, int(image.shape[0] * sky_ratio))
+    gray = cv2.cvtColor(image[:height], cv2.COLOR_BGR2GRAY)
+
+    # Локална текстура - осреднена абсолютна стойност на лапласиана
+    texture = cv2.blur(np.abs(cv2.Laplacian(gray, cv2.CV_32F, ksize=3)), (9, 9))
+    return texture < TEXTURE_THRESHOLD
+
+
+def analyze_sky(image_data: bytes, sky_ratio: float = 0.6) -> Dict[str, Any]:
+    """
+    Анализира небето на изображението
+
+    Args:
+        image_data: JPEG байтове
+        sky_ratio: Каква част от височината на кадъра (отгоре) може да е небе
+
+    Returns:
+        Dict: Резултат във формата на модела (cloud_coverage, weather_conditions,
+              confidence...) плюс is_night и статистиките за небето
+    """
+    start_time = time.time()
+
+    image = decode_image(image_data)
+    sky_mask = segment_sky(image, sky_ratio)
+    region = image[:sky_mask.shape[0]].astype(np.float32)
+    blue, green, red = region[..., 0], region[..., 1], region[..., 2]
+
+    sky_fraction = float(sky_mask.mean())
+    brightness = cv2.cvtColor(image[:sky_mask.shape[0]], cv2.COLOR_BGR2GRAY).astype(np.float32)
+    sky_brightness = brightness[sky_mask] if sky_fraction > 0 else brightness.ravel()
+    mean_brightness = float(sky_brightness.mean())
+    brightness_std = float(sky_brightness.std())
+
+    result: Dict[str, Any] = {
+        "sky_fraction": round(sky_fraction, 3),
+        "mean_brightness": round(mean_brightness, 1),
+        "brightness_std": round(brightness_std, 1),
+        "is_night": mean_brightness < NIGHT_BRIGHTNESS,
+        "cloud_type": "",
+        "visibility": "",
+        "is_sunny": False
+    }
+
+    if result["is_night"]:
+        # При тъмен кадър облачността не може да се определи, но решението е сигурно
+        result.update({
+            "cloud_coverage": 0.0,
+            "weather_conditions": "Твърде тъмно за анализ (нощ)",
+            "confidence": 95.0 if mean_brightness < NIGHT_BRIGHTNESS * 0.7 else 80.0
+        })
+    elif sky_fraction < MIN_SKY_FRACTION:
+        result.update({
+            "cloud_coverage": 0.0,
+            "weather_conditions": "Небето не се вижда достатъчно в кадъра",
+            "confidence": 0.0
+        })
+    else:
+        # Нормализирано съотношение синьо/червено за всеки пиксел от небето
+        nbrr = (blue - red) / np.maximum(blue + red, 1.0)
+        sky_nbrr = nbrr[sky_mask]
+        cloud_coverage = float((sky_nbrr < CLOUD_NBRR_THRESHOLD).mean() * 100)
+        mean_nbrr = float(sky_nbrr.mean())
+        saturation_proxy = float((np.max(region, axis=2) - np.min(region, axis=2))[sky_mask].mean())
+
+        result.update({
+            "cloud_coverage": round(cloud_coverage, 1),
+            "mean_nbrr": round(mean_nbrr, 3),
+            "mean_saturation": round(saturation_proxy, 1)
+        })
+
+        if cloud_coverage >= 95 and saturation_proxy < 20:
+            # Еднородно сиво/бяло небе - плътна облачност
+            result.update({
+                "cloud_type": "стратус",
+                "weather_conditions": "Плътна облачност",
+                "confidence": 85.0 if brightness_std < 25 else 70.0
+            })
+        elif cloud_coverage <= 5 and mean_nbrr > CLOUD_NBRR_THRESHOLD * 2:
+            result.update({
+                "visibility": "добра",
+                "weather_conditions": "Ясно небе",
+                "is_sunny": mean_brightness > 120,
+                "confidence": 85.0
+            })
+        else:
+            # Разкъсана облачност - типът на облаците се определя само от модела
+            distance = min(abs(cloud_coverage - 50) / 50, 1.0)
+            result.update({
+                "weather_conditions": f"Частична облачност (~{cloud_coverage:.0f}%)",
+                "confidence": round(30 + 30 * distance, 1)
+            })
+
+    result["analysis_time"] = time.time() - start_time
+    result["full_analysis"] = (
+        f"Локален анализ: небе {result['sky_fraction'] * 100:.0f}% от областта, "
+        f"яркост {result['mean_brightness']}, облачност {result['cloud_coverage']}%"
+    )
+    return result
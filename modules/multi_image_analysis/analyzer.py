@@ -6,8 +6,6 @@
 import os
 import json
 import time
-import threading
-import httpx
 from datetime import datetime
 from io import BytesIO
 from PIL import Image
@@ -20,16 +18,56 @@ from .config import (
     update_analysis_config, 
     add_analysis_result,
     MultiAnalysisResult,
-    PositionAnalysisResult
+    PositionAnalysisResult,
+    SCHEDULER_JOB
 )
-from modules.ptz_capture.config import get_capture_config as get_ptz_capture_config
+from modules.ptz_capture.config import get_capture_config as get_ptz_capture_config, SCHEDULER_JOB as PTZ_CAPTURE_JOB
 from utils.logger import setup_logger
+from utils.scheduler import get_scheduler, IntervalTrigger
+from utils.http_client import get_http_client, UploadTimer
+from utils.image_preprocess import preprocess_image, estimate_upload_time_saved
+from utils.result_cache import AnalysisResultCache, compute_image_hashes
+from utils.anthropic_api import cached_system_prompt, extract_json_object, extract_usage, record_usage, get_usage_stats, post_message
+from utils.rate_limiter import CircuitOpenError
+from utils.executors import run_io, run_cpu, read_file
 
 # Инициализиране на логър
 logger = setup_logger("multi_image_analyzer")
 
-# Глобални променливи
-analysis_thread = None
+# Кеш на резултатите по съдържание на кадъра (отделно за всяка позиция)
+_result_cache = AnalysisResultCache(
+    "multi_image_analysis",
+    similar_max_age=get_analysis_config().analysis_interval
+)
+
+# Статичните инструкции към модела - изпращат се като кеширан system блок,
+# а посоката на камерата е в съобщението
+SYSTEM_PROMPT = """
+Ти си експерт метеоролог, който анализира изображения от камери. Анализирай предоставеното изображение и дай детайлна информация за:
+
+1. Процент облачност (0-100%)
+2. Тип на облаците (ако има такива)
+3. Видимост (отлична, добра, умерена, лоша)
+4. Общо описание на метеорологичните условия в момента
+5. Отговори на български език
+6. Анализите между 21:00 и 06:00 българско време ги отбелязвай като: Анализа се извършва в тъмната част на деня!
+
+Отговори в следния JSON формат:
+{
+  "cloud_coverage": [число от 0 до 100],
+  "cloud_type": "[тип на облаците, например: кумулус, стратус, нимбостратус и т.н.]",
+  "visibility": "[отлична/добра/умерена/лоша]",
+  "weather_conditions": "[кратко описание на метеорологичните условия]",
+  "is_sunny": [true/false - има ли слънце на изображението],
+  "confidence": [число от 0 до 100, показващо твоята увереност в анализа]
+}
+
+Бъди възможно най-точен и прецизен. Базирай се САМО на това, което виждаш на изображението, без да правиш предположения извън видимото съдържание.
+
+Ако изображението е твърде тъмно, замъглено или по друг начин неясно, отбележи това в полето "weather_conditions" и намали стойността на "confidence".
+
+Отговори САМО с JSON обект без допълнителен текст или обяснения.
+"""
 
 def get_anthropic_api_key() -> Optional[str]:
     """
@@ -50,8 +88,7 @@ async def download_image(path: str) -> Optional[bytes]:
             return None
         
         # Четем файла
-        with open(path, "rb") as f:
-            image_data = f.read()
+        image_data = await read_file(path)
         
         logger.info(f"Успешно прочетено изображение от {path}, размер: {len(image_data)} bytes")
         
@@ -71,6 +108,37 @@ def encode_image_base64(image_data: bytes) -> str:
     """Кодира изображението в base64"""
     return base64.b64encode(image_data).decode('utf-8')
 
+def get_position_direction(position_id: int) -> str:
+    """Връща посоката, в която гледа камерата на дадена позиция"""
+    if position_id == 1:
+        return "изток"
+    elif position_id == 2:
+        return "запад"
+    elif position_id == 3:
+        return "север"
+    elif position_id == 4:
+        return "юг"
+    return f"позиция {position_id}"
+
+async def prepare_upload_image(image_data: bytes) -> Tuple[bytes, Optional[Dict[str, Any]]]:
+    """
+    Намалява и прекодира изображението преди изпращане (ако е включено)
+    
+    Returns:
+        (байтове за изпращане, статистика или None) tuple
+    """
+    config = get_analysis_config()
+    if not config.preprocess_images:
+        return image_data, None
+    
+    return await run_cpu(
+        preprocess_image,
+        image_data,
+        max_edge=config.max_image_edge,
+        jpeg_quality=config.upload_jpeg_quality,
+        sky_crop_ratio=config.sky_crop_ratio
+    )
+
 async def analyze_image_with_anthropic(image_data: bytes, position_id: int) -> Tuple[bool, Dict[str, Any]]:
     """
     Анализира изображение с помощта на Anthropic API
@@ -89,6 +157,9 @@ async def analyze_image_with_anthropic(image_data: bytes, position_id: int) -> T
         return False, {"error": "Липсва Anthropic API ключ"}
     
     try:
+        # Намаляваме и прекодираме изображението преди изпращане
+        image_data, preprocessing = await prepare_upload_image(image_data)
+        
         # Кодираме изображението в base64
         base64_image = encode_image_base64(image_data)
         
@@ -100,55 +171,17 @@ async def analyze_image_with_anthropic(image_data: bytes, position_id: int) -> T
         }
         
         # Определяме посоката според позицията
-        direction = ""
-        if position_id == 1:
-            direction = "изток"
-        elif position_id == 2:
-            direction = "запад"
-        elif position_id == 3:
-            direction = "север"
-        elif position_id == 4:
-            direction = "юг"
-        else:
-            direction = f"позиция {position_id}"
-        
-        # Изграждаме съобщение за Claude
-        prompt = f"""
-        Ти си експерт метеоролог, който анализира изображения от камери. Анализирай предоставеното изображение, 
-        което е направено в посока {direction.upper()} и дай детайлна информация за:
-        
-        1. Процент облачност (0-100%)
-        2. Тип на облаците (ако има такива)
-        3. Видимост (отлична, добра, умерена, лоша)
-        4. Общо описание на метеорологичните условия в момента
-        5. Отговори на български език
-        6. Анализите между 21:00 и 06:00 българско време ги отбелязвай като: Анализа се извършва в тъмната част на деня!
-        
-        Отговори в следния JSON формат:
-        {{
-          "cloud_coverage": [число от 0 до 100],
-          "cloud_type": "[тип на облаците, например: кумулус, стратус, нимбостратус и т.н.]",
-          "visibility": "[отлична/добра/умерена/лоша]",
-          "weather_conditions": "[кратко описание на метеорологичните условия]",
-          "is_sunny": [true/false - има ли слънце на изображението],
-          "confidence": [число от 0 до 100, показващо твоята увереност в анализа]
-        }}
-        
-        Бъди възможно най-точен и прецизен. Базирай се САМО на това, което виждаш на изображението, без да правиш предположения извън видимото съдържание.
-        
-        Ако изображението е твърде тъмно, замъглено или по друг начин неясно, отбележи това в полето "weather_conditions" и намали стойността на "confidence".
-        
-        Отговори САМО с JSON обект без допълнителен текст или обяснения.
-        """
+        direction = get_position_direction(position_id)
         
         # Създаваме payload за заявката
         payload = {
             "model": config.anthropic_model,
+            "system": cached_system_prompt(SYSTEM_PROMPT),
             "messages": [
                 {
                     "role": "user", 
                     "content": [
-                        {"type": "text", "text": prompt},
+                        {"type": "text", "text": f"Изображението е направено в посока {direction.upper()}."},
                         {
                             "type": "image", 
                             "source": {
@@ -168,67 +201,328 @@ async def analyze_image_with_anthropic(image_data: bytes, position_id: int) -> T
         start_time = time.time()
         
         # Изпращаме заявката
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                config.anthropic_api_url, 
-                json=payload,
-                headers=headers,
-                timeout=60.0
+        client = get_http_client()
+        upload_timer = UploadTimer()
+        response = await post_message(
+            client,
+            config.anthropic_api_url,
+            "multi_image_analysis",
+            json=payload,
+            headers=headers,
+            timeout=60.0,
+            extensions={"trace": upload_timer}
+        )
+        
+        elapsed_time = time.time() - start_time
+        logger.info(f"Получен отговор от Anthropic API за позиция {position_id} за {elapsed_time:.2f} секунди")
+        
+        if preprocessing is not None:
+            estimate_upload_time_saved(
+                preprocessing,
+                upload_timer.elapsed,
+                int(response.request.headers.get("content-length", 0))
             )
+        
+        if response.status_code != 200:
+            logger.error(f"Грешка от Anthropic API: {response.status_code} - {response.text}")
+            return False, {
+                "error": f"Грешка от Anthropic API: {response.status_code}",
+                "details": response.text
+            }
+        
+        # Обработваме отговора
+        result = response.json()
+        usage = extract_usage(result)
+        record_usage("multi_image_analysis", usage)
+        
+        # Извличаме текстовия отговор
+        if "content" in result and len(result["content"]) > 0:
+            content = result["content"][0].get("text", "")
+            
+            # Извличаме JSON обекта от отговора
+            analysis_result = extract_json_object(content)
+            if analysis_result is None:
+                logger.error(f"Не е намерен валиден JSON в отговора за позиция {position_id}: {content}")
+                return False, {"error": "Не е намерен валиден JSON в отговора", "raw_response": content}
             
-            elapsed_time = time.time() - start_time
-            logger.info(f"Получен отговор от Anthropic API за позиция {position_id} за {elapsed_time:.2f} секунди")
+            # Добавяме метаданни
+            analysis_result["analysis_time"] = elapsed_time
+            analysis_result["full_analysis"] = content
+            analysis_result["preprocessing"] = preprocessing
+            analysis_result["usage"] = usage
             
-            if response.status_code != 200:
-                logger.error(f"Грешка от Anthropic API: {response.status_code} - {response.text}")
-                return False, {
-                    "error": f"Грешка от Anthropic API: {response.status_code}",
-                    "details": response.text
+            logger.info(f"Успешен анализ за позиция {position_id}: {analysis_result}")
+            return True, analysis_result
+        else:
+            logger.error(f"Празен отговор от Anthropic API за позиция {position_id}")
+            return False, {"error": "Празен отговор от Anthropic API", "raw_response": result}
+    
+    except CircuitOpenError as e:
+        logger.warning(str(e))
+        return False, {"error": str(e)}
+    
+    except Exception as e:
+        logger.error(f"Неочаквана грешка при анализ на изображението за позиция {position_id}: {e}")
+        return False, {"error": f"Неочаквана грешка: {e}"}
+
+def apply_position_analysis(
+    result: PositionAnalysisResult,
+    analysis: Dict[str, Any],
+    cache_hit: Optional[str] = None
+) -> PositionAnalysisResult:
+    """Попълва резултата за позиция с данните от анализа"""
+    result.cloud_coverage = float(analysis.get("cloud_coverage", 0))
+    result.cloud_type = analysis.get("cloud_type", "")
+    result.weather_conditions = analysis.get("weather_conditions", "")
+    result.confidence = float(analysis.get("confidence", 0))
+    result.analysis_time = float(analysis.get("analysis_time", 0))
+    result.full_analysis = analysis.get("full_analysis", "")
+    result.raw_response = analysis
+    result.cache_hit = cache_hit
+    return result
+
+async def analyze_images_combined_with_anthropic(images: Dict[int, bytes]) -> Tuple[bool, Dict[int, Dict[str, Any]]]:
+    """
+    Анализира изображенията от няколко позиции с една заявка към Anthropic API
+    
+    Всяко изображение е предшествано от етикет с позицията и посоката, а
+    моделът връща JSON масив с по един обект за всяка позиция.
+    
+    Args:
+        images: Байтове на изображенията по позиции
+    
+    Returns:
+        (успех, резултати по позиции) tuple - при неуспех речник с ключ "error"
+    """
+    config = get_analysis_config()
+    api_key = get_anthropic_api_key()
+    
+    if not api_key:
+        return False, {"error": "Липсва Anthropic API ключ"}
+    
+    try:
+        # Подготвяме изображенията паралелно
+        position_ids = list(images.keys())
+        prepared = await asyncio.gather(*[prepare_upload_image(images[pid]) for pid in position_ids])
+        
+        headers = {
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+        
+        labels = ", ".join(
+            f"позиция {pid} ({get_position_direction(pid).upper()})" for pid in position_ids
+        )
+        prompt = f"""
+        Получаваш {len(position_ids)} изображения, направени от една и съща точка в различни посоки: {labels}.
+        Преди всяко изображение има етикет с позицията и посоката. Анализирай всяко изображение поотделно.
+        
+        Вместо един JSON обект, отговори с JSON масив с по един обект за всяко изображение. Всеки обект е в
+        описания формат и съдържа допълнително "position_id" (номерът на позицията от етикета) и "direction"
+        (посоката от етикета).
+        
+        Отговори САМО с JSON масива без допълнителен текст или обяснения.
+        """
+        
+        content_blocks = [{"type": "text", "text": prompt}]
+        for pid, (image_data, _) in zip(position_ids, prepared):
+            content_blocks.append({
+                "type": "text",
+                "text": f"Позиция {pid} - посока {get_position_direction(pid).upper()}:"
+            })
+            content_blocks.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/jpeg",
+                    "data": encode_image_base64(image_data)
                 }
+            })
+        
+        payload = {
+            "model": config.anthropic_model,
+            "system": cached_system_prompt(SYSTEM_PROMPT),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": content_blocks
+                }
+            ],
+            "max_tokens": config.combined_max_tokens,
+            "temperature": config.temperature
+        }
+        
+        logger.info(f"Изпращане на обща заявка към Anthropic API с модел {config.anthropic_model} за позиции {position_ids}")
+        start_time = time.time()
+        
+        client = get_http_client()
+        upload_timer = UploadTimer()
+        response = await post_message(
+            client,
+            config.anthropic_api_url,
+            "multi_image_analysis",
+            json=payload,
+            headers=headers,
+            timeout=max(60.0, config.request_timeout),
+            extensions={"trace": upload_timer}
+        )
+        
+        elapsed_time = time.time() - start_time
+        logger.info(f"Получен отговор от Anthropic API за {len(position_ids)} позиции за {elapsed_time:.2f} секунди")
+        
+        payload_bytes = int(response.request.headers.get("content-length", 0))
+        for _, preprocessing in prepared:
+            if preprocessing is not None:
+                # Скоростта на качване е обща за заявката, затова оценката е по дял от payload-а
+                estimate_upload_time_saved(preprocessing, upload_timer.elapsed, payload_bytes)
+        
+        if response.status_code != 200:
+            logger.error(f"Грешка от Anthropic API: {response.status_code} - {response.text}")
+            return False, {
+                "error": f"Грешка от Anthropic API: {response.status_code}",
+                "details": response.text
+            }
+        
+        result = response.json()
+        usage = extract_usage(result)
+        record_usage("multi_image_analysis", usage)
+        
+        if "content" not in result or len(result["content"]) == 0:
+            logger.error("Празен отговор от Anthropic API за общата заявка")
+            return False, {"error": "Празен отговор от Anthropic API", "raw_response": result}
+        
+        content = result["content"][0].get("text", "")
+        
+        try:
+            # Намираме началото и края на JSON масива
+            start_idx = content.find('[')
+            end_idx = content.rfind(']') + 1
+            
+            if start_idx < 0 or end_idx <= start_idx:
+                logger.error(f"Не е намерен валиден JSON масив в отговора: {content}")
+                return False, {"error": "Не е намерен валиден JSON масив в отговора", "raw_response": content}
             
-            # Обработваме отговора
-            result = response.json()
+            items = json.loads(content[start_idx:end_idx])
+        except Exception as e:
+            logger.error(f"Грешка при обработка на JSON: {e}")
+            return False, {"error": f"Грешка при обработка на JSON: {e}", "raw_response": content}
+        
+        # Съпоставяме обектите с позициите - по position_id, иначе по реда в масива
+        analyses = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            try:
+                pid = int(item.get("position_id"))
+            except (TypeError, ValueError):
+                pid = position_ids[index] if index < len(position_ids) else None
+            if pid not in images:
+                continue
             
-            # Извличаме текстовия отговор
-            if "content" in result and len(result["content"]) > 0:
-                content = result["content"][0].get("text", "")
-                
-                # Опитваме се да извлечем JSON от отговора
-                try:
-                    # Намираме началото и края на JSON обекта
-                    start_idx = content.find('{')
-                    end_idx = content.rfind('}') + 1
-                    
-                    if start_idx >= 0 and end_idx > start_idx:
-                        json_str = content[start_idx:end_idx]
-                        analysis_result = json.loads(json_str)
-                        
-                        # Добавяме метаданни
-                        analysis_result["analysis_time"] = elapsed_time
-                        analysis_result["full_analysis"] = content
-                        
-                        logger.info(f"Успешен анализ за позиция {position_id}: {analysis_result}")
-                        return True, analysis_result
-                    else:
-                        logger.error(f"Не е намерен валиден JSON в отговора за позиция {position_id}: {content}")
-                        return False, {"error": "Не е намерен валиден JSON в отговора", "raw_response": content}
-                except Exception as e:
-                    logger.error(f"Грешка при обработка на JSON за позиция {position_id}: {e}")
-                    return False, {"error": f"Грешка при обработка на JSON: {e}", "raw_response": content}
-            else:
-                logger.error(f"Празен отговор от Anthropic API за позиция {position_id}")
-                return False, {"error": "Празен отговор от Anthropic API", "raw_response": result}
+            # Времето на общата заявка се разпределя по равно между позициите
+            item["analysis_time"] = elapsed_time / len(position_ids)
+            item["full_analysis"] = content
+            item["preprocessing"] = prepared[position_ids.index(pid)][1]
+            item["combined_request"] = True
+            item["usage"] = usage
+            analyses[pid] = item
+        
+        missing = [pid for pid in position_ids if pid not in analyses]
+        if missing:
+            logger.warning(f"Отговорът не съдържа резултат за позиции {missing}")
+        
+        logger.info(f"Успешен общ анализ за позиции {list(analyses.keys())}")
+        return bool(analyses), analyses
+    
+    except CircuitOpenError as e:
+        logger.warning(str(e))
+        return False, {"error": str(e)}
     
     except Exception as e:
-        logger.error(f"Неочаквана грешка при анализ на изображението за позиция {position_id}: {e}")
+        logger.error(f"Неочаквана грешка при общия анализ на изображенията: {e}")
         return False, {"error": f"Неочаквана грешка: {e}"}
 
-async def analyze_position(position_id: int) -> PositionAnalysisResult:
+async def analyze_positions_combined(position_ids: List[int], use_cache: bool = True) -> Dict[int, PositionAnalysisResult]:
+    """
+    Анализира всички позиции с една заявка към API
+    
+    Позициите с кеширан резултат не се изпращат. Позициите без изображение
+    или без резултат в отговора остават с празен резултат.
+    
+    Args:
+        position_ids: ID на позициите
+        use_cache: Използване на кеширани резултати за непроменени кадри
+    
+    Returns:
+        Dict с резултат за всяка от позициите
+    """
+    config = get_analysis_config()
+    ptz_config = get_ptz_capture_config()
+    
+    results = {
+        position_id: PositionAnalysisResult(position_id=position_id, timestamp=datetime.now())
+        for position_id in position_ids
+    }
+    
+    images = {}
+    hashes = {}
+    for position_id in position_ids:
+        image_path = os.path.join(ptz_config.save_dir, f"position_{position_id}", "latest.jpg")
+        image_data = await download_image(image_path)
+        if not image_data:
+            results[position_id].weather_conditions = f"Няма налично изображение за позиция {position_id}"
+            continue
+        
+        scope = f"{config.anthropic_model}_position_{position_id}"
+        digest, phash = await run_cpu(compute_image_hashes, image_data, _result_cache.sky_ratio)
+        hashes[position_id] = (scope, digest, phash)
+        
+        if use_cache and config.use_result_cache:
+            cached, cache_hit = await run_io(_result_cache.lookup, scope, digest, phash)
+            if cached is not None:
+                apply_position_analysis(results[position_id], dict(cached, analysis_time=0.0), cache_hit)
+                continue
+        
+        images[position_id] = image_data
+    
+    if not images:
+        return results
+    
+    try:
+        success, analyses = await asyncio.wait_for(
+            analyze_images_combined_with_anthropic(images),
+            config.request_timeout
+        )
+    except asyncio.TimeoutError:
+        success, analyses = False, {"error": f"Изтекло време ({config.request_timeout} секунди)"}
+    
+    if not success:
+        error = analyses.get("error", "Unknown error")
+        logger.error(f"Грешка при общия анализ на изображенията: {error}")
+        for position_id in images:
+            results[position_id].weather_conditions = f"Грешка при анализ за позиция {position_id}: {error}"
+        return results
+    
+    for position_id in images:
+        analysis = analyses.get(position_id)
+        if analysis is None:
+            results[position_id].weather_conditions = f"Няма резултат за позиция {position_id} в общия отговор"
+            continue
+        
+        apply_position_analysis(results[position_id], analysis)
+        scope, digest, phash = hashes[position_id]
+        await run_io(_result_cache.put, scope, digest, phash, analysis)
+    
+    return results
+
+async def analyze_position(position_id: int, use_cache: bool = True) -> PositionAnalysisResult:
     """
     Анализира изображение от определена позиция
     
     Args:
         position_id: ID на позицията
+        use_cache: Използване на кеширан резултат за непроменен кадър
     
     Returns:
         PositionAnalysisResult обект с резултата от анализа
@@ -259,8 +553,14 @@ async def analyze_position(position_id: int) -> PositionAnalysisResult:
             result.weather_conditions = f"Не може да се прочете изображението за позиция {position_id}"
             return result
         
-        # Анализираме изображението
-        success, analysis = await analyze_image_with_anthropic(image_data, position_id)
+        # Анализираме изображението, ако същият или почти същият кадър не е анализиран вече
+        config = get_analysis_config()
+        success, analysis, cache_hit = await _result_cache.analyze(
+            f"{config.anthropic_model}_position_{position_id}",
+            image_data,
+            lambda: analyze_image_with_anthropic(image_data, position_id),
+            use_cache=use_cache and config.use_result_cache
+        )
         
         if not success:
             logger.error(f"Грешка при анализ на изображението за позиция {position_id}: {analysis.get('error', 'Unknown error')}")
@@ -268,13 +568,7 @@ async def analyze_position(position_id: int) -> PositionAnalysisResult:
             return result
         
         # Обновяваме резултата с данните от анализа
-        result.cloud_coverage = float(analysis.get("cloud_coverage", 0))
-        result.cloud_type = analysis.get("cloud_type", "")
-        result.weather_conditions = analysis.get("weather_conditions", "")
-        result.confidence = float(analysis.get("confidence", 0))
-        result.analysis_time = float(analysis.get("analysis_time", 0))
-        result.full_analysis = analysis.get("full_analysis", "")
-        result.raw_response = analysis
+        apply_position_analysis(result, analysis, cache_hit)
         
         logger.info(f"Успешен анализ за позиция {position_id}: {result.weather_conditions} (облачност: {result.cloud_coverage}%)")
         
@@ -285,6 +579,42 @@ async def analyze_position(position_id: int) -> PositionAnalysisResult:
         result.weather_conditions = f"Неочаквана грешка: {str(e)}"
         return result
 
+async def analyze_position_limited(
+    position_id: int,
+    semaphore: asyncio.Semaphore,
+    timeout: float,
+    use_cache: bool = True
+) -> PositionAnalysisResult:
+    """
+    Анализира позиция с ограничение на едновременните заявки и timeout
+    
+    Args:
+        position_id: ID на позицията
+        semaphore: Общ семафор за всички позиции в анализа
+        timeout: Максимално време за анализ на позицията в секунди
+        use_cache: Използване на кеширан резултат за непроменен кадър
+    
+    Returns:
+        PositionAnalysisResult обект - при timeout или грешка с празни данни
+    """
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(analyze_position(position_id, use_cache), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Анализът за позиция {position_id} не завърши за {timeout} секунди")
+            return PositionAnalysisResult(
+                position_id=position_id,
+                timestamp=datetime.now(),
+                weather_conditions=f"Изтекло време за анализ на позиция {position_id}"
+            )
+        except Exception as e:
+            logger.error(f"Неочаквана грешка при анализ за позиция {position_id}: {e}")
+            return PositionAnalysisResult(
+                position_id=position_id,
+                timestamp=datetime.now(),
+                weather_conditions=f"Неочаквана грешка: {str(e)}"
+            )
+
 def calculate_overall_result(position_results: Dict[int, PositionAnalysisResult]) -> Dict[str, Any]:
     """
     Изчислява обобщения резултат от анализите на всички позиции
@@ -361,10 +691,13 @@ def calculate_overall_result(position_results: Dict[int, PositionAnalysisResult]
         "total_analysis_time": total_analysis_time
     }
 
-async def perform_multi_image_analysis() -> MultiAnalysisResult:
+async def perform_multi_image_analysis(use_cache: bool = True) -> MultiAnalysisResult:
     """
     Изпълнява целия процес на анализ на изображения от всички позиции
     
+    Args:
+        use_cache: Използване на кеширани резултати за непроменени кадри
+    
     Returns:
         MultiAnalysisResult обект с резултата от анализа
     """
@@ -384,15 +717,31 @@ async def perform_multi_image_analysis() -> MultiAnalysisResult:
             update_analysis_config(status="warning")
             return result
         
-        # Анализираме всяка позиция
-        position_results = {}
+        start_time = time.time()
+        position_ids = list(ptz_config.positions)
         
-        for position_id in ptz_config.positions:
-            position_result = await analyze_position(position_id)
-            position_results[position_id] = position_result
+        if config.analysis_mode == "combined":
+            # Всички позиции с една заявка
+            position_results = await analyze_positions_combined(position_ids, use_cache)
+        else:
+            # Анализираме всички позиции паралелно, с ограничен брой едновременни заявки
+            semaphore = asyncio.Semaphore(max(1, config.max_concurrent_requests))
+            position_results_list = await asyncio.gather(*[
+                analyze_position_limited(position_id, semaphore, config.request_timeout, use_cache)
+                for position_id in position_ids
+            ])
+            position_results = dict(zip(position_ids, position_results_list))
+        
+        # Речникът съдържа всички позиции - неуспешните са с празен резултат
+        failed_positions = [
+            position_id for position_id, position_result in position_results.items()
+            if position_result.raw_response is None
+        ]
         
         # Добавяме резултатите към общия резултат
         result.position_results = position_results
+        result.failed_positions = failed_positions
+        result.elapsed_time = time.time() - start_time
         
         # Изчисляваме обобщения резултат
         overall = calculate_overall_result(position_results)
@@ -404,9 +753,18 @@ async def perform_multi_image_analysis() -> MultiAnalysisResult:
         result.total_analysis_time = overall["total_analysis_time"]
         
         # Обновяваме статуса
-        update_analysis_config(status="ok")
+        if not failed_positions:
+            update_analysis_config(status="ok")
+        elif len(failed_positions) < len(position_ids):
+            update_analysis_config(status="partial")
+            logger.warning(f"Мулти-анализът е частичен, неуспешни позиции: {failed_positions}")
+        else:
+            update_analysis_config(status="error")
         
-        logger.info(f"Успешен мулти-анализ: {result.overall_weather_conditions} (средна облачност: {result.avg_cloud_coverage}%)")
+        logger.info(
+            f"Мулти-анализ за {result.elapsed_time:.2f} секунди: {result.overall_weather_conditions} "
+            f"(средна облачност: {result.avg_cloud_coverage}%)"
+        )
         
         return result
     
@@ -416,69 +774,38 @@ async def perform_multi_image_analysis() -> MultiAnalysisResult:
         update_analysis_config(status="error")
         return result
 
-def run_async_analysis():
-    """Изпълнява асинхронен анализ в синхронен контекст"""
-    try:
-        return asyncio.run(perform_multi_image_analysis())
-    except RuntimeError as e:
-        if "There is no current event loop in thread" in str(e):
-            # Създаваме нов event loop и го използваме
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(perform_multi_image_analysis())
-            finally:
-                loop.close()
-        else:
-            # Ако е друга RuntimeError, вдигаме я нагоре
-            raise
-
-def analysis_loop():
-    """Основен цикъл за периодичен анализ на изображения"""
-    config = get_analysis_config()
+async def scheduled_analysis() -> bool:
+    """Периодичен анализ (задача в планировчика)"""
+    result = await perform_multi_image_analysis()
     
-    while config.running:
-        try:
-            # Изпълняваме анализ
-            result = run_async_analysis()
-            
-            # Добавяме резултата в историята
-            add_analysis_result(result)
-            
-        except Exception as e:
-            logger.error(f"Неочаквана грешка в analysis_loop: {e}")
-        
-        # Обновяваме конфигурацията (за случай, че е променена)
-        config = get_analysis_config()
-        
-        # Спим до следващия анализ
-        time.sleep(config.analysis_interval)
+    # Добавяме резултата в историята (запис в SQLite - извън event loop-а)
+    await run_io(add_analysis_result, result)
+    return get_analysis_config().status in ("ok", "partial")
 
-def start_analysis_thread():
-    """Стартира фонов процес за анализ на изображения"""
-    global analysis_thread
-    
-    if analysis_thread is None or not analysis_thread.is_alive():
-        analysis_thread = threading.Thread(target=analysis_loop)
-        analysis_thread.daemon = True
-        analysis_thread.start()
-        logger.info("Multi Image Analysis thread started")
-        return True
-    
-    return False
+def start_scheduled_analysis() -> bool:
+    """Пуска периодичния анализ (първият анализ е веднага)"""
+    update_analysis_config(running=True)
+    return get_scheduler().resume(SCHEDULER_JOB)
 
-def stop_analysis_thread():
-    """Спира фоновия процес за анализ на изображения"""
+def stop_scheduled_analysis() -> bool:
+    """Спира периодичния анализ и отменя анализа в ход"""
     update_analysis_config(running=False)
-    logger.info("Multi Image Analysis thread stopping")
-    return True
+    return get_scheduler().pause(SCHEDULER_JOB, cancel=True)
 
 async def analyze_images_now() -> MultiAnalysisResult:
     """Принудително изпълнява анализ на изображения веднага"""
-    result = await perform_multi_image_analysis()
-    add_analysis_result(result)
+    result = await perform_multi_image_analysis(use_cache=False)
+    await run_io(add_analysis_result, result)
     return result
 
+def get_result_cache_status() -> Dict[str, Any]:
+    """Връща информация за кеша на резултатите"""
+    return _result_cache.get_status()
+
+def get_token_usage() -> Dict[str, Any]:
+    """Връща натрупаната статистика за използваните токени"""
+    return get_usage_stats("multi_image_analysis")
+
 # Функция за инициализиране на модула
 def initialize():
     """Инициализира модула"""
@@ -493,8 +820,19 @@ def initialize():
     ptz_config = get_ptz_capture_config()
     logger.info(f"Модулът ще анализира изображения от: {ptz_config.save_dir}")
     
-    # Стартираме thread за анализ
-    start_analysis_thread()
+    # Периодичният анализ е задача в общия планировчик (през нощта се пропуска).
+    # Освен по интервала, анализът тръгва веднага след всеки успешен цикъл на
+    # PTZ прихващането - без да се чака кадрите да "остареят"
+    config = get_analysis_config()
+    scheduler = get_scheduler()
+    scheduler.add_job(
+        SCHEDULER_JOB,
+        scheduled_analysis,
+        IntervalTrigger(lambda: get_analysis_config().analysis_interval, daylight=True),
+        daylight=True,
+        paused=not config.running
+    )
+    scheduler.chain(PTZ_CAPTURE_JOB, SCHEDULER_JOB)
     logger.info("Multi Image Analysis модул инициализиран успешно")
     return True
 
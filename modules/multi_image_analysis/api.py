@@ -4,15 +4,27 @@ API маршрути за Multi Image Analysis модул
 """
 
 import os
+import json
 import time
+from datetime import datetime
 from fastapi import APIRouter, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from typing import Optional, List, Dict
 
-from .config import get_analysis_config, update_analysis_config, get_analysis_history
-from .analyzer import analyze_images_now, start_analysis_thread, stop_analysis_thread
+from .config import (
+    get_analysis_config,
+    update_analysis_config,
+    get_analysis_history,
+    get_history_page,
+    get_position_history_page,
+    stream_history
+)
+from .analyzer import analyze_images_now, start_scheduled_analysis, stop_scheduled_analysis, get_result_cache_status, get_token_usage
+from .batch import start_batch_job, cancel_batch_job, get_batch_job, get_batch_jobs
 from utils.logger import setup_logger
+from utils.executors import run_io
+from utils.anthropic_api import get_rate_limit_status
 
 # Инициализиране на логър
 logger = setup_logger("multi_image_analysis_api")
@@ -28,7 +40,7 @@ templates = Jinja2Templates(directory=templates_dir)
 async def multi_analysis_index(request: Request):
     """Страница за Multi Image Analysis модула"""
     config = get_analysis_config()
-    history = get_analysis_history(5)  # Последните 5 анализа
+    history = await run_io(get_analysis_history, 5)  # Последните 5 анализа
     
     # Подготвяме позициите за показване
     from modules.ptz_capture.config import get_capture_config as get_ptz_config
@@ -42,7 +54,12 @@ async def multi_analysis_index(request: Request):
         "timestamp": int(time.time()),
         "last_update": config.last_analysis_time.strftime("%H:%M:%S") if config.last_analysis_time else "Няма",
         "status": config.status,
-        "status_text": "OK" if config.status == "ok" else "Грешка" if config.status == "error" else "Инициализация",
+        "status_text": (
+            "OK" if config.status == "ok"
+            else "Частично" if config.status == "partial"
+            else "Грешка" if config.status == "error"
+            else "Инициализация"
+        ),
         "has_api_key": bool(os.getenv("ANTHROPIC_API_KEY")),
         "positions": positions
     })
@@ -66,7 +83,8 @@ async def latest_analysis():
             "cloud_type": result.cloud_type,
             "weather_conditions": result.weather_conditions,
             "confidence": result.confidence,
-            "timestamp": result.timestamp.isoformat() if result.timestamp else None
+            "timestamp": result.timestamp.isoformat() if result.timestamp else None,
+            "cache_hit": result.cache_hit
         }
     
     # Форматиране на отговора с по-четима структура
@@ -80,45 +98,103 @@ async def latest_analysis():
         "position_results": position_results
     })
 
+@router.get("/cache")
+async def result_cache_status():
+    """Връща информация за кеша на резултатите"""
+    return JSONResponse({
+        "status": "ok",
+        "enabled": get_analysis_config().use_result_cache,
+        "cache": get_result_cache_status(),
+        "token_usage": get_token_usage(),
+        "rate_limit": get_rate_limit_status()
+    })
+
+def format_position_result(result) -> dict:
+    """Форматира резултата за една позиция от историята"""
+    return {
+        "cloud_coverage": result.cloud_coverage,
+        "cloud_type": result.cloud_type,
+        "weather_conditions": result.weather_conditions,
+        "confidence": result.confidence
+    }
+
+def format_history_item(item) -> dict:
+    """Форматира обобщен резултат от историята за JSON отговор"""
+    return {
+        "timestamp": item.timestamp.isoformat() if item.timestamp else None,
+        "avg_cloud_coverage": item.avg_cloud_coverage,
+        "overall_weather_conditions": item.overall_weather_conditions,
+        "sunny": item.sunny,
+        "total_analysis_time": item.total_analysis_time,
+        "position_results": {
+            str(pos_id): format_position_result(result)
+            for pos_id, result in item.position_results.items()
+        }
+    }
+
+def format_position_history_item(item) -> dict:
+    """Форматира резултат за позиция от историята на позицията"""
+    return {
+        "timestamp": item.timestamp.isoformat() if item.timestamp else None,
+        "position_id": item.position_id,
+        **format_position_result(item)
+    }
+
 @router.get("/history")
-async def analysis_history(limit: Optional[int] = 10):
-    """Връща историята на анализите"""
-    history = get_analysis_history(limit)
+async def analysis_history(
+    limit: Optional[int] = 10,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    position: Optional[int] = None
+):
+    """
+    Връща страница от историята на анализите
     
-    if not history:
+    Последните limit резултата за периода [start, end) в хронологичен ред -
+    обобщените резултати или, с position, резултатите за една позиция.
+    next_cursor се подава като cursor за по-старите резултати.
+    """
+    try:
+        if position is not None:
+            history, next_cursor = await run_io(
+                get_position_history_page, position, limit or 10, start, end, cursor
+            )
+            items = [format_position_history_item(item) for item in history]
+        else:
+            history, next_cursor = await run_io(get_history_page, limit or 10, start, end, cursor)
+            items = [format_history_item(item) for item in history]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not items and not cursor:
         return JSONResponse({
             "status": "no_history",
             "message": "Няма налична история на анализите"
         }, status_code=404)
     
-    # Форматиране на отговора
-    history_list = []
-    for item in history:
-        # Подготвяме резултатите по позиции
-        position_results = {}
-        for pos_id, result in item.position_results.items():
-            position_results[str(pos_id)] = {
-                "cloud_coverage": result.cloud_coverage,
-                "cloud_type": result.cloud_type,
-                "weather_conditions": result.weather_conditions,
-                "confidence": result.confidence
-            }
-        
-        history_list.append({
-            "timestamp": item.timestamp.isoformat() if item.timestamp else None,
-            "avg_cloud_coverage": item.avg_cloud_coverage,
-            "overall_weather_conditions": item.overall_weather_conditions,
-            "sunny": item.sunny,
-            "total_analysis_time": item.total_analysis_time,
-            "position_results": position_results
-        })
-    
     return JSONResponse({
         "status": "ok",
-        "count": len(history_list),
-        "history": history_list
+        "count": len(items),
+        "history": items,
+        "next_cursor": next_cursor
     })
 
+@router.get("/history/stream")
+async def analysis_history_stream(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    position: Optional[int] = None
+):
+    """Всички резултати за периода като NDJSON (по един JSON обект на ред)"""
+    formatter = format_position_history_item if position is not None else format_history_item
+    
+    def generate():
+        for item in stream_history(start, end, position):
+            yield json.dumps(formatter(item), ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.get("/analyze")
 async def api_analyze():
     """Принудително извършване на нов анализ"""
@@ -157,11 +233,17 @@ async def update_config(
     analysis_interval: int = Form(None),
     anthropic_model: str = Form(None),
     max_tokens: int = Form(None),
-    temperature: float = Form(None)
+    temperature: float = Form(None),
+    analysis_mode: str = Form(None)
 ):
     """Обновява конфигурацията на Multi Image Analysis модула"""
     update_params = {}
     
+    if analysis_mode is not None:
+        if analysis_mode not in ("per_position", "combined"):
+            raise HTTPException(status_code=400, detail="analysis_mode трябва да е per_position или combined")
+        update_params["analysis_mode"] = analysis_mode
+    
     if analysis_interval is not None:
         update_params["analysis_interval"] = analysis_interval
     
@@ -184,38 +266,100 @@ async def update_config(
             "analysis_interval": updated_config.analysis_interval,
             "anthropic_model": updated_config.anthropic_model,
             "max_tokens": updated_config.max_tokens,
-            "temperature": updated_config.temperature
+            "temperature": updated_config.temperature,
+            "analysis_mode": updated_config.analysis_mode
         }
     })
 
 @router.get("/start")
 async def start_analysis():
     """Стартира процеса за анализ на изображения"""
-    success = start_analysis_thread()
+    success = start_scheduled_analysis()
     
     if success:
         return JSONResponse({
             "status": "ok",
-            "message": "Analysis thread started successfully"
+            "message": "Analysis job started successfully"
         })
     else:
         return JSONResponse({
             "status": "warning",
-            "message": "Analysis thread is already running"
+            "message": "Analysis job is already running"
         })
 
 @router.get("/stop")
 async def stop_analysis():
     """Спира процеса за анализ на изображения"""
-    success = stop_analysis_thread()
+    success = stop_scheduled_analysis()
     
     if success:
         return JSONResponse({
             "status": "ok",
-            "message": "Analysis thread stopping"
+            "message": "Analysis job stopped"
         })
     else:
         return JSONResponse({
-            "status": "error",
-            "message": "Failed to stop analysis thread"
-        }, status_code=500)
\ No newline at end of file
+            "status": "warning",
+            "message": "Analysis job is already stopped"
+        })
+
+@router.post("/batch")
+async def create_batch_job(
+    date: str = Form(...),
+    positions: str = Form(None)
+):
+    """
+    Стартира пакетен анализ на архивните кадри за даден ден
+    
+    Args:
+        date: Ден във формат YYYYMMDD
+        positions: Позиции, разделени със запетая (по подразбиране всички)
+    """
+    try:
+        position_ids = [int(p) for p in positions.split(",") if p.strip()] if positions else None
+        job = start_batch_job(date, position_ids)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Невалидна дата (YYYYMMDD) или позиции")
+    
+    return JSONResponse({
+        "status": "ok",
+        "message": f"Пакетният анализ за {date} е стартиран",
+        "job": job.model_dump(mode="json")
+    })
+
+@router.get("/batch")
+async def list_batch_jobs():
+    """Връща всички задачи за пакетен анализ"""
+    return JSONResponse({
+        "status": "ok",
+        "jobs": [job.model_dump(mode="json") for job in get_batch_jobs()]
+    })
+
+@router.get("/batch/{job_id}")
+async def batch_job_status(job_id: str):
+    """Връща състоянието на задача за пакетен анализ"""
+    job = get_batch_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задачата не е намерена")
+    
+    return JSONResponse({
+        "status": "ok",
+        "job": job.model_dump(mode="json")
+    })
+
+@router.delete("/batch/{job_id}")
+async def delete_batch_job(job_id: str):
+    """Отменя задача за пакетен анализ"""
+    if get_batch_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Задачата не е намерена")
+    
+    if not cancel_batch_job(job_id):
+        return JSONResponse({
+            "status": "warning",
+            "message": "Задачата вече е завършила"
+        })
+    
+    return JSONResponse({
+        "status": "ok",
+        "message": "Задачата е отменена"
+    })
@@ -0,0 +1,384 @@
+# Файл: modules/multi_image_analysis/batch.py
+"""
+Пакетен анализ на архивни PTZ кадри чрез Anthropic Message Batches API
+
+Кадрите за даден ден (ptz_frames/position_N/position_N_YYYYMMDD_HHMMSS.jpg) се
+изпращат на пакети вместо с по една интерактивна заявка. Пакетите се
+обработват асинхронно от API-то (на половин цена), модулът периодично проверява
+състоянието им, а резултатите се групират по цикли на прихващане и се записват
+в историята на анализите.
+
+За локални тестове ANTHROPIC_BATCHES_URL може да сочи към batch_stub.py.
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import concurrent.futures
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import (
+    get_analysis_config,
+    add_history_results,
+    BatchJob,
+    PositionAnalysisResult,
+    MultiAnalysisResult
+)
+from .analyzer import (
+    SYSTEM_PROMPT,
+    get_anthropic_api_key,
+    get_position_direction,
+    prepare_upload_image,
+    encode_image_base64,
+    apply_position_analysis,
+    calculate_overall_result
+)
+from modules.ptz_capture.config import get_capture_config as get_ptz_capture_config
+from utils.logger import setup_logger
+from utils.helpers import submit_coroutine
+from utils.http_client import get_http_client
+from utils.anthropic_api import cached_system_prompt, extract_json_object, extract_usage
+from utils.frame_catalog import get_frame_catalog
+from utils.executors import run_io, read_file
+
+# Инициализиране на логър
+logger = setup_logger("multi_image_batch")
+
+# Задачите и техните futures (в контролния loop)
+_jobs: Dict[str, BatchJob] = {}
+_job_futures: Dict[str, concurrent.futures.Future] = {}
+
+
+def list_archived_frames(date: str, positions: Optional[List[int]] = None) -> List[Tuple[int, str, datetime]]:
+    """
+    Намира архивните кадри за даден ден
+
+    Args:
+        date: Ден във формат YYYYMMDD
+        positions: Позиции (None - всички конфигурирани)
+
+    Returns:
+        List: (позиция, път, време на прихващане), подредени по време
+    """
+    ptz_config = get_ptz_capture_config()
+    positions = positions or list(ptz_config.positions)
+
+    # Заявка към каталога на кадрите вместо обхождане на директориите
+    start = datetime.strptime(date, "%Y%m%d")
+    frames = get_frame_catalog().between("ptz", start, start + timedelta(days=1), positions)
+    return [
+        (frame["position_id"], frame["path"], datetime.fromisoformat(frame["captured_at"]))
+        for frame in frames
+    ]
+
+
+def get_custom_id(path: str) -> str:
+    """ID на заявката в пакета - името на файла без разширението"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def get_batch_headers() -> Dict[str, str]:
+    """Заглавки за Message Batches API"""
+    return {
+        "x-api-key": get_anthropic_api_key() or "",
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+
+
+async def build_batch_request(position_id: int, path: str) -> Optional[Dict[str, Any]]:
+    """
+    Създава заявка за пакета за един кадър (същата като при интерактивния анализ)
+
+    Returns:
+        Optional[Dict]: Заявката или None, ако кадърът не може да се прочете
+    """
+    config = get_analysis_config()
+
+    try:
+        image_data = await read_file(path)
+        image_data, _ = await prepare_upload_image(image_data)
+    except Exception as e:
+        logger.error(f"Кадърът {path} не може да се прочете: {str(e)}")
+        return None
+
+    direction = get_position_direction(position_id)
+    return {
+        "custom_id": get_custom_id(path),
+        "params": {
+            "model": config.anthropic_model,
+            "system": cached_system_prompt(SYSTEM_PROMPT),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": f"Изображението е направено в посока {direction.upper()}."},
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/jpeg",
+                                "data": encode_image_base64(image_data)
+                            }
+                        }
+                    ]
+                }
+            ],
+            "max_tokens": config.max_tokens,
+            "temperature": config.temperature
+        }
+    }
+
+
+async def submit_batch(requests: List[Dict[str, Any]]) -> str:
+    """
+    Изпраща пакет със заявки
+
+    Returns:
+        str: ID на пакета
+    """
+    config = get_analysis_config()
+    response = await get_http_client().post(
+        config.anthropic_batches_url,
+        json={"requests": requests},
+        headers=get_batch_headers(),
+        timeout=300.0
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Грешка при изпращане на пакет: HTTP {response.status_code} - {response.text}")
+
+    return response.json()["id"]
+
+
+async def wait_for_batch(job: BatchJob, batch_id: str) -> Dict[str, Any]:
+    """
+    Изчаква пакетът да бъде обработен
+
+    Returns:
+        Dict: Последното състояние на пакета
+    """
+    config = get_analysis_config()
+
+    while True:
+        response = await get_http_client().get(
+            f"{config.anthropic_batches_url}/{batch_id}",
+            headers=get_batch_headers(),
+            timeout=60.0
+        )
+        if response.status_code == 200:
+            batch = response.json()
+            if batch.get("processing_status") == "ended":
+                return batch
+            logger.info(f"[{job.job_id}] Пакет {batch_id}: {batch.get('request_counts')}")
+        else:
+            logger.warning(f"[{job.job_id}] Грешка при проверка на пакет {batch_id}: HTTP {response.status_code}")
+
+        await asyncio.sleep(config.batch_poll_interval)
+
+
+async def fetch_batch_results(batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Изтегля резултатите от обработен пакет (JSONL)
+
+    Returns:
+        Dict: Резултат по custom_id
+    """
+    config = get_analysis_config()
+    results_url = batch.get("results_url") or f"{config.anthropic_batches_url}/{batch['id']}/results"
+
+    response = await get_http_client().get(results_url, headers=get_batch_headers(), timeout=300.0)
+    if response.status_code != 200:
+        raise RuntimeError(f"Грешка при изтегляне на резултатите: HTTP {response.status_code}")
+
+    results = {}
+    for line in response.text.splitlines():
+        if line.strip():
+            item = json.loads(line)
+            results[item["custom_id"]] = item["result"]
+    return results
+
+
+def parse_batch_result(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Превръща резултата на една заявка от пакета в анализ (None при неуспех)"""
+    if result.get("type") != "succeeded":
+        return None
+
+    message = result.get("message") or {}
+    content = message.get("content") or []
+    text = content[0].get("text", "") if content else ""
+
+    analysis = extract_json_object(text)
+    if analysis is None:
+        return None
+
+    analysis["full_analysis"] = text
+    analysis["usage"] = extract_usage(message)
+    analysis["batch"] = True
+    return analysis
+
+
+def group_into_cycles(position_results: List[PositionAnalysisResult], window: float) -> List[MultiAnalysisResult]:
+    """
+    Групира резултатите по позиции в обобщени резултати по цикли на прихващане
+
+    Нов цикъл започва, когато позицията вече е в текущия цикъл или кадърът е
+    по-късно от window секунди след началото му.
+    """
+    cycles: List[Dict[int, PositionAnalysisResult]] = []
+    cycle_start: Optional[datetime] = None
+
+    for result in sorted(position_results, key=lambda r: r.timestamp):
+        if (not cycles or result.position_id in cycles[-1]
+                or (result.timestamp - cycle_start).total_seconds() > window):
+            cycles.append({})
+            cycle_start = result.timestamp
+        cycles[-1][result.position_id] = result
+
+    multi_results = []
+    for cycle in cycles:
+        overall = calculate_overall_result(cycle)
+        multi_results.append(MultiAnalysisResult(
+            timestamp=min(r.timestamp for r in cycle.values()),
+            position_results=cycle,
+            avg_cloud_coverage=overall["avg_cloud_coverage"],
+            overall_weather_conditions=overall["overall_weather_conditions"],
+            sunny=overall["sunny"],
+            total_analysis_time=overall["total_analysis_time"]
+        ))
+    return multi_results
+
+
+async def run_batch_job(job: BatchJob) -> BatchJob:
+    """Изпълнява задача за пакетен анализ от намирането на кадрите до записа в историята"""
+    config = get_analysis_config()
+
+    try:
+        frames = await run_io(list_archived_frames, job.date, job.positions or None)
+        job.frames = len(frames)
+        if not frames:
+            job.status = "ended"
+            job.error = f"Няма кадри за {job.date}"
+            return job
+
+        frames_by_id = {get_custom_id(path): (position_id, path, timestamp) for position_id, path, timestamp in frames}
+        position_results: List[PositionAnalysisResult] = []
+
+        # Пакетите се изграждат един по един, за да не държим всички изображения в паметта
+        chunk_size = max(1, config.batch_max_requests)
+        for offset in range(0, len(frames), chunk_size):
+            job.status = "submitting"
+            chunk = frames[offset:offset + chunk_size]
+            requests = [
+                request for request in await asyncio.gather(*[
+                    build_batch_request(position_id, path) for position_id, path, _ in chunk
+                ])
+                if request is not None
+            ]
+            job.errored += len(chunk) - len(requests)
+            if not requests:
+                continue
+
+            batch_id = await submit_batch(requests)
+            job.batch_ids.append(batch_id)
+            job.submitted += len(requests)
+            logger.info(f"[{job.job_id}] Изпратен пакет {batch_id} с {len(requests)} кадъра")
+
+            job.status = "in_progress"
+            batch = await wait_for_batch(job, batch_id)
+
+            job.status = "collecting"
+            results = await fetch_batch_results(batch)
+
+            for request in requests:
+                position_id, path, timestamp = frames_by_id[request["custom_id"]]
+                analysis = parse_batch_result(results.get(request["custom_id"], {}))
+                if analysis is None:
+                    job.errored += 1
+                    continue
+
+                job.succeeded += 1
+                position_results.append(apply_position_analysis(
+                    PositionAnalysisResult(position_id=position_id, timestamp=timestamp),
+                    analysis
+                ))
+
+        multi_results = group_into_cycles(position_results, config.batch_cycle_window)
+        add_history_results(multi_results)
+        job.results_written = len(multi_results)
+        job.status = "ended"
+        logger.info(
+            f"[{job.job_id}] Пакетният анализ за {job.date} завърши: "
+            f"{job.succeeded} успешни, {job.errored} неуспешни, {job.results_written} цикъла"
+        )
+
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        await cancel_remote_batches(job)
+        raise
+    except Exception as e:
+        job.status = "error"
+        job.error = str(e)
+        logger.error(f"[{job.job_id}] Грешка при пакетен анализ: {str(e)}")
+    finally:
+        job.ended_at = datetime.now()
+
+    return job
+
+
+async def cancel_remote_batches(job: BatchJob) -> None:
+    """Отменя незавършените пакети на задачата в API-то"""
+    config = get_analysis_config()
+    for batch_id in job.batch_ids:
+        try:
+            await get_http_client().post(
+                f"{config.anthropic_batches_url}/{batch_id}/cancel",
+                headers=get_batch_headers(),
+                timeout=30.0
+            )
+        except Exception as e:
+            logger.warning(f"[{job.job_id}] Пакет {batch_id} не може да се отмени: {str(e)}")
+
+
+def start_batch_job(date: str, positions: Optional[List[int]] = None) -> BatchJob:
+    """
+    Стартира задача за пакетен анализ в контролния loop
+
+    Args:
+        date: Ден във формат YYYYMMDD
+        positions: Позиции (None - всички конфигурирани)
+
+    Returns:
+        BatchJob: Новата задача
+    """
+    datetime.strptime(date, "%Y%m%d")
+
+    job = BatchJob(
+        job_id=uuid.uuid4().hex[:12],
+        date=date,
+        positions=positions or [],
+        created_at=datetime.now()
+    )
+    _jobs[job.job_id] = job
+    _job_futures[job.job_id] = submit_coroutine(run_batch_job(job))
+    logger.info(f"Стартирана задача за пакетен анализ {job.job_id} за {date}")
+    return job
+
+
+def cancel_batch_job(job_id: str) -> bool:
+    """Отменя задача за пакетен анализ"""
+    future = _job_futures.get(job_id)
+    if future is None or future.done():
+        return False
+    return future.cancel()
+
+
+def get_batch_job(job_id: str) -> Optional[BatchJob]:
+    """Връща задача по ID"""
+    return _jobs.get(job_id)
+
+
+def get_batch_jobs() -> List[BatchJob]:
+    """Връща всички задачи, най-новите първи"""
+    return sorted(_jobs.values(), key=lambda job: job.created_at, reverse=True)
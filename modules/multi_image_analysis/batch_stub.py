@@ -0,0 +1,128 @@
+# Файл: modules/multi_image_analysis/batch_stub.py
+"""
+Локален заместител на Anthropic Message Batches API за тестове
+
+Приема пакети, "обработва" ги след BATCH_STUB_DELAY секунди и връща
+детерминиран анализ според яркостта на изображението - без реални заявки и
+разходи. Стартиране:
+
+    python -m modules.multi_image_analysis.batch_stub
+    ANTHROPIC_BATCHES_URL=http://127.0.0.1:8765/v1/messages/batches
+"""
+
+import os
+import json
+import time
+import uuid
+import base64
+from io import BytesIO
+from typing import Any, Dict
+
+from PIL import Image, ImageStat
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+STUB_DELAY = float(os.getenv("BATCH_STUB_DELAY", "2"))
+STUB_PORT = int(os.getenv("BATCH_STUB_PORT", "8765"))
+
+app = FastAPI(title="Message Batches API stub")
+
+# Пакетите в паметта: id -> {"created", "requests", "cancelled"}
+_batches: Dict[str, Dict[str, Any]] = {}
+
+
+def _analyze(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Детерминиран "анализ" - по-светлото небе се счита за по-облачно"""
+    brightness = 0.0
+    for block in params["messages"][0]["content"]:
+        if block.get("type") == "image":
+            image = Image.open(BytesIO(base64.b64decode(block["source"]["data"]))).convert("L")
+            brightness = ImageStat.Stat(image).mean[0]
+
+    cloud_coverage = round(brightness / 255 * 100)
+    return {
+        "cloud_coverage": cloud_coverage,
+        "cloud_type": "стратус" if cloud_coverage > 60 else "кумулус",
+        "visibility": "добра",
+        "weather_conditions": f"Тестов анализ (яркост {brightness:.0f})",
+        "is_sunny": cloud_coverage < 30,
+        "confidence": 50
+    }
+
+
+def _batch_status(batch_id: str, request: Request) -> Dict[str, Any]:
+    """Състояние на пакета във формата на API-то"""
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Пакетът не е намерен")
+
+    ended = batch["cancelled"] or time.time() - batch["created"] >= STUB_DELAY
+    count = len(batch["requests"])
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {
+            "processing": 0 if ended else count,
+            "succeeded": count if ended and not batch["cancelled"] else 0,
+            "errored": 0,
+            "canceled": count if batch["cancelled"] else 0,
+            "expired": 0
+        },
+        "results_url": str(request.url_for("batch_results", batch_id=batch_id)) if ended else None
+    }
+
+
+@app.post("/v1/messages/batches")
+async def create_batch(request: Request):
+    """Създава пакет"""
+    body = await request.json()
+    batch_id = f"msgbatch_{uuid.uuid4().hex}"
+    _batches[batch_id] = {"created": time.time(), "requests": body["requests"], "cancelled": False}
+    return JSONResponse(_batch_status(batch_id, request))
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def get_batch(batch_id: str, request: Request):
+    """Връща състоянието на пакета"""
+    return JSONResponse(_batch_status(batch_id, request))
+
+
+@app.post("/v1/messages/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str, request: Request):
+    """Отменя пакета"""
+    if batch_id in _batches:
+        _batches[batch_id]["cancelled"] = True
+    return JSONResponse(_batch_status(batch_id, request))
+
+
+@app.get("/v1/messages/batches/{batch_id}/results", name="batch_results")
+async def batch_results(batch_id: str):
+    """Връща резултатите като JSONL"""
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Пакетът не е намерен")
+
+    lines = []
+    for item in batch["requests"]:
+        if batch["cancelled"]:
+            result = {"type": "canceled"}
+        else:
+            result = {
+                "type": "succeeded",
+                "message": {
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [{"type": "text", "text": json.dumps(_analyze(item["params"]), ensure_ascii=False)}],
+                    "usage": {"input_tokens": 1500, "output_tokens": 80}
+                }
+            }
+        lines.append(json.dumps({"custom_id": item["custom_id"], "result": result}, ensure_ascii=False))
+
+    return PlainTextResponse("\n".join(lines), media_type="application/x-jsonl")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=STUB_PORT)
@@ -6,7 +6,20 @@
 import os
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+
+from utils.logger import setup_logger
+from utils.history_store import get_history_store
+from utils.event_bus import publish_event
+
+# Инициализиране на логър
+logger = setup_logger("multi_image_analysis_config")
+
+# Име на модула в историята
+HISTORY_MODULE = "multi_image_analysis"
+
+# Име на задачата в планировчика
+SCHEDULER_JOB = "multi_image_analysis"
 
 class PositionAnalysisResult(BaseModel):
     """Модел за резултата от анализа на една позиция"""
@@ -19,6 +32,7 @@ class PositionAnalysisResult(BaseModel):
     analysis_time: float = 0.0  # Време за анализ в секунди
     full_analysis: Optional[str] = None  # Пълен анализ
     raw_response: Optional[Dict[str, Any]] = None  # Оригинален отговор от API
+    cache_hit: Optional[str] = None  # Резултатът е от кеша: exact, similar или disk
 
 class MultiAnalysisResult(BaseModel):
     """Модел за обобщения резултат от анализа на всички позиции"""
@@ -28,6 +42,24 @@ class MultiAnalysisResult(BaseModel):
     overall_weather_conditions: str = ""  # Общо описание на метеорологичните условия
     sunny: bool = False  # Има ли слънце
     total_analysis_time: float = 0.0  # Общо време за анализ
+    elapsed_time: float = 0.0  # Реално време за анализа (позициите се анализират паралелно)
+    failed_positions: List[int] = []  # Позиции без успешен анализ
+
+class BatchJob(BaseModel):
+    """Модел за задача за пакетен анализ на архивни кадри"""
+    job_id: str
+    date: str  # Ден на кадрите (YYYYMMDD)
+    positions: List[int] = []  # Позиции за анализ
+    status: str = "pending"  # pending, submitting, in_progress, collecting, ended, error, cancelled
+    created_at: datetime
+    ended_at: Optional[datetime] = None
+    batch_ids: List[str] = []  # ID на пакетите в Message Batches API
+    frames: int = 0  # Брой намерени кадри
+    submitted: int = 0  # Брой изпратени заявки
+    succeeded: int = 0  # Брой успешни анализи
+    errored: int = 0  # Брой неуспешни анализи
+    results_written: int = 0  # Брой записани в историята обобщени резултати
+    error: Optional[str] = None
 
 class MultiImageAnalysisConfig(BaseModel):
     """Конфигурационен модел за анализ на множество изображения"""
@@ -38,10 +70,22 @@ class MultiImageAnalysisConfig(BaseModel):
     analysis_interval: int = 300  # Интервал между анализите в секунди (5 минути)
     last_analysis_time: Optional[datetime] = None
     last_result: Optional[MultiAnalysisResult] = None
-    analysis_history: List[MultiAnalysisResult] = []
     status: str = "initializing"
     running: bool = True
-    max_history_items: int = 20  # Максимален брой запазени анализи
+    max_history_page: int = 500  # Максимален брой резултати на страница от историята
+    use_result_cache: bool = True  # Без нов анализ за непроменени или почти еднакви кадри
+    preprocess_images: bool = True  # Намаляване и прекодиране на изображението преди изпращане
+    max_image_edge: int = 1568  # Максимален размер на дългата страна в пиксели
+    upload_jpeg_quality: int = 85  # JPEG качество на изпращаното изображение
+    sky_crop_ratio: float = 1.0  # Каква част от височината на кадъра (отгоре) да се изпраща
+    max_concurrent_requests: int = 4  # Максимален брой едновременни заявки към API
+    request_timeout: float = 90.0  # Максимално време за анализ на една позиция в секунди
+    analysis_mode: str = "per_position"  # per_position - заявка за всяка позиция, combined - една заявка с всички
+    combined_max_tokens: int = 3000  # max_tokens при една обща заявка за всички позиции
+    anthropic_batches_url: str = "https://api.anthropic.com/v1/messages/batches"  # Message Batches API
+    batch_max_requests: int = 200  # Максимален брой кадри в един пакет
+    batch_poll_interval: float = 60.0  # Интервал за проверка на пакетите в секунди
+    batch_cycle_window: float = 600.0  # Кадри в рамките на този интервал са от един цикъл на прихващане
 
 # Определяме правилния път до файловете
 def get_image_dir():
@@ -56,7 +100,15 @@ def get_image_dir():
 # Глобална конфигурация на модула
 _config = MultiImageAnalysisConfig(
     anthropic_model=os.getenv("ANTHROPIC_MODEL", "claude-3-haiku-20240307"), 
-    analysis_interval=int(os.getenv("MULTI_ANALYSIS_INTERVAL", "300"))
+    analysis_interval=int(os.getenv("MULTI_ANALYSIS_INTERVAL", "300")),
+    max_concurrent_requests=int(os.getenv("MULTI_ANALYSIS_CONCURRENCY", "4")),
+    analysis_mode=os.getenv("MULTI_ANALYSIS_MODE", "per_position"),
+    anthropic_batches_url=os.getenv("ANTHROPIC_BATCHES_URL", "https://api.anthropic.com/v1/messages/batches"),
+    batch_poll_interval=float(os.getenv("BATCH_POLL_INTERVAL", "60")),
+    request_timeout=float(os.getenv("MULTI_ANALYSIS_REQUEST_TIMEOUT", "90")),
+    max_image_edge=int(os.getenv("MULTI_ANALYSIS_MAX_IMAGE_EDGE", "1568")),
+    upload_jpeg_quality=int(os.getenv("MULTI_ANALYSIS_UPLOAD_QUALITY", "85")),
+    sky_crop_ratio=float(os.getenv("MULTI_ANALYSIS_SKY_CROP_RATIO", "1.0"))
 )
 
 def get_analysis_config() -> MultiImageAnalysisConfig:
@@ -82,16 +134,110 @@ def add_analysis_result(result: MultiAnalysisResult):
     _config.last_result = result
     _config.last_analysis_time = result.timestamp
     
-    # Добавяме в историята
-    _config.analysis_history.append(result)
+    # Записваме в постоянната история
+    store_history_results([result])
+    publish_analysis_event(result)
+
+def store_history_results(results: List[MultiAnalysisResult]):
+    """Записва резултатите в постоянната история (обобщение и резултати по позиции)"""
+    try:
+        get_history_store().add_many(HISTORY_MODULE, [
+            (
+                result.timestamp,
+                result.model_dump(mode="json", exclude={"position_results"}),
+                {
+                    position_id: position_result.model_dump(mode="json")
+                    for position_id, position_result in result.position_results.items()
+                }
+            )
+            for result in results
+        ])
+    except Exception as e:
+        logger.error(f"Грешка при запис в историята: {e}")
+
+def publish_analysis_event(result: MultiAnalysisResult):
+    """Известява абонатите на /events за нов резултат"""
+    publish_event("analysis", {
+        "module": HISTORY_MODULE,
+        "timestamp": result.timestamp.isoformat(),
+        "avg_cloud_coverage": result.avg_cloud_coverage,
+        "positions": sorted(result.position_results)
+    })
+
+def _from_record(record: Dict[str, Any]) -> MultiAnalysisResult:
+    """Възстановява резултат от запис в историята"""
+    return MultiAnalysisResult(**record["data"], position_results=record["positions"])
+
+def add_history_results(results: List[MultiAnalysisResult]):
+    """
+    Добавя резултати от минал период (напр. пакетен анализ) в историята
+    
+    Историята се подрежда по времето на анализа, а последният резултат се
+    сменя само ако някой от новите е по-нов от него.
+    """
+    global _config
+    
+    if not results:
+        return
     
-    # Ограничаваме размера на историята
-    if len(_config.analysis_history) > _config.max_history_items:
-        _config.analysis_history = _config.analysis_history[-_config.max_history_items:]
+    store_history_results(results)
+    
+    newest = max(results, key=lambda r: r.timestamp)
+    if _config.last_result is None or newest.timestamp > _config.last_result.timestamp:
+        _config.last_result = newest
+        _config.last_analysis_time = newest.timestamp
+        publish_analysis_event(newest)
 
 def get_analysis_history(limit: int = None) -> List[MultiAnalysisResult]:
-    """Връща историята на анализите с ограничение"""
+    """Връща последните анализи в хронологичен ред"""
     if limit is None or limit <= 0:
-        return _config.analysis_history
+        limit = _config.max_history_page
+    
+    history, _ = get_history_page(limit)
+    return history
+
+def get_history_page(
+    limit: int = 10,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None
+) -> Tuple[List[MultiAnalysisResult], Optional[str]]:
+    """
+    Страница от историята за периода [start, end)
+    
+    Returns:
+        Tuple: (резултати в хронологичен ред, курсор за по-старите резултати)
+    """
+    records, next_cursor = get_history_store().page(
+        HISTORY_MODULE, min(limit, _config.max_history_page), start, end, cursor
+    )
+    return [_from_record(record) for record in records], next_cursor
+
+def get_position_history_page(
+    position_id: int,
+    limit: int = 10,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None
+) -> Tuple[List[PositionAnalysisResult], Optional[str]]:
+    """Страница от историята на една позиция (по индекса за позиция и време)"""
+    records, next_cursor = get_history_store().page(
+        HISTORY_MODULE, min(limit, _config.max_history_page), start, end, cursor, position_id=position_id
+    )
+    return [PositionAnalysisResult(**record["data"]) for record in records], next_cursor
+
+def stream_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    position_id: Optional[int] = None
+) -> Iterator[Any]:
+    """
+    Всички резултати за периода в хронологичен ред (чете на порции)
     
-    return _config.analysis_history[-limit:]
\ No newline at end of file
+    С position_id връща PositionAnalysisResult за позицията, иначе MultiAnalysisResult.
+    """
+    for record in get_history_store().stream(HISTORY_MODULE, start, end, position_id=position_id):
+        if position_id is not None:
+            yield PositionAnalysisResult(**record["data"])
+        else:
+            yield _from_record(record)
\ No newline at end of file
@@ -7,19 +7,27 @@ import os
 import time
 from fastapi import APIRouter, HTTPException, Request, Form
 from fastapi.responses import (
-    HTMLResponse, FileResponse, JSONResponse, Response
+    HTMLResponse, FileResponse, JSONResponse, Response, StreamingResponse
 )
 from fastapi.templating import Jinja2Templates
-from datetime import time as dt_time  # noqa: F401
+from datetime import datetime, time as dt_time  # noqa: F401
+from typing import Optional
 
-from .config import get_capture_config, update_capture_config
+from .config import get_capture_config, update_capture_config, get_rtsp_url, SCHEDULER_JOB
 from .capture import (
-    async_capture_all_positions,
-    start_capture_thread, stop_capture_thread
+    async_capture_all_positions, get_camera_position,
+    start_capture_job, stop_capture_job
 )
+from .route import get_route_planner
+from utils.command_queue import PTZBusyError
+from utils.scheduler import get_scheduler
 # Импортираме get_placeholder_image от rtsp_capture модула
 from modules.rtsp_capture.capture import get_placeholder_image
+from modules.rtsp_capture.mjpeg import get_broadcaster, MEDIA_TYPE as MJPEG_MEDIA_TYPE
 from utils.logger import setup_logger
+from utils.frame_catalog import get_frame_catalog
+from utils.frame_store import get_frame_store, frame_response
+from utils.executors import run_io
 
 # Инициализиране на логър
 logger = setup_logger("ptz_capture_api")
@@ -56,6 +64,7 @@ async def ptz_capture_index(request: Request):
     
     status_text = (
         "OK" if config.status == "ok" 
+        else "Частично" if config.status == "partial" 
         else "Грешка" if config.status == "error" 
         else "Инициализация"
     )
@@ -78,8 +87,12 @@ async def ptz_capture_index(request: Request):
 
 
 @router.get("/latest/{position_id}.jpg")
-async def latest_position_jpg(position_id: int):
-    """Връща последния запазен JPEG файл за определена позиция"""
+async def latest_position_jpg(position_id: int, request: Request):
+    """
+    Връща последния кадър за определена позиция от паметта
+    
+    С ETag и Last-Modified - при непроменен кадър отговорът е 304 без тяло.
+    """
     try:
         config = get_capture_config()
         
@@ -90,20 +103,22 @@ async def latest_position_jpg(position_id: int):
                 detail=f"Невалидна позиция: {position_id}"
             )
         
-        # Определяме пътя до последния кадър
-        position_dir = os.path.join(
-            config.save_dir, f"position_{position_id}"
+        # Последният кадър (от диска само при първата заявка след рестарт)
+        latest_path = os.path.join(
+            config.save_dir, f"position_{position_id}", "latest.jpg"
         )
-        latest_path = os.path.join(position_dir, "latest.jpg")
+        frame = await run_io(get_frame_store().get_or_load, ("ptz", position_id), latest_path)
         
-        if not os.path.exists(latest_path):
+        if frame is None:
             # Връщаме placeholder изображение
             return Response(
                 content=get_placeholder_image(), 
                 media_type="image/jpeg"
             )
         
-        return FileResponse(latest_path, media_type="image/jpeg")
+        return frame_response(request, frame)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(
             f"Грешка при достъпване на последния кадър "
@@ -112,6 +127,43 @@ async def latest_position_jpg(position_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/stream.mjpg")
+async def stream_mjpg():
+    """
+    Поток на живо (MJPEG) от PTZ камерата
+    
+    Използва същия RTSP четец като прихващането - зрителите не отварят
+    собствени връзки към камерата.
+    """
+    config = get_capture_config()
+    broadcaster = get_broadcaster(
+        get_rtsp_url(), fps=config.stream_fps, quality=config.stream_quality
+    )
+    return StreamingResponse(
+        broadcaster.frames(),
+        media_type=MJPEG_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache, no-store"}
+    )
+
+
+def get_positions_info(positions: list) -> dict:
+    """Последният кадър и броят кадри за всяка позиция (заявки към каталога)"""
+    catalog = get_frame_catalog()
+    summary = catalog.summary("ptz")
+    positions_info = {}
+    for pos in positions:
+        latest_frame = catalog.latest("ptz", pos)
+        
+        positions_info[str(pos)] = {
+            "latest_path": latest_frame["path"] if latest_frame else None,
+            "latest_url": f"/ptz/capture/latest/{pos}.jpg",
+            "exists": latest_frame is not None,
+            "last_captured_at": latest_frame["captured_at"] if latest_frame else None,
+            "frames": summary.get(pos, {}).get("frames", 0)
+        }
+    return positions_info
+
+
 @router.get("/info")
 async def ptz_capture_info():
     """Връща информация за последния запазен цикъл"""
@@ -123,19 +175,8 @@ async def ptz_capture_info():
             "message": "Все още няма завършен цикъл на прихващане"
         }, status_code=404)
     
-    # Подготвяме информация за всяка позиция
-    positions_info = {}
-    for pos in config.positions + [0]:
-        position_dir = os.path.join(config.save_dir, f"position_{pos}")
-        latest_path = os.path.join(position_dir, "latest.jpg")
-        
-        positions_info[str(pos)] = {
-            "latest_path": (
-                latest_path if os.path.exists(latest_path) else None
-            ),
-            "latest_url": f"/ptz/capture/latest/{pos}.jpg",
-            "exists": os.path.exists(latest_path)
-        }
+    # Подготвяме информация за всяка позиция (от каталога на кадрите)
+    positions_info = await run_io(get_positions_info, config.positions + [0])
     
     last_frame_time = (
         config.last_frame_time.isoformat() 
@@ -162,14 +203,144 @@ async def ptz_capture_info():
     })
 
 
+def format_frame(frame: dict) -> dict:
+    """Форматира запис от каталога на кадрите за JSON отговор"""
+    return {
+        "id": frame["id"],
+        "position_id": frame["position_id"],
+        "captured_at": frame["captured_at"],
+        "size": frame["size"],
+        "width": frame["width"],
+        "height": frame["height"],
+        "sha256": frame["sha256"],
+        "url": f"/ptz/capture/frames/{frame['id']}.jpg"
+    }
+
+
+@router.get("/frames")
+async def ptz_capture_frames(
+    position: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    """
+    Галерия - страница от архивните кадри, най-новите първи
+    
+    next_cursor се подава като cursor за по-старите кадри.
+    """
+    try:
+        frames, next_cursor = await run_io(
+            get_frame_catalog().page, "ptz", position, start, end, max(1, min(limit, 500)), cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return JSONResponse({
+        "status": "ok",
+        "count": len(frames),
+        "frames": [format_frame(frame) for frame in frames],
+        "next_cursor": next_cursor
+    })
+
+
+@router.get("/frames/closest")
+async def ptz_capture_closest_frame(position: int, at: datetime):
+    """Архивният кадър от позицията, прихванат най-близо до момента at"""
+    frame = await run_io(get_frame_catalog().closest, "ptz", position, at)
+    if frame is None:
+        raise HTTPException(status_code=404, detail=f"Няма кадри за позиция {position}")
+    
+    return JSONResponse({"status": "ok", "frame": format_frame(frame)})
+
+
+@router.get("/frames/{frame_id}.jpg")
+async def ptz_capture_frame_image(frame_id: int):
+    """Връща архивен кадър по id от каталога"""
+    frame = await run_io(get_frame_catalog().get, frame_id)
+    if frame is None:
+        raise HTTPException(status_code=404, detail="Кадърът не е намерен")
+    
+    if not os.path.isfile(frame["path"]):
+        raise HTTPException(status_code=404, detail="Файлът на кадъра липсва")
+    
+    return FileResponse(frame["path"], media_type="image/jpeg")
+
+
+@router.get("/route")
+async def ptz_capture_route():
+    """Връща научените времена за преместване и планирания ред на обхождане"""
+    config = get_capture_config()
+    planner = get_route_planner()
+    
+    from modules.ptz_control.config import get_ptz_config
+    ptz_config = get_ptz_config()
+    
+    positions = list(ptz_config.positions.keys())
+    home_position = 0 if config.return_to_home else None
+    current_position = get_camera_position()
+    planned = planner.plan(
+        start=current_position,
+        positions=positions,
+        end=home_position,
+        default=config.position_wait_time
+    )
+    
+    return JSONResponse({
+        "status": "ok",
+        "route_optimization_enabled": config.route_optimization_enabled,
+        "current_position": current_position,
+        "planned_route": planned,
+        "estimated_travel_time": planner.route_cost(
+            current_position, planned, home_position,
+            config.position_wait_time
+        ),
+        "timings": planner.get_timings()
+    })
+
+
 @router.get("/capture")
 async def api_capture():
-    """Принудително извършване на цикъл на прихващане"""
+    """
+    Принудително извършване на цикъл на прихващане
+    
+    Цикълът се изпълнява като задачата на планировчика - не се застъпва с
+    цикъл по графика и след успех стартира веригата (анализа на кадрите).
+    """
     try:
-        # Използваме асинхронната версия директно
-        results = await async_capture_all_positions()
-        
         config = get_capture_config()
+        results = {}
+        busy = []
+        
+        async def manual_cycle() -> bool:
+            try:
+                results.update(await async_capture_all_positions(
+                    lease_timeout=config.cycle_lease_timeout
+                ))
+            except PTZBusyError as e:
+                busy.append(str(e))
+                return False
+            return any(results.values())
+        
+        status = await get_scheduler().run_and_wait(SCHEDULER_JOB, manual_cycle)
+        if status is None:
+            return JSONResponse({
+                "status": "busy",
+                "message": "Цикъл на прихващане вече е в ход"
+            }, status_code=409)
+        if busy:
+            return JSONResponse({
+                "status": "busy",
+                "message": f"Камерата е заета - цикълът не е стартиран ({busy[0]})"
+            }, status_code=409)
+        if status in ("error", "cancelled"):
+            job = get_scheduler().get_job(SCHEDULER_JOB)
+            return JSONResponse({
+                "status": "error",
+                "message": f"Цикълът на прихващане не е завършен ({job.last_error if status == 'error' else status})"
+            }, status_code=500)
+        
         last_cycle_time = (
             config.last_complete_cycle_time.isoformat() 
             if config.last_complete_cycle_time else None
@@ -292,32 +463,32 @@ async def update_config(
 @router.get("/start")
 async def start_capture():
     """Стартира процеса за прихващане на кадри"""
-    success = start_capture_thread()
+    success = start_capture_job()
     
     if success:
         return JSONResponse({
             "status": "ok",
-            "message": "PTZ Capture thread started successfully"
+            "message": "PTZ Capture job started successfully"
         })
     else:
         return JSONResponse({
             "status": "warning",
-            "message": "PTZ Capture thread is already running"
+            "message": "PTZ Capture job is already running"
         })
 
 
 @router.get("/stop")
 async def stop_capture():
     """Спира процеса за прихващане на кадри"""
-    success = stop_capture_thread()
+    success = stop_capture_job()
     
     if success:
         return JSONResponse({
             "status": "ok",
-            "message": "PTZ Capture thread stopping"
+            "message": "PTZ Capture job stopped"
         })
     else:
         return JSONResponse({
-            "status": "error",
-            "message": "Failed to stop PTZ capture thread"
-        }, status_code=500)
\ No newline at end of file
+            "status": "warning",
+            "message": "PTZ Capture job is already stopped"
+        })
\ No newline at end of file
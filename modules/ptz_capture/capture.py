@@ -2,29 +2,119 @@
 
 import os
 import time
+import asyncio
 import traceback
 import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
 import cv2
+import numpy as np
 
 from utils.logger import setup_logger
-from utils.helpers import safe_run_coroutine
-from .config import get_capture_config
+from utils.helpers import safe_run_coroutine, submit_coroutine
+from utils.scheduler import get_scheduler, IntervalTrigger
+from utils.command_queue import PTZBusyError
+from utils.frame_catalog import get_frame_catalog
+from utils.frame_store import get_frame_store
+from utils.event_bus import publish_event
+from utils.executors import run_io
+from modules.rtsp_capture.stream import get_stream_reader
+from .config import get_capture_config, update_capture_config, get_rtsp_url, SCHEDULER_JOB
+from .settle import wait_for_settle
+from .route import get_route_planner
 
 # Инициализиране на логър
 logger = setup_logger("ptz_capture")
 
 
-def capture_position_frame(position_id: int) -> bool:
+def save_position_frame(position_id: int, frame: np.ndarray) -> Optional[str]:
     """
-    Премества камерата към определена позиция и прихваща кадър
+    Кодира кадъра като JPEG (веднъж) и го записва с времеви печат и като latest.jpg
+    
+    Args:
+        position_id: ID на позицията
+        frame: BGR кадър
+        
+    Returns:
+        Optional[str]: Път към записания файл или None при грешка
+    """
+    config = get_capture_config()
+    
+    try:
+        ok, buffer = cv2.imencode(
+            ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, config.jpeg_quality]
+        )
+        if not ok:
+            logger.error(f"Неуспешно кодиране на кадър за позиция {position_id}")
+            return None
+        image_data = buffer.tobytes()
+        
+        # Подготвяме име на файла с дата и час
+        now = datetime.datetime.now()
+        filename = f"position_{position_id}_{now.strftime('%Y%m%d_%H%M%S')}.jpg"
+        
+        position_dir = os.path.join(config.save_dir, f"position_{position_id}")
+        os.makedirs(position_dir, exist_ok=True)
+        frame_path = os.path.join(position_dir, filename)
+        latest_path = os.path.join(position_dir, "latest.jpg")
+        
+        # Запазваме изображението
+        logger.info(f"Запазване на кадър за позиция {position_id} в {frame_path}")
+        with open(frame_path, "wb") as f:
+            f.write(image_data)
+        
+        # Запазваме и като latest.jpg (атомарно - читателите не виждат половин файл)
+        tmp_path = f"{latest_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image_data)
+        os.replace(tmp_path, latest_path)
+        
+        # Последният кадър в паметта за /ptz/capture/latest/{id}.jpg
+        stored = get_frame_store().put(("ptz", position_id), image_data, now.timestamp())
+        
+        # Регистрираме кадъра в каталога - грешка там не отменя записа
+        try:
+            get_frame_catalog().add(
+                frame_path, "ptz", position_id, now, image_data,
+                width=frame.shape[1], height=frame.shape[0]
+            )
+        except Exception as e:
+            logger.error(f"Грешка при регистриране на кадъра в каталога: {e}")
+        
+        config.last_frame_paths[position_id] = frame_path
+        config.last_frame_time = now
+        
+        publish_event("frame", {
+            "camera": "ptz",
+            "position_id": position_id,
+            "timestamp": now.isoformat(),
+            "etag": stored.etag,
+            "url": f"/ptz/capture/latest/{position_id}.jpg"
+        })
+        
+        return frame_path
+        
+    except Exception as e:
+        logger.error(
+            f"Грешка при запис на кадър за позиция {position_id}: {str(e)}"
+        )
+        logger.error(traceback.format_exc())
+        return None
+
+
+async def async_grab_position_frame(
+    position_id: int,
+    lease: Optional[str] = None
+) -> Optional[Tuple[float, np.ndarray]]:
+    """
+    Премества камерата към определена позиция и взима кадър (без да го записва)
     
     Args:
         position_id: ID на позицията (0-N)
+        lease: Токен на lease-а върху опашката с PTZ команди (ако цикълът я е заел)
         
     Returns:
-        bool: Успешно прихващане или не
+        Optional[Tuple[float, np.ndarray]]: (време на прихващане, кадър) или None
     """
     config = get_capture_config()
     
@@ -32,7 +122,7 @@ def capture_position_frame(position_id: int) -> bool:
         logger.info(f"Подготовка за прихващане на кадър от позиция {position_id}")
         
         # Преместваме камерата към позицията
-        from modules.ptz_control.controller import move_to_position, get_ptz_config
+        from modules.ptz_control.controller import get_command_queue, get_ptz_config
         
         # Вземаме PTZ конфигурацията за проверка на пресетите
         ptz_config = get_ptz_config()
@@ -50,82 +140,128 @@ def capture_position_frame(position_id: int) -> bool:
                 f"използва стандартен пресет"
             )
         
-        # Извикваме move_to_position, който вече знае как да използва колекциите
+        # Запомняме откъде тръгва камерата (за научаване на времената за преместване)
+        from_position = get_camera_position()
+        
+        # Стартираме постоянния RTSP четец преди преместването, за да следим движението
+        reader = get_stream_reader(get_rtsp_url())
+        
+        # Преместваме през опашката с команди, която вече знае как да използва колекциите
+        # Времето за стабилизиране се отброява от реалното изпращане на
+        # командата, а не от влизането в опашката
         logger.info(f"Преместване на камерата към позиция {position_id}")
-        move_success = safe_run_coroutine(move_to_position(position_id))
+        move_success, move_started = await get_command_queue().move_timed(position_id, lease=lease)
         
         if not move_success:
             logger.error(f"Не може да се премести камерата към позиция {position_id}")
-            return False
+            return None
         
-        # Изчакваме стабилизиране на камерата
-        logger.info(
-            f"Изчакване на стабилизиране на камерата "
-            f"({config.position_wait_time} секунди)..."
-        )
-        time.sleep(config.position_wait_time)
+        frame_data = None
+        
+        if config.settle_detection_enabled:
+            # Изчакваме, докато кадрите спрат да се променят
+            # (position_wait_time е само горна граница)
+            logger.info(
+                f"Изчакване на стабилизиране на камерата "
+                f"(най-много {config.position_wait_time} секунди)..."
+            )
+            settled, elapsed, frame_data = await run_io(
+                wait_for_settle,
+                reader,
+                move_started,
+                max_wait=config.position_wait_time,
+                threshold=config.settle_threshold,
+                stable_frames=config.settle_stable_frames,
+                min_wait=config.settle_min_wait,
+                motion_start_timeout=config.settle_motion_start_timeout
+            )
+            logger.info(
+                f"Позиция {position_id}: "
+                f"{'стабилизирана' if settled else 'достигната горна граница'} "
+                f"след {elapsed:.2f} секунди"
+            )
+            
+            # При достигната горна граница взимаме нов кадър, както преди
+            if not settled:
+                frame_data = None
+            elif from_position is not None and from_position != position_id:
+                # Реално измерено време за преместване - за планиране на маршрута
+                get_route_planner().record_move(from_position, position_id, elapsed)
+        else:
+            # Изчакваме стабилизиране на камерата
+            logger.info(
+                f"Изчакване на стабилизиране на камерата "
+                f"({config.position_wait_time} секунди)..."
+            )
+            await asyncio.sleep(config.position_wait_time)
         
         # Прихващаме кадър от RTSP потока
         logger.info(f"Прихващане на кадър от позиция {position_id}")
         
-        # Настройваме връзка с RTSP камерата
-        rtsp_url = (
-            f"rtsp://{config.camera_username}:{config.camera_password}"
-            f"@{config.camera_ip}:{config.camera_port}{config.rtsp_path}"
-        )
-        logger.info(f"Опит за свързване с RTSP поток: {rtsp_url}")
-        
-        # Отваряме RTSP потока
-        cap = cv2.VideoCapture(rtsp_url)
-        
-        if not cap.isOpened():
-            logger.error(f"Не може да се отвори RTSP потока за позиция {position_id}")
-            return False
-        
-        # Прихващаме кадър
-        ret, frame = cap.read()
-        cap.release()
-        
-        if not ret:
-            logger.error(f"Неуспешно прихващане на кадър за позиция {position_id}")
-            return False
-        
-        # Подготвяме име на файла с дата и час
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"position_{position_id}_{timestamp}.jpg"
-        
-        # Прихващаме кадъра и го запазваме
-        position_dir = os.path.join(config.frames_dir, f"position_{position_id}")
-        frame_path = os.path.join(position_dir, filename)
-        latest_path = os.path.join(position_dir, "latest.jpg")
-        
-        # Запазваме изображението
-        logger.info(f"Запазване на кадър за позиция {position_id} в {frame_path}")
-        cv2.imwrite(frame_path, frame)
+        # Ако нямаме стабилен кадър от детектора, взимаме следващия кадър
+        # от постоянния RTSP четец
+        if frame_data is None:
+            frame_data = await run_io(
+                reader.wait_for_frame, after=time.time(), timeout=config.frame_timeout
+            )
         
-        # Запазваме и като latest.jpg
-        cv2.imwrite(latest_path, frame)
+        if frame_data is None:
+            logger.error(
+                f"Неуспешно прихващане на кадър за позиция {position_id}: "
+                f"{reader.last_error or 'няма нов кадър от RTSP потока'}"
+            )
+            return None
         
         logger.info(f"Успешно прихванат кадър за позиция {position_id}")
-        return True
+        return frame_data
         
     except Exception as e:
         logger.error(
             f"Грешка при прихващане на кадър за позиция {position_id}: {str(e)}"
         )
         logger.error(traceback.format_exc())
+        return None
+
+
+def capture_position_frame(position_id: int) -> bool:
+    """
+    Премества камерата към определена позиция и прихваща кадър
+    
+    Args:
+        position_id: ID на позицията (0-N)
+        
+    Returns:
+        bool: Успешно прихващане или не
+    """
+    frame_data = safe_run_coroutine(async_grab_position_frame(position_id))
+    
+    if frame_data is None:
         return False
+    
+    return save_position_frame(position_id, frame_data[1]) is not None
 
 
-def capture_all_positions(exclude_positions: Optional[List[int]] = None) -> Dict[int, bool]:
+def get_camera_position() -> Optional[int]:
+    """
+    Последната известна позиция на камерата
+    
+    Взима се от общата опашка с команди за камерата, така че отчита и
+    ръчните премествания през PTZ Simple. None - камерата не е премествана
+    от стартирането насам (позицията е неизвестна).
+    """
+    from modules.ptz_control.controller import get_command_queue
+    return get_command_queue().last_position
+
+
+def get_positions_to_capture(exclude_positions: Optional[List[int]] = None) -> List[int]:
     """
-    Прихваща кадри от всички дефинирани позиции
+    Връща позициите за прихващане в реда на обхождане
     
     Args:
         exclude_positions: Списък с позиции, които да се пропуснат
         
     Returns:
-        Dict[int, bool]: Речник с резултати за всяка позиция
+        List[int]: Позиции за прихващане
     """
     config = get_capture_config()
     
@@ -150,32 +286,127 @@ def capture_all_positions(exclude_positions: Optional[List[int]] = None) -> Dict
         f"{positions_to_capture}"
     )
     
-    # Резултат от прихващането
+    # Подреждаме позициите за минимално време за движение
+    if config.route_optimization_enabled:
+        home_position = (
+            0 if config.return_to_home and 0 not in exclude_positions else None
+        )
+        positions_to_capture = get_route_planner().plan(
+            start=get_camera_position(),
+            positions=positions_to_capture,
+            end=home_position,
+            default=config.position_wait_time
+        )
+        logger.info(f"Ред на обхождане: {positions_to_capture}")
+    
+    return positions_to_capture
+
+
+async def async_capture_all_positions(
+    exclude_positions: Optional[List[int]] = None,
+    lease_timeout: Optional[float] = None
+) -> Dict[int, bool]:
+    """
+    Прихваща кадри от всички дефинирани позиции без да блокира event loop-а
+    
+    Работи като конвейер: докато камерата се движи към позиция N+1, кадърът
+    от позиция N се кодира и записва в пула от нишки. През целия цикъл
+    камерата е заета (lease) и други команди за преместване изчакват.
+    
+    Args:
+        exclude_positions: Списък с позиции, които да се пропуснат
+        lease_timeout: Максимално изчакване камерата да се освободи (None - без ограничение)
+        
+    Returns:
+        Dict[int, bool]: Речник с резултати за всяка позиция
+        
+    Raises:
+        PTZBusyError: Камерата не се е освободила в рамките на lease_timeout
+    """
+    config = get_capture_config()
+    
+    if exclude_positions is None:
+        exclude_positions = []
+    
+    from modules.ptz_control.controller import get_command_queue
+    command_queue = get_command_queue()
+    
+    # Резултат от прихващането и задачите за запис, които още работят
     capture_results = {}
+    pending_saves = {}
     
-    # Прихващаме кадри от всяка позиция
-    for position_id in positions_to_capture:
-        logger.info(f"Прихващане на кадър от позиция {position_id}")
-        success = capture_position_frame(position_id)
-        capture_results[position_id] = success
+    async with command_queue.lease("capture_cycle", timeout=lease_timeout) as lease:
+        # Планираме след като сме заели камерата - текущата позиция вече е известна
+        positions_to_capture = get_positions_to_capture(exclude_positions)
+        cycle_started = time.time()
         
-        # Добавяме пауза между позициите
-        if position_id != positions_to_capture[-1]:  # Ако не е последната позиция
-            logger.info(
-                f"Пауза между позициите ({config.position_transition_time} секунди)"
-            )
-            time.sleep(config.position_transition_time)
+        # Прихващаме кадри от всяка позиция
+        for position_id in positions_to_capture:
+            logger.info(f"Прихващане на кадър от позиция {position_id}")
+            frame_data = await async_grab_position_frame(position_id, lease=lease)
+            
+            if frame_data is None:
+                capture_results[position_id] = False
+            else:
+                # Кодирането и записът вървят във фона, докато камерата се движи
+                pending_saves[position_id] = asyncio.ensure_future(
+                    run_io(save_position_frame, position_id, frame_data[1])
+                )
+            
+            # Добавяме пауза между позициите
+            if position_id != positions_to_capture[-1]:  # Ако не е последната позиция
+                logger.info(
+                    f"Пауза между позициите ({config.position_transition_time} секунди)"
+                )
+                await asyncio.sleep(config.position_transition_time)
+        
+        # Връщаме камерата към начална позиция, докато последните кадри се записват
+        if (config.return_to_home and positions_to_capture 
+                and 0 not in exclude_positions):
+            logger.info("Връщане на камерата към начална позиция")
+            await command_queue.move(0, lease=lease)
+    
+    # Изчакваме всички записи
+    for position_id, save_future in pending_saves.items():
+        capture_results[position_id] = (await save_future) is not None
     
-    # Връщаме камерата към начална позиция
-    if (config.return_to_home and positions_to_capture 
-            and 0 not in exclude_positions):
-        logger.info("Връщане на камерата към начална позиция")
-        from modules.ptz_control.controller import move_to_position
-        safe_run_coroutine(move_to_position(0))
+    # Научените времена за преместване - един запис на цикъл
+    await run_io(get_route_planner().save)
+    
+    # Подреждаме резултатите в реда на обхождане
+    capture_results = {
+        position_id: capture_results.get(position_id, False)
+        for position_id in positions_to_capture
+    }
+    
+    successful = sum(1 for success in capture_results.values() if success)
+    logger.info(
+        f"Цикълът завърши за {time.time() - cycle_started:.1f} секунди: "
+        f"{successful} успешни от {len(capture_results)} позиции"
+    )
+    
+    if successful:
+        config.last_complete_cycle_time = datetime.datetime.now()
+        config.status = "ok" if successful == len(capture_results) else "partial"
+    else:
+        config.status = "error"
     
     return capture_results
 
 
+def capture_all_positions(exclude_positions: Optional[List[int]] = None) -> Dict[int, bool]:
+    """
+    Прихваща кадри от всички дефинирани позиции (синхронна обвивка)
+    
+    Args:
+        exclude_positions: Списък с позиции, които да се пропуснат
+        
+    Returns:
+        Dict[int, bool]: Речник с резултати за всяка позиция
+    """
+    return safe_run_coroutine(async_capture_all_positions(exclude_positions))
+
+
 def initialize_capture() -> bool:
     """
     Инициализира модула за прихващане на кадри от PTZ камера
@@ -197,13 +428,13 @@ def initialize_capture() -> bool:
         logger.info(f"Текуща позиция на камерата: {position_info}")
         
         # Проверяваме дали директориите за кадри съществуват
-        logger.info(f"Проверка на директория за кадри: {config.frames_dir}")
+        logger.info(f"Проверка на директория за кадри: {config.save_dir}")
         
-        if not os.path.exists(config.frames_dir):
+        if not os.path.exists(config.save_dir):
             logger.warning(
-                f"Директорията {config.frames_dir} не съществува, създаваме я"
+                f"Директорията {config.save_dir} не съществува, създаваме я"
             )
-            os.makedirs(config.frames_dir)
+            os.makedirs(config.save_dir)
         
         # Създаваме поддиректории за всяка позиция
         from modules.ptz_control.config import get_ptz_config
@@ -212,7 +443,7 @@ def initialize_capture() -> bool:
         # Проверяваме всички позиции в PTZ конфигурацията
         for position_id in ptz_config.positions.keys():
             position_dir = os.path.join(
-                config.frames_dir, f"position_{position_id}"
+                config.save_dir, f"position_{position_id}"
             )
             
             if not os.path.exists(position_dir):
@@ -238,175 +469,37 @@ def initialize_capture() -> bool:
         return False
 
 
-def start_capture_cycle(
-    interval_minutes: int = 30,
-    exclude_positions: Optional[List[int]] = None
-) -> bool:
+async def scheduled_capture_cycle() -> bool:
     """
-    Стартира цикличен процес на прихващане
+    Цикъл на прихващане по графика (задача в планировчика)
+    
+    Изчаква камерата да се освободи, ако е заета от ръчна команда. При успех
+    планировчикът стартира веднага анализа на кадрите (верига).
     
-    Args:
-        interval_minutes: Интервал между циклите в минути
-        exclude_positions: Списък с позиции, които да се пропуснат
-        
     Returns:
-        bool: Успешно стартиране или не
+        bool: Поне една позиция е прихваната успешно
     """
-    config = get_capture_config()
-    
-    # Задаваме интервала
-    config.capture_interval = interval_minutes
-    
-    # Ако цикълът вече работи, спираме го
-    if config.capture_running:
-        logger.info(
-            "Цикълът вече е стартиран, рестартираме го с нови настройки"
-        )
-        stop_capture_cycle()
-    
-    # Стартираме цикъла
-    logger.info(
-        f"Стартиране на цикъл за прихващане с интервал {interval_minutes} минути"
-    )
-    config.capture_running = True
-    config.last_capture_time = None
-    config.exclude_positions = exclude_positions or []
-    
-    # Пускаме първоначално прихващане
-    logger.info("Първоначално прихващане на кадри от всички позиции")
-    results = capture_all_positions(exclude_positions)
+    try:
+        results = await async_capture_all_positions()
+    except PTZBusyError as e:
+        logger.warning(f"Камерата е заета - цикълът се пропуска ({str(e)})")
+        return False
     
     successful = sum(1 for success in results.values() if success)
-    logger.info(
-        f"Първоначално прихващане: {successful} успешни от {len(results)} позиции"
-    )
-    
-    # Обновяваме времето на последно прихващане
-    config.last_capture_time = datetime.datetime.now()
-    config.is_capture_cycle_completed = True
-    
-    logger.info("Цикълът за прихващане е стартиран успешно")
-    return True
+    logger.info(f"Прихващане: {successful} успешни от {len(results)} позиции")
+    return successful > 0
 
 
-def stop_capture_cycle() -> bool:
-    """
-    Спира цикличния процес на прихващане
-    
-    Returns:
-        bool: Успешно спиране или не
-    """
-    config = get_capture_config()
-    
-    if not config.capture_running:
-        logger.info("Цикълът не е стартиран")
-        return True
-    
-    # Спираме цикъла
-    logger.info("Спиране на цикъл за прихващане")
-    config.capture_running = False
-    
-    # Връщаме камерата в позиция 0
-    if config.return_to_home:
-        logger.info("Връщане на камерата към начална позиция")
-        from modules.ptz_control.controller import move_to_position
-        safe_run_coroutine(move_to_position(0))
-    
-    logger.info("Цикълът за прихващане е спрян успешно")
-    return True
+def start_capture_job() -> bool:
+    """Пуска периодичното прихващане (първият цикъл е веднага)"""
+    update_capture_config(running=True)
+    return get_scheduler().resume(SCHEDULER_JOB)
 
 
-def check_capture_cycle() -> Dict[str, Any]:
-    """
-    Проверява статуса на цикъла и прихваща нови кадри, ако е нужно
-    
-    Returns:
-        Dict[str, Any]: Статус на цикъла
-    """
-    config = get_capture_config()
-    
-    # Ако цикълът не е стартиран
-    if not config.capture_running:
-        return {
-            "status": "stopped",
-            "message": "Цикълът не е стартиран",
-            "next_capture": None,
-            "last_capture": config.last_capture_time
-        }
-    
-    # Текущото време
-    now = datetime.datetime.now()
-    
-    # Ако още няма първо прихващане
-    if config.last_capture_time is None:
-        logger.info("Първоначално прихващане")
-        results = capture_all_positions(config.exclude_positions)
-        
-        successful = sum(1 for success in results.values() if success)
-        logger.info(
-            f"Прихващане: {successful} успешни от {len(results)} позиции"
-        )
-        
-        config.last_capture_time = now
-        config.is_capture_cycle_completed = True
-        
-        next_capture = now + datetime.timedelta(minutes=config.capture_interval)
-        return {
-            "status": "running",
-            "message": "Първоначално прихващане изпълнено",
-            "next_capture": next_capture,
-            "last_capture": now,
-            "results": results
-        }
-    
-    # Проверяваме дали е време за ново прихващане
-    time_since_last = now - config.last_capture_time
-    interval_seconds = config.capture_interval * 60
-    
-    if time_since_last.total_seconds() >= interval_seconds:
-        logger.info(
-            f"Време за ново прихващане "
-            f"(изминали {time_since_last.total_seconds()} секунди)"
-        )
-        
-        results = capture_all_positions(config.exclude_positions)
-        
-        successful = sum(1 for success in results.values() if success)
-        logger.info(
-            f"Прихващане: {successful} успешни от {len(results)} позиции"
-        )
-        
-        config.last_capture_time = now
-        config.is_capture_cycle_completed = True
-        
-        next_capture = now + datetime.timedelta(minutes=config.capture_interval)
-        return {
-            "status": "running",
-            "message": "Ново прихващане изпълнено",
-            "next_capture": next_capture,
-            "last_capture": now,
-            "results": results
-        }
-    else:
-        # Изчисляваме оставащото време
-        seconds_left = interval_seconds - time_since_last.total_seconds()
-        minutes_left = int(seconds_left / 60)
-        seconds_remainder = int(seconds_left % 60)
-        
-        next_capture = config.last_capture_time + datetime.timedelta(
-            minutes=config.capture_interval
-        )
-        
-        return {
-            "status": "running",
-            "message": (
-                f"Следващо прихващане след {minutes_left} мин "
-                f"{seconds_remainder} сек"
-            ),
-            "next_capture": next_capture,
-            "last_capture": config.last_capture_time,
-            "seconds_left": seconds_left
-        }
+def stop_capture_job() -> bool:
+    """Спира периодичното прихващане и прекъсва цикъла в ход"""
+    update_capture_config(running=False)
+    return get_scheduler().pause(SCHEDULER_JOB, cancel=True)
 
 
 def get_latest_frame(position_id: int) -> Optional[str]:
@@ -422,7 +515,7 @@ def get_latest_frame(position_id: int) -> Optional[str]:
     config = get_capture_config()
     
     # Построяваме пътя
-    position_dir = os.path.join(config.frames_dir, f"position_{position_id}")
+    position_dir = os.path.join(config.save_dir, f"position_{position_id}")
     latest_path = os.path.join(position_dir, "latest.jpg")
     
     if os.path.exists(latest_path):
@@ -431,6 +524,21 @@ def get_latest_frame(position_id: int) -> Optional[str]:
     return None
 
 
+def sync_frame_catalog() -> int:
+    """
+    Добавя в каталога архивните кадри, записани преди него
+    
+    Returns:
+        int: Брой добавени кадри
+    """
+    config = get_capture_config()
+    try:
+        return get_frame_catalog().sync_directory(config.save_dir, "ptz")
+    except Exception as e:
+        logger.error(f"Грешка при синхронизиране на каталога на кадрите: {e}")
+        return 0
+
+
 def initialize() -> bool:
     """
     Инициализира модула
@@ -438,4 +546,21 @@ def initialize() -> bool:
     Returns:
         bool: Успешна инициализация или не
     """
-    return initialize_capture()
\ No newline at end of file
+    config = get_capture_config()
+    
+    # Обхождането на архива може да отнеме време - не забавяме стартирането
+    submit_coroutine(run_io(sync_frame_catalog))
+    
+    # Периодичното прихващане е задача в общия планировчик (през нощта се пропуска)
+    get_scheduler().add_job(
+        SCHEDULER_JOB,
+        scheduled_capture_cycle,
+        IntervalTrigger(lambda: get_capture_config().interval, daylight=True),
+        daylight=True,
+        paused=not config.running
+    )
+    return initialize_capture()
+
+
+# Автоматично инициализиране при import
+initialize()
\ No newline at end of file
@@ -9,6 +9,9 @@ from pydantic import BaseModel
 from datetime import datetime, time
 from typing import Optional, List, Dict, Any
 
+# Име на задачата в планировчика
+SCHEDULER_JOB = "ptz_capture"
+
 class PTZCaptureConfig(BaseModel):
     """Конфигурационен модел за PTZ capture"""
     save_dir: str = "/app/ptz_frames"  # Променено от "ptz_frames" на "/app/ptz_frames" за Docker
@@ -24,7 +27,32 @@ class PTZCaptureConfig(BaseModel):
     last_complete_cycle_time: Optional[datetime] = None
     status: str = "initializing"
     running: bool = True
-    
+
+    # RTSP връзка към PTZ камерата (за постоянния четец на кадри)
+    camera_ip: str = "109.160.23.42"
+    camera_port: int = 554
+    camera_username: str = "admin"
+    camera_password: str = "admin"
+    rtsp_path: str = "/cam/realmonitor?channel=1&subtype=0&unicast=true&proto=Onvif"
+    frame_timeout: float = 10.0  # Максимално време за изчакване на нов кадър в секунди
+    jpeg_quality: int = 95  # JPEG качество на записаните кадри
+    stream_fps: float = 5.0  # Максимален брой кадри в секунда на MJPEG потока на живо
+    stream_quality: int = 80  # JPEG качество на MJPEG потока
+
+    # Адаптивно откриване на стабилизиране (position_wait_time е горна граница)
+    settle_detection_enabled: bool = True
+    settle_threshold: float = 2.0  # Праг на средната разлика между кадрите (0-255)
+    settle_stable_frames: int = 3  # Брой последователни спокойни сравнения
+    settle_min_wait: float = 1.0  # Минимално изчакване след командата в секунди
+    settle_motion_start_timeout: float = 3.0  # Време за изчакване на началото на движението
+
+    # Обхождане на позициите
+    position_transition_time: int = 2  # Пауза между позициите в секунди
+    return_to_home: bool = True  # Връщане към позиция 0 след цикъла
+    route_optimization_enabled: bool = True  # Подреждане на позициите по време за движение
+    route_exact_max_positions: int = 9  # До толкова позиции - точно решение, над - евристика
+    cycle_lease_timeout: float = 5.0  # Изчакване на заета камера при ръчно стартиран цикъл (секунди)
+
     class Config:
         arbitrary_types_allowed = True
 
@@ -48,13 +76,30 @@ _config = PTZCaptureConfig(
     active_time_start=time(int(os.getenv("PTZ_ACTIVE_START_HOUR", "6")), 0),
     active_time_end=time(int(os.getenv("PTZ_ACTIVE_END_HOUR", "21")), 0),
     timezone_offset=int(os.getenv("TIMEZONE_OFFSET", "2")),
-    dst_enabled=os.getenv("DST_ENABLED", "True").lower() in ("true", "1", "yes")
+    dst_enabled=os.getenv("DST_ENABLED", "True").lower() in ("true", "1", "yes"),
+    camera_ip=os.getenv("PTZ_CAMERA_IP", "109.160.23.42"),
+    camera_port=int(os.getenv("PTZ_RTSP_PORT", "554")),
+    camera_username=os.getenv("PTZ_USERNAME", "admin"),
+    camera_password=os.getenv("PTZ_PASSWORD", "admin"),
+    rtsp_path=os.getenv(
+        "PTZ_RTSP_PATH", "/cam/realmonitor?channel=1&subtype=0&unicast=true&proto=Onvif"
+    ),
+    settle_detection_enabled=os.getenv("PTZ_SETTLE_DETECTION", "True").lower() in ("true", "1", "yes"),
+    settle_threshold=float(os.getenv("PTZ_SETTLE_THRESHOLD", "2.0")),
+    stream_fps=float(os.getenv("PTZ_STREAM_FPS", "5"))
 )
 
 def get_capture_config() -> PTZCaptureConfig:
     """Връща текущата конфигурация на модула"""
     return _config
 
+def get_rtsp_url() -> str:
+    """Връща RTSP URL на PTZ камерата според конфигурацията"""
+    return (
+        f"rtsp://{_config.camera_username}:{_config.camera_password}"
+        f"@{_config.camera_ip}:{_config.camera_port}{_config.rtsp_path}"
+    )
+
 def update_capture_config(**kwargs) -> PTZCaptureConfig:
     """Обновява конфигурацията с нови стойности"""
     global _config
@@ -0,0 +1,302 @@
+# Файл: modules/ptz_capture/route.py
+"""
+Планиране на реда на обхождане на пресетите за минимално време за движение
+
+Времената за преместване между всяка двойка пресети се научават от реалните
+цикли (време от командата до стабилизиране на камерата) и се пазят във файл
+(записва се веднъж в края на цикъла, извън event loop-а - save() през run_io).
+Преди всеки цикъл редът на позициите се оптимизира - точно (Held-Karp) за
+малък брой позиции и евристично (най-близък съсед + 2-opt) за повече.
+"""
+
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("ptz_route")
+
+
+class RoutePlanner:
+    """
+    Научава времената за преместване между пресетите и планира маршрута на цикъла
+    """
+
+    def __init__(
+        self,
+        timings_path: Optional[str] = None,
+        smoothing: float = 0.3,
+        exact_max_positions: int = 9
+    ):
+        self.timings_path = timings_path
+        self.smoothing = smoothing
+        self.exact_max_positions = exact_max_positions
+        self._timings: Dict[Tuple[int, int], float] = {}
+        self._samples: Dict[Tuple[int, int], int] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """Зарежда научените времена от файла"""
+        if not self.timings_path or not os.path.exists(self.timings_path):
+            return
+
+        try:
+            with open(self.timings_path, "r") as f:
+                data = json.load(f)
+
+            for item in data.get("timings", []):
+                key = (int(item["from"]), int(item["to"]))
+                self._timings[key] = float(item["seconds"])
+                self._samples[key] = int(item.get("samples", 1))
+
+            logger.info(f"Заредени {len(self._timings)} времена за преместване от {self.timings_path}")
+        except Exception as e:
+            logger.warning(f"Не може да се заредят времената за преместване: {str(e)}")
+
+    def save(self) -> None:
+        """Записва научените времена във файла, ако има нови (блокиращо - през run_io)"""
+        if not self.timings_path:
+            return
+
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = {
+                "timings": [
+                    {"from": a, "to": b, "seconds": seconds, "samples": self._samples.get((a, b), 1)}
+                    for (a, b), seconds in sorted(self._timings.items())
+                ]
+            }
+
+        try:
+            tmp_path = f"{self.timings_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.timings_path)
+        except Exception as e:
+            logger.warning(f"Не може да се запишат времената за преместване: {str(e)}")
+
+    def record_move(self, from_position: int, to_position: int, seconds: float) -> None:
+        """
+        Записва измерено време за преместване (експоненциално усредняване)
+
+        Само в паметта - файлът се обновява със save().
+
+        Args:
+            from_position: Начална позиция
+            to_position: Крайна позиция
+            seconds: Време от командата до стабилизиране на камерата
+        """
+        if from_position == to_position or seconds <= 0:
+            return
+
+        key = (from_position, to_position)
+        with self._lock:
+            previous = self._timings.get(key)
+            if previous is None:
+                self._timings[key] = seconds
+            else:
+                self._timings[key] = previous + self.smoothing * (seconds - previous)
+            self._samples[key] = self._samples.get(key, 0) + 1
+            self._dirty = True
+
+        logger.info(
+            f"Време за преместване {from_position} -> {to_position}: "
+            f"{seconds:.2f} с (средно {self._timings[key]:.2f} с)"
+        )
+
+    def estimate(self, from_position: int, to_position: int, default: float) -> float:
+        """
+        Връща очакваното време за преместване между две позиции
+
+        Ако няма измерване в тази посока, използваме обратната (движението
+        обикновено е симетрично), а ако няма и такова - стойността по подразбиране.
+        """
+        if from_position == to_position:
+            return 0.0
+
+        with self._lock:
+            if (from_position, to_position) in self._timings:
+                return self._timings[(from_position, to_position)]
+            if (to_position, from_position) in self._timings:
+                return self._timings[(to_position, from_position)]
+
+        return default
+
+    def get_timings(self) -> List[Dict[str, float]]:
+        """Връща научените времена (за API)"""
+        with self._lock:
+            return [
+                {"from": a, "to": b, "seconds": round(seconds, 3), "samples": self._samples.get((a, b), 1)}
+                for (a, b), seconds in sorted(self._timings.items())
+            ]
+
+    def route_cost(
+        self,
+        start: Optional[int],
+        route: List[int],
+        end: Optional[int],
+        default: float
+    ) -> float:
+        """Изчислява очакваното общо време за движение по даден маршрут"""
+        total = 0.0
+        previous = start
+        for position in list(route) + ([end] if end is not None else []):
+            if previous is not None:
+                total += self.estimate(previous, position, default)
+            previous = position
+        return total
+
+    def plan(
+        self,
+        start: Optional[int],
+        positions: List[int],
+        end: Optional[int] = None,
+        default: float = 10.0
+    ) -> List[int]:
+        """
+        Подрежда позициите така, че общото време за движение да е минимално
+
+        Args:
+            start: Текуща позиция на камерата (None ако е неизвестна)
+            positions: Позиции за обхождане (в реда от конфигурацията)
+            end: Позиция, към която камерата се връща след цикъла (None - без връщане)
+            default: Очаквано време за непознати двойки позиции
+
+        Returns:
+            List[int]: Позициите в оптималния ред
+        """
+        if len(positions) < 2:
+            return list(positions)
+
+        with self._lock:
+            has_timings = any(
+                a in positions or b in positions for a, b in self._timings
+            )
+
+        # Без никакви измервания всички редове са еднакви - запазваме конфигурацията
+        if not has_timings:
+            return list(positions)
+
+        def cost(a: Optional[int], b: int) -> float:
+            return 0.0 if a is None else self.estimate(a, b, default)
+
+        if len(positions) <= self.exact_max_positions:
+            route = self._plan_exact(start, positions, end, cost)
+        else:
+            route = self._plan_heuristic(start, positions, end, cost)
+
+        # Сменяме реда само ако наистина печелим време
+        original_cost = self.route_cost(start, positions, end, default)
+        planned_cost = self.route_cost(start, route, end, default)
+        if planned_cost >= original_cost - 1e-6:
+            return list(positions)
+
+        logger.info(
+            f"Оптимизиран маршрут {route} (очаквано {planned_cost:.1f} с "
+            f"вместо {original_cost:.1f} с за {positions})"
+        )
+        return route
+
+    @staticmethod
+    def _plan_exact(start, positions, end, cost) -> List[int]:
+        """Точно решение (Held-Karp динамично програмиране, O(2^n * n^2))"""
+        n = len(positions)
+        full = (1 << n) - 1
+        inf = float("inf")
+
+        # best[mask][i] - минимално време за обхождане на mask, завършвайки в i
+        best = [[inf] * n for _ in range(1 << n)]
+        parent = [[-1] * n for _ in range(1 << n)]
+
+        for i in range(n):
+            best[1 << i][i] = cost(start, positions[i])
+
+        for mask in range(1, full + 1):
+            for i in range(n):
+                current = best[mask][i]
+                if current == inf or not mask & (1 << i):
+                    continue
+                for j in range(n):
+                    if mask & (1 << j):
+                        continue
+                    next_mask = mask | (1 << j)
+                    candidate = current + cost(positions[i], positions[j])
+                    if candidate < best[next_mask][j]:
+                        best[next_mask][j] = candidate
+                        parent[next_mask][j] = i
+
+        def total(i: int) -> float:
+            return best[full][i] + (cost(positions[i], end) if end is not None else 0.0)
+
+        last = min(range(n), key=total)
+
+        route = []
+        mask = full
+        while last != -1:
+            route.append(positions[last])
+            previous = parent[mask][last]
+            mask &= ~(1 << last)
+            last = previous
+
+        return list(reversed(route))
+
+    @staticmethod
+    def _plan_heuristic(start, positions, end, cost) -> List[int]:
+        """Евристика - най-близък съсед, последван от 2-opt подобрения"""
+        remaining = list(positions)
+        route = []
+        current = start
+
+        while remaining:
+            nearest = min(remaining, key=lambda p: cost(current, p))
+            route.append(nearest)
+            remaining.remove(nearest)
+            current = nearest
+
+        def path_cost(path: List[int]) -> float:
+            total = 0.0
+            previous = start
+            for position in path + ([end] if end is not None else []):
+                total += cost(previous, position)
+                previous = position
+            return total
+
+        improved = True
+        best_cost = path_cost(route)
+        while improved:
+            improved = False
+            for i in range(len(route) - 1):
+                for j in range(i + 1, len(route)):
+                    candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                    candidate_cost = path_cost(candidate)
+                    if candidate_cost < best_cost - 1e-9:
+                        route, best_cost = candidate, candidate_cost
+                        improved = True
+
+        return route
+
+
+# Глобален планировчик
+_planner: Optional[RoutePlanner] = None
+
+
+def get_route_planner() -> RoutePlanner:
+    """Връща глобалния планировчик на маршрута (създава го при първо извикване)"""
+    global _planner
+
+    if _planner is None:
+        from .config import get_capture_config
+        config = get_capture_config()
+        _planner = RoutePlanner(
+            timings_path=os.path.join(config.save_dir, "route_timings.json"),
+            exact_max_positions=config.route_exact_max_positions
+        )
+
+    return _planner
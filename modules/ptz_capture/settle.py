@@ -0,0 +1,128 @@
+# Файл: modules/ptz_capture/settle.py
+"""
+Адаптивно откриване на момента, в който камерата е спряла да се движи
+
+Вместо фиксирано изчакване (position_wait_time) след преместване към пресет,
+сравняваме последователни намалени grayscale кадри от постоянния RTSP четец
+и прихващаме веднага щом движението падне под праг. Фиксираното време
+остава само като горна граница.
+"""
+
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("ptz_settle")
+
+
+def prepare_motion_frame(frame: np.ndarray, width: int = 160) -> np.ndarray:
+    """
+    Подготвя кадър за сравнение - намален, grayscale и леко размазан
+
+    Args:
+        frame: BGR кадър от камерата
+        width: Ширина след намаляване в пиксели
+
+    Returns:
+        np.ndarray: float32 grayscale изображение
+    """
+    height = max(1, int(frame.shape[0] * width / frame.shape[1]))
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    # Размазването потиска шума от компресията, който не е движение
+    gray = cv2.GaussianBlur(gray, (3, 3), 0)
+    return gray.astype(np.float32)
+
+
+def motion_score(previous: np.ndarray, current: np.ndarray) -> float:
+    """
+    Изчислява средната абсолютна разлика между два подготвени кадъра (0-255)
+    """
+    return float(np.mean(np.abs(current - previous)))
+
+
+def wait_for_settle(
+    reader,
+    move_started: float,
+    max_wait: float,
+    threshold: float = 2.0,
+    stable_frames: int = 3,
+    min_wait: float = 1.0,
+    motion_start_timeout: float = 3.0,
+    width: int = 160
+) -> Tuple[bool, float, Optional[Tuple[float, np.ndarray]]]:
+    """
+    Изчаква камерата да се стабилизира след команда за преместване
+
+    Камерата започва да се движи малко след командата, затова първо чакаме
+    да видим движение (най-много motion_start_timeout секунди - ако вече е
+    била на тази позиция, движение няма да има), а след това изискваме
+    stable_frames последователни сравнения под прага.
+
+    Args:
+        reader: RTSPStreamReader, от който се четат кадрите
+        move_started: Момент (time.time()) на изпращане на командата
+        max_wait: Горна граница за изчакването в секунди (position_wait_time)
+        threshold: Праг на средната абсолютна разлика, под който няма движение
+        stable_frames: Брой последователни спокойни сравнения
+        min_wait: Минимално време след командата преди да приемем стабилизиране
+        motion_start_timeout: Време за изчакване на началото на движението
+        width: Ширина на намалените кадри
+
+    Returns:
+        Tuple[bool, float, Optional[Tuple[float, np.ndarray]]]:
+            (стабилизирана ли е, изминало време, последния стабилен кадър)
+    """
+    deadline = move_started + max_wait
+    previous = None
+    last_frame_time = move_started
+    calm_count = 0
+    motion_seen = False
+    last_frame_data = None
+
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+
+        frame_data = reader.wait_for_frame(after=last_frame_time + 1e-6, timeout=remaining)
+        if frame_data is None:
+            break
+
+        last_frame_data = frame_data
+        last_frame_time = frame_data[0]
+        current = prepare_motion_frame(frame_data[1], width)
+
+        if previous is not None:
+            score = motion_score(previous, current)
+
+            if score >= threshold:
+                motion_seen = True
+                calm_count = 0
+            else:
+                calm_count += 1
+
+            elapsed = last_frame_time - move_started
+            movement_over = motion_seen or elapsed >= motion_start_timeout
+
+            if (calm_count >= stable_frames and movement_over
+                    and elapsed >= min_wait):
+                logger.info(
+                    f"Камерата се стабилизира за {elapsed:.2f} секунди "
+                    f"(разлика {score:.2f}, праг {threshold})"
+                )
+                return True, elapsed, frame_data
+
+        previous = current
+
+    elapsed = time.time() - move_started
+    logger.warning(
+        f"Камерата не се стабилизира в рамките на {max_wait} секунди, "
+        f"използваме последния кадър"
+    )
+    return False, elapsed, last_frame_data
@@ -7,9 +7,12 @@ from typing import Dict, Any, List, Optional
 from .config import get_ptz_config
 from .controller import (
     move_to_position, move_to_collection,
-    get_collections, get_current_position, stop_movement
+    get_collections, get_current_position, stop_movement,
+    async_get_collections, invalidate_collections_cache,
+    get_collections_cache_status
 )
 from utils.logger import setup_logger
+from utils.helpers import run_in_control_loop
 
 # Инициализиране на логър
 logger = setup_logger("ptz_control_api")
@@ -112,8 +115,8 @@ async def move_camera_to_position(position_id: int):
 async def get_available_collections():
     """Връща списък с наличните колекции (пресети)"""
     try:
-        # Извикваме get_collections, за да обновим списъка с колекции
-        await get_collections()
+        # Взимаме колекциите от кеша (опресняват се при изтекъл кеш)
+        await run_in_control_loop(async_get_collections())
         
         # Вземаме актуалната конфигурация
         config = get_ptz_config()
@@ -139,7 +142,8 @@ async def get_available_collections():
             "collections": collection_info,
             "position_to_collection": config.position_to_collection_map,
             "collection_to_position": config.collection_to_position_map,
-            "collections_supported": config.collections_supported
+            "collections_supported": config.collections_supported,
+            "cache": get_collections_cache_status()
         })
     
     except Exception as e:
@@ -202,8 +206,9 @@ async def refresh_collections():
     try:
         logger.info("API заявка за обновяване на колекциите")
         
-        # Извикваме get_collections за да обновим списъка
-        collections = await get_collections()
+        # Инвалидираме кеша и зареждаме колекциите наново от API
+        invalidate_collections_cache()
+        collections = await run_in_control_loop(async_get_collections(force_refresh=True))
         
         if collections:
             config = get_ptz_config()
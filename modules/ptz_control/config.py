@@ -17,6 +17,7 @@ class PTZControlConfig(BaseModel):
     device_serial_number: str
     
     # Запазваме съществуващата конфигурация за съвместимост
+    camera_id: str = "ptz"  # Обща опашка с команди с другите модули за същата камера
     camera_ip: Optional[str] = None
     camera_port: Optional[int] = None
     username: Optional[str] = None
@@ -41,6 +42,8 @@ class PTZControlConfig(BaseModel):
     last_collection_id: Optional[str] = None  # Последно използвана колекция
     position_to_collection_map: Dict[int, str] = {}  # Мапинг позиция->колекция
     collection_to_position_map: Dict[str, int] = {}  # Мапинг колекция->позиция
+    collections_cache_ttl: float = 300.0  # Време, през което колекциите се считат за свежи (секунди)
+    collections_cache_stale_ttl: float = 3600.0  # Още толкова се връщат стари, докато се опресняват във фона
 
 
 # Глобална конфигурация на модула
@@ -50,11 +53,14 @@ _config = PTZControlConfig(
     app_secret=os.environ.get("IMOU_APP_SECRET", "ea9432614b9a461ab7928f03d14a3f"),
     device_serial_number=os.environ.get("IMOU_DEVICE_SN", "B2762ADPCG9BBD4"),
     
+    camera_id=os.getenv("PTZ_CAMERA_ID", "ptz"),
+    
     # Запазваме оригиналните полета за съвместимост
     camera_ip=os.getenv("PTZ_CAMERA_IP", "192.168.1.100"),
     camera_port=int(os.getenv("PTZ_CAMERA_PORT", "8899")),
     username=os.getenv("PTZ_USERNAME", "admin"),
-    password=os.getenv("PTZ_PASSWORD", "admin")
+    password=os.getenv("PTZ_PASSWORD", "admin"),
+    collections_cache_ttl=float(os.getenv("PTZ_COLLECTIONS_CACHE_TTL", "300"))
 )
 
 
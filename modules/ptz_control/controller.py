@@ -11,6 +11,9 @@ from typing import Dict, Any, List, Optional, Tuple
 
 from .config import get_ptz_config, update_ptz_config, update_collection_mappings
 from utils.logger import setup_logger
+from utils.helpers import safe_run_coroutine
+from utils.cache import AsyncTTLCache
+from utils.command_queue import CameraCommands, get_camera_queue
 
 # Инициализиране на логър
 logger = setup_logger("ptz_controller")
@@ -77,8 +80,8 @@ async def async_initialize_camera() -> bool:
         # Обновяваме статуса на конфигурацията
         update_ptz_config(status="ready")
         
-        # Получаваме колекциите (пресетите)
-        await async_get_collections()
+        # Получаваме колекциите (пресетите) - новият клиент може да е към друго устройство
+        await async_get_collections(force_refresh=True)
         
         return True
         
@@ -94,7 +97,7 @@ def initialize_camera() -> bool:
     Returns:
         bool: Успешна инициализация или не
     """
-    return asyncio.get_event_loop().run_until_complete(async_initialize_camera())
+    return safe_run_coroutine(async_initialize_camera())
 
 
 async def async_move_to_position(position_id: int) -> bool:
@@ -217,9 +220,21 @@ async def async_move_to_position(position_id: int) -> bool:
         return False
 
 
+def get_command_queue() -> CameraCommands:
+    """
+    Връща опашката с команди към камерата - сериализира и обединява преместванията
+
+    Опашката е обща за всички модули, които управляват същата камера (по
+    camera_id, а не по адрес - модулите стигат до камерата по различни пътища),
+    така че ръчните премествания изчакват цикъла на прихващане.
+    """
+    return CameraCommands(get_camera_queue(get_ptz_config().camera_id), async_move_to_position)
+
+
 def move_to_position(position_id: int) -> bool:
     """
-    Премества камерата към предварително зададена позиция (обвивка около async функцията)
+    Премества камерата към предварително зададена позиция през опашката
+    (обвивка около async функцията)
     
     Args:
         position_id: ID на позицията (0-4)
@@ -227,7 +242,7 @@ def move_to_position(position_id: int) -> bool:
     Returns:
         bool: Успешно преместване или не
     """
-    return asyncio.get_event_loop().run_until_complete(async_move_to_position(position_id))
+    return safe_run_coroutine(get_command_queue().move(position_id))
 
 
 async def async_move_to_collection(collection_id: str) -> bool:
@@ -251,7 +266,7 @@ async def async_move_to_collection(collection_id: str) -> bool:
     if collection_id not in config.collections:
         logger.warning(f"Колекция {collection_id} не е намерена, опитваме да обновим")
         
-        # Опитваме да опресним колекциите
+        # Опитваме да опресним колекциите (от кеша - мрежа само ако е изтекъл)
         collections = await async_get_collections()
         
         # Проверяваме отново
@@ -319,12 +334,12 @@ def move_to_collection(collection_id: str) -> bool:
     Returns:
         Dict[str, Dict[str, Any]]: Речник с колекции или празен речник при грешка
     """
-    return asyncio.get_event_loop().run_until_complete(async_move_to_collection(collection_id))
+    return safe_run_coroutine(async_move_to_collection(collection_id))
 
 
-async def async_get_collections() -> Dict[str, Dict[str, Any]]:
+async def _async_fetch_collections() -> Dict[str, Dict[str, Any]]:
     """
-    Асинхронно получава списъка със запазени колекции (пресети)
+    Асинхронно получава списъка със запазени колекции (пресети) от API
     
     Returns:
         Dict[str, Dict[str, Any]]: Речник с колекции или празен речник при грешка
@@ -438,7 +453,29 @@ async def async_get_collections() -> Dict[str, Dict[str, Any]]:
         return {}
 
 
-def get_collections() -> Dict[str, Dict[str, Any]]:
+# Кеш на колекциите - по време на циклите колекцията се взима от паметта
+_collections_cache = AsyncTTLCache(
+    _async_fetch_collections,
+    ttl=get_ptz_config().collections_cache_ttl,
+    stale_ttl=get_ptz_config().collections_cache_stale_ttl,
+    name="ptz_control_collections"
+)
+
+
+async def async_get_collections(force_refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Асинхронно връща списъка със запазени колекции (от кеша, опреснява го при нужда)
+    
+    Args:
+        force_refresh: Зарежда колекциите от API, дори ако кешът е свеж
+    
+    Returns:
+        Dict[str, Dict[str, Any]]: Речник с колекции или празен речник при грешка
+    """
+    return await _collections_cache.get(force_refresh=force_refresh) or {}
+
+
+def get_collections(force_refresh: bool = False) -> Dict[str, Dict[str, Any]]:
     """
     Получава списъка със запазени колекции (пресети)
     (обвивка около async функцията)
@@ -446,7 +483,17 @@ def get_collections() -> Dict[str, Dict[str, Any]]:
     Returns:
         Dict[str, Dict[str, Any]]: Речник с колекции
     """
-    return asyncio.get_event_loop().run_until_complete(async_get_collections())
+    return safe_run_coroutine(async_get_collections(force_refresh))
+
+
+def invalidate_collections_cache() -> None:
+    """Инвалидира кеша с колекции - следващото четене ги зарежда от API"""
+    _collections_cache.invalidate()
+
+
+def get_collections_cache_status() -> Dict[str, Any]:
+    """Връща състоянието на кеша с колекции"""
+    return _collections_cache.get_status()
 
 
 async def async_stop_movement() -> bool:
@@ -509,7 +556,7 @@ def stop_movement() -> bool:
     Returns:
         bool: Успешно спиране или не
     """
-    return asyncio.get_event_loop().run_until_complete(async_stop_movement())
+    return safe_run_coroutine(async_stop_movement())
 
 
 def get_current_position() -> Dict[str, Any]:
@@ -12,14 +12,19 @@ from typing import Dict, Any, List, Optional
 
 from .config import get_ptz_config, update_ptz_config
 from .controller import (
-    move_to_position, 
-    get_presets, 
-    update_preset_tokens, 
+    initialize_camera,
+    async_get_presets, 
+    async_update_preset_tokens, 
     get_current_position, 
-    stop_movement,
-    run_diagnostics
+    async_stop_movement,
+    async_run_diagnostics,
+    invalidate_presets_cache,
+    get_presets_cache_status,
+    get_command_queue
 )
 from utils.logger import setup_logger
+from utils.helpers import run_in_control_loop
+from utils.command_queue import PTZBusyError
 
 # Инициализиране на логър
 logger = setup_logger("ptz_simple_api")
@@ -35,7 +40,7 @@ templates = Jinja2Templates(directory=templates_dir)
 async def ptz_index(request: Request):
     """Страница за PTZ Simple модула"""
     config = get_ptz_config()
-    presets = get_presets()
+    presets = await run_in_control_loop(async_get_presets())
     
     return templates.TemplateResponse("ptz_simple_index.html", {
         "request": request,
@@ -63,15 +68,6 @@ async def get_available_positions():
             
         return JSONResponse({
             "status": "ok",
-            "message": "Конфигурацията е обновена успешно",
-            "config": {
-                "camera_ip": updated_config.camera_ip,
-                "camera_port": updated_config.camera_port,
-                "username": updated_config.username,
-                "move_speed": updated_config.move_speed
-            }
-        })
-": "ok",
             "positions": positions,
             "current_position": config.current_position
         })
@@ -98,8 +94,14 @@ async def move_camera_to_position(position_id: int):
                 "message": f"Невалидна позиция: {position_id}"
             }, status_code=400)
         
-        # Преместваме камерата
-        success = move_to_position(position_id)
+        # Преместваме камерата през опашката (заетата камера връща 409)
+        try:
+            success = await get_command_queue().move(position_id, timeout=config.command_timeout)
+        except PTZBusyError as e:
+            return JSONResponse({
+                "status": "busy",
+                "message": str(e)
+            }, status_code=409)
         
         if success:
             position_name = config.positions[position_id].get("name", f"Позиция {position_id}")
@@ -124,13 +126,13 @@ async def move_camera_to_position(position_id: int):
         }, status_code=500)
 
 @router.get("/presets")
-async def get_available_presets():
+async def get_available_presets(refresh: bool = Query(False, description="Зареждане от камерата, без кеша")):
     """Връща списък с наличните пресети от камерата"""
     try:
-        presets = get_presets()
+        presets = await run_in_control_loop(async_get_presets(force_refresh=refresh))
         
         # Обновяваме мапинга между позиции и пресети
-        update_preset_tokens()
+        await run_in_control_loop(async_update_preset_tokens())
         config = get_ptz_config()
         
         # Форматиране на отговора
@@ -154,6 +156,7 @@ async def get_available_presets():
             "status": "ok",
             "presets": preset_list,
             "preset_tokens": config.preset_tokens,
+            "cache": get_presets_cache_status(),
             "message": f"Намерени {len(presets)} пресета"
         })
     
@@ -165,6 +168,31 @@ async def get_available_presets():
             "message": f"Грешка: {str(e)}"
         }, status_code=500)
 
+@router.get("/refresh")
+async def refresh_presets():
+    """Инвалидира кеша и обновява списъка с пресети от камерата"""
+    try:
+        logger.info("API заявка за обновяване на пресетите")
+        
+        invalidate_presets_cache()
+        presets = await run_in_control_loop(async_get_presets(force_refresh=True))
+        config = get_ptz_config()
+        
+        return JSONResponse({
+            "status": "ok" if presets else "warning",
+            "message": f"Обновени {len(presets)} пресета" if presets else "Не са намерени пресети",
+            "preset_tokens": config.preset_tokens,
+            "cache": get_presets_cache_status()
+        })
+    
+    except Exception as e:
+        logger.error(f"Грешка при обновяване на пресети: {str(e)}")
+        logger.error(traceback.format_exc())
+        return JSONResponse({
+            "status": "error",
+            "message": f"Грешка: {str(e)}"
+        }, status_code=500)
+
 @router.get("/status")
 async def get_ptz_status():
     """Връща текущия статус на PTZ контрола"""
@@ -177,7 +205,8 @@ async def get_ptz_status():
             "ptz_status": config.status,
             "current_position": position_info,
             "preset_tokens": config.preset_tokens,
-            "last_move_time": config.last_move_time.isoformat() if config.last_move_time else None
+            "last_move_time": config.last_move_time.isoformat() if config.last_move_time else None,
+            "command_queue": get_command_queue().get_status()
         })
     
     except Exception as e:
@@ -194,7 +223,7 @@ async def stop_camera_movement():
     try:
         logger.info("API заявка за спиране на движението")
         
-        success = stop_movement()
+        success = await run_in_control_loop(async_stop_movement())
         
         if success:
             return JSONResponse({
@@ -221,7 +250,7 @@ async def api_diagnostics():
     try:
         logger.info("API заявка за диагностика")
         
-        results = run_diagnostics()
+        results = await run_in_control_loop(async_run_diagnostics())
         
         return JSONResponse({
             "status": "ok",
@@ -267,8 +296,15 @@ async def update_config(
     
     # Инициализираме камерата с новите настройки, ако са променени IP, порт, потребител или парола
     if any(key in update_params for key in ["camera_ip", "camera_port", "username", "password"]):
-        from .controller import initialize
-        initialize()
+        await run_in_control_loop(initialize_camera())
     
     return JSONResponse({
-        "status
\ No newline at end of file
+        "status": "ok",
+        "message": "Конфигурацията е обновена успешно",
+        "config": {
+            "camera_ip": updated_config.camera_ip,
+            "camera_port": updated_config.camera_port,
+            "username": updated_config.username,
+            "move_speed": updated_config.move_speed
+        }
+    })
@@ -10,6 +10,7 @@ from typing import Optional, Dict, Any, List
 
 class PTZSimpleConfig(BaseModel):
     """Конфигурационен модел за опростен PTZ контрол"""
+    camera_id: str = "ptz"  # Обща опашка с команди с другите модули за същата камера
     camera_ip: str
     camera_port: int
     username: str
@@ -26,13 +27,18 @@ class PTZSimpleConfig(BaseModel):
     last_move_time: Optional[datetime] = None
     current_position: int = 0
     preset_tokens: Dict[int, str] = {}  # Мапинг между нашите позиции и ONVIF пресети
+    presets_cache_ttl: float = 300.0  # Време, през което пресетите се считат за свежи (секунди)
+    presets_cache_stale_ttl: float = 3600.0  # Още толкова се връщат стари, докато се опресняват във фона
+    command_timeout: float = 30.0  # Максимално изчакване на команда в опашката (секунди)
 
 # Глобална конфигурация на модула
 _config = PTZSimpleConfig(
+    camera_id=os.getenv("PTZ_CAMERA_ID", "ptz"),
     camera_ip=os.getenv("PTZ_CAMERA_IP", "109.160.23.42"),
     camera_port=int(os.getenv("PTZ_CAMERA_PORT", "80")),
     username=os.getenv("PTZ_USERNAME", "admin"),
-    password=os.getenv("PTZ_PASSWORD", "admin")
+    password=os.getenv("PTZ_PASSWORD", "admin"),
+    presets_cache_ttl=float(os.getenv("PTZ_PRESETS_CACHE_TTL", "300"))
 )
 
 def get_ptz_config() -> PTZSimpleConfig:
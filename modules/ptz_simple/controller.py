@@ -8,11 +8,14 @@ import asyncio
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
 
-from onvif import ONVIFCamera
 import zeep
 
 from .config import get_ptz_config, update_ptz_config
+from .onvif_client import AsyncONVIFCamera, to_dict
 from utils.logger import setup_logger
+from utils.helpers import safe_run_coroutine
+from utils.cache import AsyncTTLCache
+from utils.command_queue import CameraCommands, get_camera_queue
 
 # Инициализиране на логър
 logger = setup_logger("ptz_simple_controller")
@@ -31,11 +34,28 @@ profile_token = None
 
 async def initialize_camera() -> bool:
     """
-    Асинхронно инициализира камерата чрез ONVIF
+    Асинхронно инициализира камерата чрез ONVIF и зарежда пресетите
     
     Returns:
         bool: Успешна инициализация или не
     """
+    if not await _connect_camera():
+        return False
+    
+    # Новата връзка може да е към друга камера - пресетите се четат директно,
+    # а не през кеша, чиято зареждаща функция също свързва камерата
+    _presets_cache.set(await _read_presets())
+    
+    logger.info("ONVIF камера инициализирана успешно")
+    return True
+
+async def _connect_camera() -> bool:
+    """
+    Свързва се с камерата чрез ONVIF (без пресетите)
+    
+    Returns:
+        bool: Успешно свързване или не
+    """
     global cam, ptz, media, profile_token
     
     config = get_ptz_config()
@@ -43,14 +63,19 @@ async def initialize_camera() -> bool:
     try:
         logger.info(f"Инициализиране на ONVIF камера: {config.camera_ip}:{config.camera_port}")
         
-        # Създаваме ONVIF камера
-        cam = ONVIFCamera(config.camera_ip, config.camera_port, config.username, config.password)
+        # Затваряме предишната връзка, ако има такава
+        if cam is not None:
+            await cam.close()
         
-        # Създаваме media service
-        media = cam.create_media_service()
+        # Създаваме ONVIF камера (асинхронна, с постоянни HTTP връзки)
+        cam = AsyncONVIFCamera(config.camera_ip, config.camera_port, config.username, config.password)
+        await cam.connect()
+        
+        # Вземаме media service
+        media = cam.media
         
         # Получаваме профилите
-        profiles = media.GetProfiles()
+        profiles = await media.GetProfiles()
         
         if not profiles:
             logger.error("Не са намерени профили в камерата")
@@ -61,16 +86,11 @@ async def initialize_camera() -> bool:
         profile_token = profiles[0].token
         logger.info(f"Използваме профил: {profile_token}")
         
-        # Създаваме ptz service
-        ptz = cam.create_ptz_service()
-        
-        # Обновяваме пресет токените
-        await async_update_preset_tokens()
+        # Вземаме ptz service
+        ptz = cam.ptz
         
         # Обновяваме статуса
         update_ptz_config(status="ok")
-        
-        logger.info("ONVIF камера инициализирана успешно")
         return True
     except Exception as e:
         logger.error(f"Грешка при инициализиране на ONVIF камера: {str(e)}")
@@ -84,31 +104,34 @@ def initialize_camera_sync() -> bool:
     Returns:
         bool: Успешна инициализация или не
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(initialize_camera())
-    finally:
-        loop.close()
+    return safe_run_coroutine(initialize_camera())
 
-async def async_get_presets() -> Dict[str, Dict[str, Any]]:
+async def _async_fetch_presets() -> Dict[str, Dict[str, Any]]:
     """
-    Асинхронно получава списък с пресети от камерата
+    Асинхронно получава списък с пресети от камерата (зареждаща функция на кеша)
     
     Returns:
         Dict[str, Dict[str, Any]]: Речник с пресети
     """
-    global ptz, profile_token
-    
     if not ptz or not profile_token:
-        success = await initialize_camera()
-        if not success:
+        # Само връзка - initialize_camera() чете пресетите и не бива да се
+        # извиква от зареждащата функция
+        if not await _connect_camera():
             return {}
     
+    return await _read_presets()
+
+async def _read_presets() -> Dict[str, Dict[str, Any]]:
+    """
+    Получава списък с пресети от свързаната камера (винаги по мрежата)
+    
+    Returns:
+        Dict[str, Dict[str, Any]]: Речник с пресети
+    """
     try:
         # Получаваме пресетите
         logger.info("Получаване на пресети от камерата")
-        presets = ptz.GetPresets({'ProfileToken': profile_token})
+        presets = to_dict(await ptz.GetPresets(ProfileToken=profile_token)) or []
         
         # Обработваме пресетите в подходящ формат
         result = {}
@@ -124,38 +147,81 @@ async def async_get_presets() -> Dict[str, Dict[str, Any]]:
             }
             
         logger.info(f"Успешно получени {len(result)} пресета")
+        
+        # Обновяваме мапинга при всяко зареждане (и при фоново опресняване)
+        if result:
+            map_preset_tokens(result)
+        
         return result
     except Exception as e:
         logger.error(f"Грешка при получаване на пресети: {str(e)}")
         return {}
 
-def get_presets() -> Dict[str, Dict[str, Any]]:
+# Кеш на пресетите - по време на циклите токенът се взима от паметта
+_presets_cache = AsyncTTLCache(
+    _async_fetch_presets,
+    ttl=get_ptz_config().presets_cache_ttl,
+    stale_ttl=get_ptz_config().presets_cache_stale_ttl,
+    name="ptz_simple_presets"
+)
+
+async def async_get_presets(force_refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Асинхронно връща списък с пресети (от кеша, опреснява го при нужда)
+    
+    Args:
+        force_refresh: Зарежда пресетите от камерата, дори ако кешът е свеж
+    
+    Returns:
+        Dict[str, Dict[str, Any]]: Речник с пресети
+    """
+    return await _presets_cache.get(force_refresh=force_refresh) or {}
+
+def get_presets(force_refresh: bool = False) -> Dict[str, Dict[str, Any]]:
     """
     Получава списък с пресети от камерата (синхронен метод)
     
     Returns:
         Dict[str, Dict[str, Any]]: Речник с пресети
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(async_get_presets())
-    finally:
-        loop.close()
+    return safe_run_coroutine(async_get_presets(force_refresh))
+
+def invalidate_presets_cache() -> None:
+    """Инвалидира кеша с пресети - следващото четене ги зарежда от камерата"""
+    _presets_cache.invalidate()
 
-async def async_update_preset_tokens() -> bool:
+def get_presets_cache_status() -> Dict[str, Any]:
+    """Връща състоянието на кеша с пресети"""
+    return _presets_cache.get_status()
+
+async def async_update_preset_tokens(force_refresh: bool = False) -> bool:
     """
     Асинхронно обновява мапинга между нашите позиции и реалните пресет токени
     
+    Args:
+        force_refresh: Зарежда пресетите от камерата, дори ако кешът е свеж
+    
     Returns:
         bool: Успешно обновяване или не
     """
-    presets = await async_get_presets()
+    presets = await async_get_presets(force_refresh)
     
     if not presets:
         logger.warning("Не са намерени пресети, мапингът не е обновен")
         return False
     
+    return bool(get_ptz_config().preset_tokens)
+
+def map_preset_tokens(presets: Dict[str, Dict[str, Any]]) -> bool:
+    """
+    Съпоставя нашите позиции с реалните пресет токени
+    
+    Args:
+        presets: Речник с пресети от камерата
+    
+    Returns:
+        bool: Успешно съпоставяне или не
+    """
     # Тук правим предположения за мапинга между нашите позиции (0-4)
     # и реалните ONVIF пресети. Обикновено се опитваме да съпоставим по имена.
     
@@ -206,19 +272,14 @@ async def async_update_preset_tokens() -> bool:
         logger.warning("Не са намерени съответствия между позиции и пресети")
         return False
 
-def update_preset_tokens() -> bool:
+def update_preset_tokens(force_refresh: bool = False) -> bool:
     """
     Обновява мапинга между нашите позиции и реалните пресет токени (синхронен метод)
     
     Returns:
         bool: Успешно обновяване или не
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(async_update_preset_tokens())
-    finally:
-        loop.close()
+    return safe_run_coroutine(async_update_preset_tokens(force_refresh))
 
 async def async_move_to_position(position_id: int) -> bool:
     """
@@ -249,7 +310,7 @@ async def async_move_to_position(position_id: int) -> bool:
     if not preset_token:
         logger.warning(f"Не е намерен пресет токен за позиция {position_id}, опитваме да обновим маппинга")
         
-        # Опитваме се да обновим токените
+        # Опитваме се да обновим токените (от кеша - мрежа само ако е изтекъл)
         await async_update_preset_tokens()
         
         # Проверяваме отново
@@ -265,14 +326,14 @@ async def async_move_to_position(position_id: int) -> bool:
         position_name = config.positions[position_id].get("name", f"Позиция {position_id}")
         logger.info(f"Преместване към позиция {position_id} ({position_name}), пресет токен: {preset_token}")
         
-        ptz.GotoPreset({
-            'ProfileToken': profile_token,
-            'PresetToken': preset_token,
-            'Speed': {
+        await ptz.GotoPreset(
+            ProfileToken=profile_token,
+            PresetToken=preset_token,
+            Speed={
                 'PanTilt': {'x': config.move_speed, 'y': config.move_speed},
                 'Zoom': {'x': config.move_speed}
             }
-        })
+        )
         
         # Обновяваме информацията за текущата позиция
         update_ptz_config(
@@ -286,9 +347,19 @@ async def async_move_to_position(position_id: int) -> bool:
         logger.error(f"Грешка при преместване към позиция {position_id}: {str(e)}")
         return False
 
+def get_command_queue() -> CameraCommands:
+    """
+    Връща опашката с команди към камерата - сериализира и обединява преместванията
+
+    Опашката е обща за всички модули, които управляват същата камера (по
+    camera_id, а не по адрес - модулите стигат до камерата по различни пътища),
+    така че ръчните премествания изчакват цикъла на прихващане.
+    """
+    return CameraCommands(get_camera_queue(get_ptz_config().camera_id), async_move_to_position)
+
 def move_to_position(position_id: int) -> bool:
     """
-    Премества камерата към предварително зададена позиция (синхронен метод)
+    Премества камерата към предварително зададена позиция през опашката (синхронен метод)
     
     Args:
         position_id: ID на позицията (0-4)
@@ -296,12 +367,7 @@ def move_to_position(position_id: int) -> bool:
     Returns:
         bool: Успешно преместване или не
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(async_move_to_position(position_id))
-    finally:
-        loop.close()
+    return safe_run_coroutine(get_command_queue().move(position_id))
 
 async def async_stop_movement() -> bool:
     """
@@ -320,11 +386,11 @@ async def async_stop_movement() -> bool:
     try:
         logger.info("Спиране на движението на камерата")
         
-        ptz.Stop({
-            'ProfileToken': profile_token,
-            'PanTilt': True,
-            'Zoom': True
-        })
+        await ptz.Stop(
+            ProfileToken=profile_token,
+            PanTilt=True,
+            Zoom=True
+        )
         
         logger.info("Движението на камерата е спряно успешно")
         return True
@@ -339,12 +405,7 @@ def stop_movement() -> bool:
     Returns:
         bool: Успешно спиране или не
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(async_stop_movement())
-    finally:
-        loop.close()
+    return safe_run_coroutine(async_stop_movement())
 
 def get_current_position() -> Dict[str, Any]:
     """
@@ -366,9 +427,9 @@ def get_current_position() -> Dict[str, Any]:
         "preset_token": config.preset_tokens.get(current_position)
     }
 
-def run_diagnostics() -> Dict[str, Any]:
+async def async_run_diagnostics() -> Dict[str, Any]:
     """
-    Изпълнява диагностика на PTZ функционалността
+    Асинхронно изпълнява диагностика на PTZ функционалността
     
     Returns:
         Dict[str, Any]: Резултати от диагностиката
@@ -382,15 +443,15 @@ def run_diagnostics() -> Dict[str, Any]:
     
     try:
         # Проверка на връзката с камерата
-        if initialize_camera_sync():
+        if await initialize_camera():
             results["camera_connection"] = True
             
             # Получаване на пресети
-            presets = get_presets()
+            presets = await async_get_presets()
             results["presets_available"] = len(presets)
             
             # Обновяване на мапинга
-            update_preset_tokens()
+            await async_update_preset_tokens()
             
             # Добавяне на информация за мапинга
             config = get_ptz_config()
@@ -410,6 +471,15 @@ def run_diagnostics() -> Dict[str, Any]:
     
     return results
 
+def run_diagnostics() -> Dict[str, Any]:
+    """
+    Изпълнява диагностика на PTZ функционалността (синхронен метод)
+    
+    Returns:
+        Dict[str, Any]: Резултати от диагностиката
+    """
+    return safe_run_coroutine(async_run_diagnostics())
+
 def initialize() -> bool:
     """
     Инициализира модула
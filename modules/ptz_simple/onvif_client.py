@@ -0,0 +1,199 @@
+# Файл: modules/ptz_simple/onvif_client.py
+"""
+Асинхронен ONVIF клиент за PTZ камерата
+
+Използва zeep AsyncClient върху споделен httpx.AsyncClient с постоянни
+(keep-alive) връзки, така че командите не блокират event loop-а и не отварят
+нова TCP връзка всеки път. WSDL файловете се парсват веднъж на процес (в
+отделна нишка) и се преизползват при всяко повторно свързване.
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+import zeep.helpers
+from zeep import AsyncClient, Settings
+from zeep.proxy import AsyncServiceProxy
+from zeep.transports import AsyncTransport, Transport
+from zeep.wsdl import Document
+from zeep.wsse.username import UsernameToken
+
+from utils.logger import setup_logger
+from utils.executors import run_io
+
+# Инициализиране на логър
+logger = setup_logger("ptz_simple_onvif")
+
+# Услугите, които използваме: (WSDL файл, binding)
+SERVICES = {
+    "devicemgmt": ("devicemgmt.wsdl", "{http://www.onvif.org/ver10/device/wsdl}DeviceBinding"),
+    "media": ("media.wsdl", "{http://www.onvif.org/ver10/media/wsdl}MediaBinding"),
+    "ptz": ("ptz.wsdl", "{http://www.onvif.org/ver20/ptz/wsdl}PTZBinding")
+}
+
+# Имена на услугите в отговора на GetCapabilities
+CAPABILITY_NAMES = {
+    "media": "Media",
+    "ptz": "PTZ"
+}
+
+# Парснатите WSDL документи - общи за всички връзки в процеса
+_documents: Dict[str, Document] = {}
+_documents_lock = threading.Lock()
+_settings = Settings(strict=False, xml_huge_tree=True)
+
+
+def get_wsdl_dir() -> str:
+    """Връща директорията с WSDL файловете на onvif-zeep пакета"""
+    import onvif
+    return os.path.join(os.path.dirname(os.path.dirname(onvif.__file__)), "wsdl")
+
+
+def load_wsdl_document(name: str) -> Document:
+    """
+    Връща парснатия WSDL документ за дадена услуга (парсва го само веднъж)
+
+    Args:
+        name: Име на услугата (devicemgmt, media, ptz)
+
+    Returns:
+        Document: Парснат WSDL документ
+    """
+    with _documents_lock:
+        document = _documents.get(name)
+        if document is not None:
+            return document
+
+        wsdl_file = os.path.join(get_wsdl_dir(), SERVICES[name][0])
+        logger.info(f"Парсване на WSDL {wsdl_file}")
+        document = Document(wsdl_file, Transport(), settings=_settings)
+        _documents[name] = document
+        return document
+
+
+async def async_load_wsdl_documents() -> Dict[str, Document]:
+    """Зарежда всички нужни WSDL документи без да блокира event loop-а"""
+
+    missing = [name for name in SERVICES if name not in _documents]
+    if missing:
+        await asyncio.gather(*[
+            run_io(load_wsdl_document, name) for name in missing
+        ])
+
+    return {name: _documents[name] for name in SERVICES}
+
+
+def to_dict(value: Any) -> Any:
+    """Превръща zeep обект в обикновени речници и списъци"""
+    return zeep.helpers.serialize_object(value, dict)
+
+
+class AsyncONVIFCamera:
+    """
+    Асинхронна ONVIF връзка към една камера (device management, media и PTZ)
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        timeout: float = 10.0,
+        max_connections: int = 4,
+        keepalive_expiry: float = 60.0
+    ):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+
+        self.xaddrs: Dict[str, str] = {}
+        self.devicemgmt = None
+        self.media = None
+        self.ptz = None
+
+        self._http: Optional[httpx.AsyncClient] = None
+        self._wsdl_http: Optional[httpx.Client] = None
+        self._transport: Optional[AsyncTransport] = None
+        self._wsse = UsernameToken(username, password, use_digest=True)
+
+    @property
+    def device_xaddr(self) -> str:
+        """Адрес на device management услугата (фиксиран по стандарт)"""
+        host = self.host if self.host.startswith(("http://", "https://")) else f"http://{self.host}"
+        return f"{host}:{self.port}/onvif/device_service"
+
+    def _create_service(self, name: str, xaddr: str, document: Document):
+        """Създава zeep услуга върху споделения транспорт"""
+        client = AsyncClient(
+            wsdl=document,
+            wsse=self._wsse,
+            transport=self._transport,
+            settings=_settings
+        )
+        # AsyncClient.create_service връща синхронно прокси, затова създаваме асинхронното директно
+        binding = document.bindings[SERVICES[name][1]]
+        return AsyncServiceProxy(client, binding, address=xaddr)
+
+    async def connect(self) -> None:
+        """
+        Свързва се с камерата и създава услугите
+
+        WSDL документите се парсват само при първото свързване в процеса,
+        затова повторното свързване струва само един GetCapabilities.
+        """
+        documents = await async_load_wsdl_documents()
+
+        await self.close()
+
+        self._http = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_expiry
+            )
+        )
+        # Синхронният клиент се използва само за зареждане на WSDL, което вече е направено
+        self._wsdl_http = httpx.Client(timeout=self.timeout)
+        self._transport = AsyncTransport(client=self._http, wsdl_client=self._wsdl_http)
+
+        self.devicemgmt = self._create_service(
+            "devicemgmt", self.device_xaddr, documents["devicemgmt"]
+        )
+
+        # Откриваме адресите на останалите услуги
+        capabilities = await self.devicemgmt.GetCapabilities(Category="All")
+
+        self.xaddrs = {}
+        for name, capability_name in CAPABILITY_NAMES.items():
+            capability = capabilities[capability_name]
+            if capability is not None and capability["XAddr"]:
+                self.xaddrs[name] = capability["XAddr"]
+
+        if "media" not in self.xaddrs or "ptz" not in self.xaddrs:
+            raise RuntimeError(
+                f"Камерата не поддържа нужните услуги (намерени: {list(self.xaddrs)})"
+            )
+
+        self.media = self._create_service("media", self.xaddrs["media"], documents["media"])
+        self.ptz = self._create_service("ptz", self.xaddrs["ptz"], documents["ptz"])
+
+        logger.info(f"ONVIF услуги за {self.host}:{self.port}: {self.xaddrs}")
+
+    async def close(self) -> None:
+        """Затваря HTTP връзките"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._wsdl_http is not None:
+            self._wsdl_http.close()
+            self._wsdl_http = None
+        self._transport = None
@@ -5,12 +5,16 @@ API маршрути за RTSP capture модул
 import os
 import time
 from fastapi import APIRouter, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, Response, JSONResponse, FileResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, Response, JSONResponse, FileResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 from .config import get_capture_config, update_capture_config
-from .capture import capture_frame, get_placeholder_image, start_capture_thread, stop_capture_thread
+from .capture import capture_frame, get_placeholder_image, start_capture_job, stop_capture_job
+from .stream import get_latest_jpeg_frame, get_readers_status
+from .mjpeg import get_broadcaster, get_broadcasters_status, MEDIA_TYPE as MJPEG_MEDIA_TYPE
 from utils.logger import setup_logger
+from utils.frame_store import get_frame_store, frame_response
+from utils.executors import run_io
 
 # Инициализиране на логър
 logger = setup_logger("rtsp_api")
@@ -37,21 +41,58 @@ async def rtsp_index(request: Request):
     })
 
 @router.get("/latest.jpg")
-async def latest_jpg():
-    """Връща последния запазен JPEG файл"""
+async def latest_jpg(request: Request):
+    """
+    Връща последния кадър от паметта
+    
+    С ETag и Last-Modified - при непроменен кадър отговорът е 304 без тяло.
+    """
     try:
         config = get_capture_config()
-        latest_path = os.path.join(config.save_dir, "latest.jpg")
         
-        if not os.path.exists(latest_path):
+        # Първо опитваме с най-новия кадър от постоянния RTSP четец
+        frame = await run_io(
+            get_latest_jpeg_frame, config.rtsp_url, quality=config.quality, max_age=config.frame_max_age
+        )
+        
+        # След това последният записан кадър (от диска само при първата заявка след рестарт)
+        if frame is None:
+            frame = await run_io(
+                get_frame_store().get_or_load, ("rtsp", "latest"), os.path.join(config.save_dir, "latest.jpg")
+            )
+        
+        if frame is None:
             # Връщаме placeholder изображение
             return Response(content=get_placeholder_image(), media_type="image/jpeg")
         
-        return FileResponse(latest_path, media_type="image/jpeg")
+        return frame_response(request, frame)
     except Exception as e:
         logger.error(f"Грешка при достъпване на последния кадър: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/stream.mjpg")
+async def stream_mjpg():
+    """
+    Поток на живо (MJPEG) от споделения RTSP четец
+    
+    Всички зрители получават едни и същи кодирани кадри - без собствена RTSP
+    връзка и без допълнително декодиране за всеки зрител.
+    """
+    config = get_capture_config()
+    broadcaster = get_broadcaster(
+        config.rtsp_url,
+        fps=config.stream_fps,
+        quality=config.quality,
+        max_age=config.frame_max_age,
+        buffer_size=config.buffer_size,
+        decode_interval=config.decode_interval
+    )
+    return StreamingResponse(
+        broadcaster.frames(),
+        media_type=MJPEG_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache, no-store"}
+    )
+
 @router.get("/info")
 async def rtsp_info():
     """Връща информация за последния запазен кадър"""
@@ -69,13 +110,16 @@ async def rtsp_info():
         "last_frame_path": config.last_frame_path,
         "rtsp_url": config.rtsp_url,
         "interval": config.interval,
-        "latest_url": "/rtsp/latest.jpg"
+        "latest_url": "/rtsp/latest.jpg",
+        "readers": get_readers_status(),
+        "streams": get_broadcasters_status()
     })
 
 @router.get("/capture")
 async def api_capture():
     """Принудително извличане на нов кадър"""
-    success = capture_frame()
+    # Прихващането чака кадър от камерата - извън event loop-а
+    success = await run_io(capture_frame)
     
     if success:
         return JSONResponse({
@@ -135,31 +179,31 @@ async def update_config(
 @router.get("/start")
 async def start_capture():
     """Стартира процеса за извличане на кадри"""
-    success = start_capture_thread()
+    success = start_capture_job()
     
     if success:
         return JSONResponse({
             "status": "ok",
-            "message": "Capture thread started successfully"
+            "message": "Capture job started successfully"
         })
     else:
         return JSONResponse({
             "status": "warning",
-            "message": "Capture thread is already running"
+            "message": "Capture job is already running"
         })
 
 @router.get("/stop")
 async def stop_capture():
     """Спира процеса за извличане на кадри"""
-    success = stop_capture_thread()
+    success = stop_capture_job()
     
     if success:
         return JSONResponse({
             "status": "ok",
-            "message": "Capture thread stopping"
+            "message": "Capture job stopped"
         })
     else:
         return JSONResponse({
-            "status": "error",
-            "message": "Failed to stop capture thread"
-        }, status_code=500)
\ No newline at end of file
+            "status": "warning",
+            "message": "Capture job is already stopped"
+        })
\ No newline at end of file
@@ -6,6 +6,9 @@ import os
 from pydantic import BaseModel
 from datetime import datetime
 
+# Име на задачата в планировчика
+SCHEDULER_JOB = "rtsp_capture"
+
 class RTSPCaptureConfig(BaseModel):
     """Конфигурационен модел за RTSP захващане"""
     rtsp_url: str
@@ -18,6 +21,10 @@ class RTSPCaptureConfig(BaseModel):
     last_frame_time: datetime = None
     status: str = "initializing"
     running: bool = True
+    buffer_size: int = 5  # Брой декодирани кадри в буфера на постоянния четец
+    decode_interval: float = 0.2  # Минимален интервал между декодираните кадри в секунди
+    frame_max_age: float = 5.0  # Максимална възраст на кадър от буфера в секунди
+    stream_fps: float = 5.0  # Максимален брой кадри в секунда на MJPEG потока на живо
 
 # Глобална конфигурация на модула
 _config = RTSPCaptureConfig(
@@ -26,7 +33,10 @@ _config = RTSPCaptureConfig(
     interval=int(os.getenv("INTERVAL", "60")),
     width=int(os.getenv("WIDTH", "640")),
     height=int(os.getenv("HEIGHT", "480")),
-    quality=int(os.getenv("QUALITY", "85"))
+    quality=int(os.getenv("QUALITY", "85")),
+    buffer_size=int(os.getenv("RTSP_BUFFER_SIZE", "5")),
+    decode_interval=float(os.getenv("RTSP_DECODE_INTERVAL", "0.2")),
+    stream_fps=float(os.getenv("RTSP_STREAM_FPS", "5"))
 )
 
 def get_capture_config() -> RTSPCaptureConfig:
@@ -0,0 +1,202 @@
+# Файл: modules/rtsp_capture/mjpeg.py
+"""
+MJPEG поток на живо (multipart/x-mixed-replace) от споделения RTSP четец
+
+За всяка камера има един разпращач: той взима новите кадри от постоянния
+RTSPStreamReader с ограничена честота, кодира всеки кадър веднъж (чрез
+хранилището на последните кадри, общо с /latest.jpg) и го разпраща на
+всички зрители. Зрителите никога не отварят собствена RTSP връзка, а
+цената на декодирането и кодирането не зависи от броя им.
+
+Всеки зрител има опашка с място за един кадър - ако клиентът не е
+изпратил предишния кадър, той се заменя с новия. Бавните клиенти губят
+кадри, но не бавят останалите и не трупат памет.
+
+Проверката за нов кадър е в event loop-а (само сравнение на времето на
+кадъра), а кодирането на новите кадри е в отделна нишка на потоците -
+потокът на живо не заема общия пул за блокиращи операции при всеки такт.
+
+При грешка (четец, кодиране) разпращачът не спира - опитва отново след
+нарастваща пауза (MJPEG_RETRY_DELAY, до MJPEG_RETRY_MAX_DELAY секунди), а
+зрителите остават свързани и получават кадрите, когато потокът се възстанови.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from utils.logger import setup_logger
+from .stream import get_stream_reader, peek_stream_reader, get_latest_jpeg_frame
+
+# Инициализиране на логър
+logger = setup_logger("rtsp_mjpeg")
+
+BOUNDARY = "frame"
+MEDIA_TYPE = f"multipart/x-mixed-replace; boundary={BOUNDARY}"
+
+RETRY_DELAY = float(os.getenv("MJPEG_RETRY_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("MJPEG_RETRY_MAX_DELAY", "30"))
+
+# Кодирането за потоците на живо - отделно от общия пул (run_io)
+_encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mjpeg")
+
+
+def _part(data: bytes) -> bytes:
+    """Една част от multipart потока"""
+    header = (
+        f"--{BOUNDARY}\r\n"
+        f"Content-Type: image/jpeg\r\n"
+        f"Content-Length: {len(data)}\r\n\r\n"
+    ).encode("ascii")
+    return header + data + b"\r\n"
+
+
+class MJPEGBroadcaster:
+    """
+    Разпращач на кадрите от една камера към зрителите
+
+    Задачата, която чете кадрите, работи само докато има зрители.
+    """
+
+    def __init__(
+        self,
+        rtsp_url: str,
+        fps: float = 5.0,
+        quality: int = 80,
+        max_age: float = 5.0,
+        **reader_kwargs
+    ):
+        self.rtsp_url = rtsp_url
+        self.fps = max(0.1, fps)
+        self.quality = quality
+        self.max_age = max_age
+        self.reader_kwargs = reader_kwargs
+
+        self._clients: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+
+        self.frames_broadcast = 0
+        self.frames_dropped = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.started_at: Optional[float] = None
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        """Потокът на един зрител - части от multipart отговора"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._clients.add(queue)
+        logger.info(f"Нов зрител на MJPEG потока ({len(self._clients)} общо)")
+
+        if self._task is None or self._task.done():
+            self.started_at = time.time()
+            self._task = asyncio.create_task(self._produce())
+
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._clients.discard(queue)
+            logger.info(f"Зрител напусна MJPEG потока ({len(self._clients)} остават)")
+            if not self._clients and self._task is not None:
+                self._task.cancel()
+                self._task = None
+
+    def _broadcast(self, part: bytes) -> None:
+        """Поставя кадъра в опашката на всеки зрител, като заменя неизпратения"""
+        for queue in self._clients:
+            if queue.full():
+                queue.get_nowait()
+                self.frames_dropped += 1
+            queue.put_nowait(part)
+            self.frames_broadcast += 1
+
+    async def _produce(self) -> None:
+        """Чете новите кадри с честота до fps и ги разпраща"""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.fps
+        last_version = None
+        failures = 0
+
+        try:
+            while self._clients:
+                started = loop.time()
+
+                try:
+                    # Споделеният четец (стартира се, ако още не работи)
+                    reader = peek_stream_reader(self.rtsp_url) or get_stream_reader(
+                        self.rtsp_url, **self.reader_kwargs
+                    )
+
+                    # Без нов кадър в четеца няма какво да се кодира
+                    latest = reader.get_latest_frame(max_age=self.max_age)
+                    if latest is not None and latest[0] != last_version:
+                        # Кодирането е извън event loop-а; всеки кадър се кодира веднъж
+                        stored = await loop.run_in_executor(
+                            _encoder, get_latest_jpeg_frame, self.rtsp_url, self.quality, self.max_age
+                        )
+                        if stored is not None and stored.version != last_version:
+                            last_version = stored.version
+                            self._broadcast(_part(stored.data))
+                    failures = 0
+                except Exception as e:
+                    # Зрителите остават свързани - опитваме отново след пауза
+                    failures += 1
+                    self.errors += 1
+                    self.last_error = str(e)
+                    delay = min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** (failures - 1))
+                    logger.error(f"Грешка в MJPEG потока: {str(e)} - нов опит след {delay:.1f} секунди")
+                    await asyncio.sleep(delay)
+                    continue
+
+                await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+        except asyncio.CancelledError:
+            pass
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за разпращача"""
+        return {
+            "viewers": len(self._clients),
+            "fps": self.fps,
+            "quality": self.quality,
+            "running": self._task is not None and not self._task.done(),
+            "frames_broadcast": self.frames_broadcast,
+            "frames_dropped": self.frames_dropped,
+            "errors": self.errors,
+            "last_error": self.last_error
+        }
+
+
+# Регистър с разпращачи - по един на RTSP URL
+_broadcasters: Dict[str, MJPEGBroadcaster] = {}
+_broadcasters_lock = threading.Lock()
+
+
+def get_broadcaster(rtsp_url: str, **kwargs) -> MJPEGBroadcaster:
+    """
+    Връща споделения разпращач за даден RTSP URL
+
+    Args:
+        rtsp_url: RTSP URL на камерата
+        **kwargs: Параметри за MJPEGBroadcaster (само при създаване)
+    """
+    with _broadcasters_lock:
+        broadcaster = _broadcasters.get(rtsp_url)
+        if broadcaster is None:
+            broadcaster = MJPEGBroadcaster(rtsp_url, **kwargs)
+            _broadcasters[rtsp_url] = broadcaster
+        return broadcaster
+
+
+def get_broadcasters_status() -> Dict[str, Dict[str, Any]]:
+    """Връща състоянието на всички разпращачи"""
+    with _broadcasters_lock:
+        broadcasters = list(_broadcasters.values())
+
+    # Адресът без потребителя и паролата
+    return {
+        broadcaster.rtsp_url.rsplit("@", 1)[-1]: broadcaster.get_status()
+        for broadcaster in broadcasters
+    }
@@ -0,0 +1,391 @@
+# Файл: modules/rtsp_capture/stream.py
+"""
+Постоянен RTSP четец с буфер за последните декодирани кадри
+
+Вместо при всяко прихващане да се отваря нов cv2.VideoCapture (RTSP handshake
+и изчакване на ключов кадър отнемат секунди), за всяка камера се поддържа една
+дълготрайна нишка, която непрекъснато извиква grab() и пази последните
+няколко декодирани кадъра в ограничен кръгов буфер.
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Tuple, List
+
+import cv2
+import numpy as np
+
+from utils.logger import setup_logger
+from utils.frame_store import StoredFrame, get_frame_store
+
+# Инициализиране на логър
+logger = setup_logger("rtsp_stream")
+
+# Кадър в буфера: (време на прихващане, пореден номер, изображение)
+BufferedFrame = Tuple[float, int, np.ndarray]
+
+
+class RTSPStreamReader:
+    """
+    Дълготраен четец на RTSP поток в отделна нишка.
+
+    Нишката непрекъснато изпразва потока с grab(), за да не остават стари
+    кадри в буфера на декодера, а декодира (retrieve) най-много веднъж на
+    decode_interval секунди. При загуба на връзката се свързва отново с
+    експоненциално нарастващо изчакване.
+    """
+
+    def __init__(
+        self,
+        rtsp_url: str,
+        buffer_size: int = 5,
+        decode_interval: float = 0.2,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        max_grab_failures: int = 25
+    ):
+        self.rtsp_url = rtsp_url
+        self.buffer_size = max(1, buffer_size)
+        self.decode_interval = max(0.0, decode_interval)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_grab_failures = max_grab_failures
+
+        self._frames: deque = deque(maxlen=self.buffer_size)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.frame_count = 0
+        self.connected = False
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+        self.started_at: Optional[float] = None
+
+    def start(self) -> bool:
+        """
+        Стартира нишката за четене, ако вече не работи
+
+        Returns:
+            bool: True ако нишката е стартирана сега
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return False
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"rtsp-reader-{id(self):x}",
+            daemon=True
+        )
+        self.started_at = time.time()
+        logger.info(f"Стартиране на RTSP четец за {self._masked_url()}")
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Спира нишката за четене"""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.connected = False
+        logger.info(f"RTSP четецът е спрян за {self._masked_url()}")
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_latest_frame(self, max_age: Optional[float] = None) -> Optional[Tuple[float, np.ndarray]]:
+        """
+        Връща най-новия декодиран кадър от буфера
+
+        Args:
+            max_age: Максимална възраст на кадъра в секунди (None - без ограничение)
+
+        Returns:
+            Optional[Tuple[float, np.ndarray]]: (време на прихващане, кадър) или None
+        """
+        with self._condition:
+            if not self._frames:
+                return None
+            frame_time, _, frame = self._frames[-1]
+
+        if max_age is not None and time.time() - frame_time > max_age:
+            return None
+
+        return frame_time, frame
+
+    def get_frames(self, count: Optional[int] = None) -> List[Tuple[float, np.ndarray]]:
+        """
+        Връща последните кадри от буфера (от най-стария към най-новия)
+
+        Args:
+            count: Брой кадри (None - всички в буфера)
+        """
+        with self._condition:
+            frames = list(self._frames)
+
+        if count is not None:
+            frames = frames[-count:]
+
+        return [(frame_time, frame) for frame_time, _, frame in frames]
+
+    def wait_for_frame(
+        self,
+        after: Optional[float] = None,
+        timeout: float = 10.0
+    ) -> Optional[Tuple[float, np.ndarray]]:
+        """
+        Изчаква кадър, прихванат след определен момент
+
+        Args:
+            after: Момент (time.time()), след който трябва да е прихванат кадърът.
+                   По подразбиране - сега, т.е. чака следващия декодиран кадър.
+            timeout: Максимално време за изчакване в секунди
+
+        Returns:
+            Optional[Tuple[float, np.ndarray]]: (време на прихващане, кадър) или None
+        """
+        if after is None:
+            after = time.time()
+
+        # Ако нишката не работи, я стартираме
+        self.start()
+
+        deadline = time.time() + timeout
+        with self._condition:
+            while not self._stop_event.is_set():
+                if self._frames and self._frames[-1][0] >= after:
+                    frame_time, _, frame = self._frames[-1]
+                    return frame_time, frame
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+        return None
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за състоянието на четеца"""
+        with self._condition:
+            last_frame_time = self._frames[-1][0] if self._frames else None
+            buffered = len(self._frames)
+
+        return {
+            "rtsp_url": self._masked_url(),
+            "running": self.running,
+            "connected": self.connected,
+            "frame_count": self.frame_count,
+            "buffered_frames": buffered,
+            "last_frame_time": last_frame_time,
+            "last_frame_age": (
+                time.time() - last_frame_time if last_frame_time else None
+            ),
+            "reconnects": self.reconnects,
+            "last_error": self.last_error
+        }
+
+    def _masked_url(self) -> str:
+        """Връща URL адреса без паролата (за логване)"""
+        if "@" not in self.rtsp_url or "://" not in self.rtsp_url:
+            return self.rtsp_url
+        scheme, rest = self.rtsp_url.split("://", 1)
+        credentials, host = rest.rsplit("@", 1)
+        user = credentials.split(":", 1)[0]
+        return f"{scheme}://{user}:***@{host}"
+
+    def _open(self) -> Optional[cv2.VideoCapture]:
+        """Отваря RTSP потока"""
+        cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
+
+        if not cap.isOpened():
+            cap.release()
+            return None
+
+        # Минимален буфер в декодера - искаме винаги най-новия кадър
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _run(self) -> None:
+        """Основен цикъл на нишката - свързване, четене, повторно свързване"""
+        delay = self.reconnect_delay
+
+        while not self._stop_event.is_set():
+            cap = self._open()
+
+            if cap is None:
+                self.connected = False
+                self.last_error = "Не може да се отвори RTSP потока"
+                logger.warning(
+                    f"{self.last_error} ({self._masked_url()}), "
+                    f"нов опит след {delay:.1f} секунди"
+                )
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            logger.info(f"Свързан с RTSP поток {self._masked_url()}")
+            self.connected = True
+            self.last_error = None
+            delay = self.reconnect_delay
+
+            try:
+                self._read_loop(cap)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Грешка при четене на RTSP поток: {str(e)}")
+            finally:
+                cap.release()
+                self.connected = False
+
+            if not self._stop_event.is_set():
+                self.reconnects += 1
+                logger.warning(
+                    f"Връзката с RTSP потока е загубена, повторно свързване "
+                    f"след {delay:.1f} секунди"
+                )
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _read_loop(self, cap: cv2.VideoCapture) -> None:
+        """Непрекъснато изпразва потока и декодира кадри в буфера"""
+        failures = 0
+        last_decode = 0.0
+
+        while not self._stop_event.is_set():
+            if not cap.grab():
+                failures += 1
+                if failures >= self.max_grab_failures:
+                    self.last_error = f"{failures} последователни неуспешни grab()"
+                    return
+                time.sleep(0.05)
+                continue
+
+            failures = 0
+            now = time.time()
+
+            # Декодираме само при нужда - grab() е евтин, retrieve() не е
+            if now - last_decode < self.decode_interval:
+                continue
+
+            ret, frame = cap.retrieve()
+            if not ret or frame is None:
+                continue
+
+            last_decode = now
+            with self._condition:
+                self.frame_count += 1
+                self._frames.append((now, self.frame_count, frame))
+                self._condition.notify_all()
+
+
+# Регистър с четци - по един на RTSP URL
+_readers: Dict[str, RTSPStreamReader] = {}
+_readers_lock = threading.Lock()
+
+
+def get_stream_reader(rtsp_url: str, **kwargs) -> RTSPStreamReader:
+    """
+    Връща споделения четец за даден RTSP URL, като го създава и стартира при нужда
+
+    Args:
+        rtsp_url: RTSP URL на камерата
+        **kwargs: Допълнителни параметри за RTSPStreamReader (само при създаване)
+
+    Returns:
+        RTSPStreamReader: Стартиран четец
+    """
+    with _readers_lock:
+        reader = _readers.get(rtsp_url)
+        if reader is None:
+            reader = RTSPStreamReader(rtsp_url, **kwargs)
+            _readers[rtsp_url] = reader
+
+    reader.start()
+    return reader
+
+
+def peek_stream_reader(rtsp_url: str) -> Optional[RTSPStreamReader]:
+    """Връща четеца за даден URL само ако вече работи (без да го стартира)"""
+    with _readers_lock:
+        reader = _readers.get(rtsp_url)
+
+    if reader is not None and reader.running:
+        return reader
+    return None
+
+
+def get_latest_jpeg_frame(
+    rtsp_url: str,
+    quality: int = 85,
+    max_age: Optional[float] = None
+) -> Optional[StoredFrame]:
+    """
+    Връща най-новия кадър от работещ четец, кодиран като JPEG, с ETag
+
+    Кадърът се кодира веднъж - повторните заявки за същия кадър получават
+    вече кодираните байтове от хранилището на последните кадри.
+
+    Args:
+        rtsp_url: RTSP URL на камерата
+        quality: JPEG качество (0-100)
+        max_age: Максимална възраст на кадъра в секунди
+
+    Returns:
+        Optional[StoredFrame]: Кадърът или None ако няма достатъчно нов кадър
+    """
+    reader = peek_stream_reader(rtsp_url)
+    if reader is None:
+        return None
+
+    latest = reader.get_latest_frame(max_age=max_age)
+    if latest is None:
+        return None
+
+    frame_time, frame = latest
+
+    def encode() -> Optional[bytes]:
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if ok else None
+
+    # По един кадър за камера и качество - /latest.jpg и MJPEG потокът го споделят
+    return get_frame_store().get_versioned(
+        ("live", (reader._masked_url(), quality)), frame_time, encode, last_modified=frame_time
+    )
+
+
+def get_latest_jpeg(
+    rtsp_url: str,
+    quality: int = 85,
+    max_age: Optional[float] = None
+) -> Optional[bytes]:
+    """
+    Връща най-новия кадър от работещ четец, кодиран като JPEG
+
+    Returns:
+        Optional[bytes]: JPEG байтове или None ако няма достатъчно нов кадър
+    """
+    stored = get_latest_jpeg_frame(rtsp_url, quality=quality, max_age=max_age)
+    return stored.data if stored is not None else None
+
+
+def get_readers_status() -> Dict[str, Dict[str, Any]]:
+    """Връща състоянието на всички четци"""
+    with _readers_lock:
+        readers = list(_readers.values())
+
+    return {reader._masked_url(): reader.get_status() for reader in readers}
+
+
+def stop_all_readers() -> None:
+    """Спира всички четци (при спиране на приложението)"""
+    with _readers_lock:
+        readers = list(_readers.values())
+        _readers.clear()
+
+    for reader in readers:
+        reader.stop()
@@ -0,0 +1,35 @@
+# Файл: test_anthropic_api.py
+"""
+Тестове за общите помощни функции за Anthropic Messages API
+"""
+
+from utils.anthropic_api import cached_system_prompt, extract_json_object, extract_usage, record_usage, get_usage_stats
+
+
+def test_cached_system_prompt_uses_ephemeral_cache():
+    system = cached_system_prompt("инструкции")
+
+    assert system == [{"type": "text", "text": "инструкции", "cache_control": {"type": "ephemeral"}}]
+
+
+def test_extract_json_object_from_surrounding_text():
+    content = 'Ето анализа:\n{"cloud_coverage": 40, "cloud_type": "кумулус"}\nКрай.'
+
+    assert extract_json_object(content) == {"cloud_coverage": 40, "cloud_type": "кумулус"}
+
+
+def test_extract_json_object_rejects_invalid_content():
+    assert extract_json_object("Няма JSON в отговора") is None
+    assert extract_json_object('{"cloud_coverage": 40,') is None
+    assert extract_json_object("} обратен ред {") is None
+
+
+def test_usage_stats_count_input_and_output_tokens():
+    usage = extract_usage({"usage": {"input_tokens": 100, "cache_read_input_tokens": 0, "output_tokens": 50}})
+
+    assert usage == {"input_tokens": 100, "output_tokens": 50}
+
+    record_usage("test_usage", usage)
+    record_usage("test_usage", extract_usage({"usage": {"input_tokens": 20}}))
+    assert get_usage_stats("test_usage") == {"requests": 2, "input_tokens": 120, "output_tokens": 50}
+    assert get_usage_stats("missing")["requests"] == 0
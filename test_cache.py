@@ -0,0 +1,90 @@
+# Файл: test_cache.py
+"""
+Тестове за кеша с TTL и фоново опресняване (пресети, колекции)
+"""
+
+import asyncio
+
+from utils.cache import AsyncTTLCache
+
+
+class CountingLoader:
+    """Зареждаща функция, която връща поредни стойности"""
+
+    def __init__(self, delay: float = 0.0, values=None):
+        self.delay = delay
+        self.values = list(values) if values is not None else None
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.values is not None:
+            return self.values.pop(0)
+        return {"version": self.calls}
+
+
+def test_fresh_value_is_served_from_cache():
+    loader = CountingLoader()
+    cache = AsyncTTLCache(loader, ttl=60)
+
+    async def scenario():
+        return [await cache.get() for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [{"version": 1}] * 3
+    assert loader.calls == 1
+    assert cache.hits == 2
+
+
+def test_concurrent_misses_share_one_load():
+    loader = CountingLoader(delay=0.05)
+    cache = AsyncTTLCache(loader, ttl=60)
+
+    async def scenario():
+        return await asyncio.gather(*[cache.get() for _ in range(5)])
+
+    assert asyncio.run(scenario()) == [{"version": 1}] * 5
+    assert loader.calls == 1
+
+
+def test_stale_value_returned_while_refreshing():
+    loader = CountingLoader(delay=0.05)
+    cache = AsyncTTLCache(loader, ttl=0.01, stale_ttl=60)
+
+    async def scenario():
+        first = await cache.get()
+        await asyncio.sleep(0.02)
+        stale = await cache.get()
+        # Опресняването тече във фона
+        await asyncio.sleep(0.1)
+        return first, stale, cache.peek()
+
+    first, stale, refreshed = asyncio.run(scenario())
+    assert first == stale == {"version": 1}
+    assert refreshed == {"version": 2}
+    assert cache.stale_hits == 1
+
+
+def test_empty_result_keeps_previous_value():
+    loader = CountingLoader(values=[{"a": 1}, {}])
+    cache = AsyncTTLCache(loader, ttl=60)
+
+    async def scenario():
+        await cache.get()
+        return await cache.get(force_refresh=True)
+
+    assert asyncio.run(scenario()) == {"a": 1}
+    assert cache.last_error == "Празен резултат"
+
+
+def test_invalidate_forces_reload():
+    loader = CountingLoader()
+    cache = AsyncTTLCache(loader, ttl=60)
+
+    async def scenario():
+        await cache.get()
+        cache.invalidate()
+        return await cache.get()
+
+    assert asyncio.run(scenario()) == {"version": 2}
+    assert loader.calls == 2
@@ -0,0 +1,140 @@
+# Файл: test_command_queue.py
+"""
+Тестове за опашката с PTZ команди - обединяване, lease и обща опашка за камерата
+"""
+
+import asyncio
+import importlib.util
+
+import pytest
+
+from utils.command_queue import PTZBusyError, PTZCommandQueue, CameraCommands, get_camera_queue
+
+
+class RecordingMover:
+    """Функция за преместване, която записва командите и "движи" камерата за delay секунди"""
+
+    def __init__(self, delay: float = 0.1):
+        self.delay = delay
+        self.moves = []
+
+    async def __call__(self, position_id: int) -> bool:
+        self.moves.append(position_id)
+        await asyncio.sleep(self.delay)
+        return True
+
+
+def test_repeated_moves_are_coalesced():
+    mover = RecordingMover()
+    queue = PTZCommandQueue("test_coalesce", mover)
+
+    async def scenario():
+        return await asyncio.gather(*[queue.move(2) for _ in range(5)])
+
+    results = asyncio.run(scenario())
+
+    assert results == [True] * 5
+    # Първата команда тече, останалите четири се обединяват с нея
+    assert mover.moves == [2]
+    assert queue.coalesced == 4
+    assert queue.last_position == 2
+
+
+def test_lease_holds_back_other_moves():
+    mover = RecordingMover(delay=0.05)
+    queue = PTZCommandQueue("test_lease", mover)
+    order = []
+
+    async def cycle():
+        async with queue.lease("capture_cycle") as lease:
+            order.append("lease")
+            for position_id in (1, 2, 3):
+                await queue.move(position_id, lease=lease)
+            order.append("release")
+
+    async def manual():
+        await asyncio.sleep(0.02)
+        await queue.move(4)
+        order.append("manual")
+
+    async def scenario():
+        await asyncio.gather(cycle(), manual())
+
+    asyncio.run(scenario())
+
+    # Ръчното преместване изчаква целия цикъл
+    assert mover.moves == [1, 2, 3, 4]
+    assert order == ["lease", "release", "manual"]
+
+
+def test_busy_camera_times_out():
+    queue = PTZCommandQueue("test_busy", RecordingMover(delay=0.01))
+
+    async def scenario():
+        async with queue.lease("capture_cycle"):
+            with pytest.raises(PTZBusyError):
+                await queue.move(1, timeout=0.1)
+
+    asyncio.run(scenario())
+
+
+def test_controllers_share_one_queue_per_camera():
+    onvif = RecordingMover(delay=0.05)
+    imou = RecordingMover(delay=0.05)
+    simple = CameraCommands(get_camera_queue("10.0.0.5"), onvif)
+    control = CameraCommands(get_camera_queue("10.0.0.5 "), imou)
+    other = CameraCommands(get_camera_queue("10.0.0.6"), onvif)
+
+    assert simple.queue is control.queue
+    assert other.queue is not simple.queue
+
+    async def scenario():
+        async with control.lease("capture_cycle") as lease:
+            manual = asyncio.ensure_future(simple.move(4))
+            await asyncio.sleep(0.02)
+            await control.move(1, lease=lease)
+            # Ръчната команда през другия модул още чака lease-а
+            assert not manual.done()
+        return await manual
+
+    assert asyncio.run(scenario())
+    assert imou.moves == [1]
+    assert onvif.moves == [4]
+    assert simple.last_position == 4
+
+
+def _load_config(path):
+    """Зарежда config.py на модул без __init__.py на пакета (той свързва камерата)"""
+    spec = importlib.util.spec_from_file_location("ptz_config_test", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.get_ptz_config()
+
+
+def test_modules_share_queue_by_camera_id_not_address(monkeypatch):
+    monkeypatch.setenv("PTZ_CAMERA_ID", "Roof")
+    monkeypatch.delenv("PTZ_CAMERA_IP", raising=False)
+    simple = _load_config("modules/ptz_simple/config.py")
+    control = _load_config("modules/ptz_control/config.py")
+
+    # Модулите стигат до камерата на различни адреси, опашката е една
+    assert simple.camera_ip != control.camera_ip
+    assert get_camera_queue(simple.camera_id) is get_camera_queue(control.camera_id)
+    assert get_camera_queue(simple.camera_id).name == "roof"
+
+
+def test_same_position_from_different_movers_is_not_coalesced():
+    first = RecordingMover()
+    second = RecordingMover()
+    queue = get_camera_queue("10.0.0.7")
+
+    async def scenario():
+        await asyncio.gather(
+            CameraCommands(queue, first).move(3),
+            CameraCommands(queue, second).move(3)
+        )
+
+    asyncio.run(scenario())
+
+    assert first.moves == [3]
+    assert second.moves == [3]
@@ -0,0 +1,79 @@
+# Файл: test_daylight.py
+"""
+Тестове за астрономическия график на светлата част от денонощието
+"""
+
+from datetime import date, datetime, timezone
+
+from utils.daylight import DaylightScheduler, sun_times
+
+OBZOR = (42.8199, 27.8800)
+
+
+def _utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def _minutes(moment: datetime) -> float:
+    return moment.hour * 60 + moment.minute + moment.second / 60
+
+
+def test_sun_times_for_obzor():
+    sunrise, sunset = sun_times(date(2024, 6, 21), *OBZOR)
+
+    # Лятно слънцестоене - изгрев ~05:31 и залез ~20:52 местно (UTC+3)
+    assert abs(_minutes(sunrise) - (2 * 60 + 31)) < 5
+    assert abs(_minutes(sunset) - (17 * 60 + 52)) < 5
+
+
+def test_polar_day_has_no_sunrise():
+    assert sun_times(date(2024, 6, 21), 78.2, 15.6) == (None, None)
+
+    scheduler = DaylightScheduler(78.2, 15.6, twilight="official")
+    assert scheduler.is_daylight(_utc(2024, 6, 21, 23, 0))
+    assert not scheduler.is_daylight(_utc(2024, 12, 21, 12, 0))
+
+
+def test_local_offset_follows_eu_dst():
+    scheduler = DaylightScheduler(*OBZOR)
+
+    assert scheduler.to_local(_utc(2024, 1, 15, 10, 0)) == datetime(2024, 1, 15, 12, 0)
+    assert scheduler.to_local(_utc(2024, 7, 15, 10, 0)) == datetime(2024, 7, 15, 13, 0)
+    # Преминаването е в 01:00 UTC в последната неделя на март
+    assert scheduler.to_local(_utc(2024, 3, 31, 0, 59)) == datetime(2024, 3, 31, 2, 59)
+    assert scheduler.to_local(_utc(2024, 3, 31, 1, 0)) == datetime(2024, 3, 31, 4, 0)
+
+
+def test_fixed_window_uses_local_hours():
+    scheduler = DaylightScheduler(*OBZOR, mode="fixed", fixed_start_hour=6, fixed_end_hour=21)
+
+    # 06:00 местно лятно време е 03:00 UTC
+    assert not scheduler.is_daylight(_utc(2024, 7, 15, 2, 59))
+    assert scheduler.is_daylight(_utc(2024, 7, 15, 3, 0))
+    assert not scheduler.is_daylight(_utc(2024, 7, 15, 18, 0))
+
+
+def test_suspend_waits_until_dawn():
+    scheduler = DaylightScheduler(*OBZOR, mode="fixed", night_mode="suspend")
+    night = _utc(2024, 7, 15, 0, 0)
+
+    assert not scheduler.should_run(night)
+    # До 03:00 UTC
+    assert scheduler.next_run_delay(300, night) == 3 * 3600
+    assert scheduler.next_run_delay(300, _utc(2024, 7, 15, 12, 0)) == 300
+
+
+def test_thin_mode_runs_rarely_at_night():
+    scheduler = DaylightScheduler(*OBZOR, mode="fixed", night_mode="thin", night_interval=3600)
+
+    assert scheduler.should_run(_utc(2024, 7, 15, 0, 0))
+    assert scheduler.next_run_delay(300, _utc(2024, 7, 15, 0, 0)) == 3600
+    # Близо до зазоряване не се прескача началото на деня
+    assert scheduler.next_run_delay(300, _utc(2024, 7, 15, 2, 30)) == 1800
+
+
+def test_night_mode_off_ignores_daylight():
+    scheduler = DaylightScheduler(*OBZOR, night_mode="off")
+
+    assert scheduler.should_run(_utc(2024, 7, 15, 0, 0))
+    assert scheduler.next_run_delay(300, _utc(2024, 7, 15, 0, 0)) == 300
@@ -0,0 +1,72 @@
+# Файл: test_event_bus.py
+"""
+Тестове за шината за събития - филтриране, Last-Event-ID и бавни абонати
+"""
+
+import asyncio
+import threading
+
+from utils.event_bus import EventBus
+
+
+def test_subscriber_receives_only_wanted_types():
+    bus = EventBus()
+
+    async def scenario():
+        subscription = bus.subscribe(types=["analysis"])
+        bus.publish("frame", {"position_id": 1})
+        bus.publish("analysis", {"module": "multi"})
+        return await subscription.get(timeout=0.1), await subscription.get(timeout=0.05)
+
+    event, nothing = asyncio.run(scenario())
+
+    assert event.type == "analysis"
+    assert event.data == {"module": "multi"}
+    assert nothing is None
+
+
+def test_last_event_id_replays_missed_events():
+    bus = EventBus(replay_size=3)
+    for i in range(5):
+        bus.publish("frame", {"n": i})
+
+    async def scenario():
+        subscription = bus.subscribe(last_event_id=3)
+        return [(await subscription.get(timeout=0.1)).data["n"] for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [3, 4]
+
+
+def test_slow_subscriber_drops_oldest_events():
+    bus = EventBus(queue_size=2)
+
+    async def scenario():
+        subscription = bus.subscribe()
+        for i in range(5):
+            bus.publish("frame", {"n": i})
+        events = [await subscription.get(timeout=0.1) for _ in range(2)]
+        return subscription, [event.data["n"] for event in events]
+
+    subscription, received = asyncio.run(scenario())
+
+    assert received == [3, 4]
+    assert subscription.dropped == 3
+
+
+def test_publish_from_another_thread():
+    bus = EventBus()
+
+    async def scenario():
+        subscription = bus.subscribe()
+        thread = threading.Thread(target=bus.publish, args=("frame", {"camera": "rtsp"}))
+        thread.start()
+        event = await subscription.get(timeout=1.0)
+        thread.join()
+        subscription.close()
+        return event
+
+    event = asyncio.run(scenario())
+
+    assert event.data == {"camera": "rtsp"}
+    assert event.to_sse() == f'id: {event.id}\nevent: frame\ndata: {{"camera": "rtsp"}}\n\n'
+    assert bus.get_status()["subscribers"] == 0
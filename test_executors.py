@@ -0,0 +1,72 @@
+# Файл: test_executors.py
+"""
+Тестове за пуловете за блокираща работа и изчисления
+"""
+
+import os
+import time
+import asyncio
+import threading
+
+import pytest
+
+import utils.executors as executors
+
+
+@pytest.fixture
+def fresh_cpu_pool(monkeypatch):
+    """Пулът от процеси в началното състояние (още не е създаден)"""
+    monkeypatch.setattr(executors, "_cpu_executor", None)
+    monkeypatch.setattr(executors, "_cpu_fallback", False)
+    monkeypatch.setattr(executors, "CPU_WORKERS", 1)
+    yield
+    executors._reset_cpu_executor()
+
+
+def test_pool_started_before_threads_runs_in_another_process(fresh_cpu_pool):
+    if threading.active_count() > 1:
+        pytest.skip("Тестовият процес вече има нишки")
+
+    executor = executors.start_cpu_executor()
+
+    assert executor is not executors.get_io_executor()
+    assert asyncio.run(executors.run_cpu(os.getpid)) != os.getpid()
+
+
+def test_no_fork_after_threads_are_running(fresh_cpu_pool):
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        assert executors.get_cpu_executor() is executors.get_io_executor()
+        # Решението се запомня - не се опитва при всяко извикване
+        assert executors._cpu_fallback
+        assert asyncio.run(executors.run_cpu(os.getpid)) == os.getpid()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_run_cpu_timeout(fresh_cpu_pool, monkeypatch):
+    monkeypatch.setattr(executors, "_cpu_fallback", True)
+    monkeypatch.setattr(executors, "CPU_TASK_TIMEOUT", 0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(executors.run_cpu(time.sleep, 0.3))
+
+
+def test_loop_lag_monitor_records_blocking():
+    monitor = executors.LoopLagMonitor("test", interval=0.01, warning=0.05)
+
+    async def scenario():
+        task = asyncio.ensure_future(monitor.run())
+        await asyncio.sleep(0.02)
+        # Блокиращ код в event loop-а
+        time.sleep(0.1)
+        await asyncio.sleep(0.03)
+        task.cancel()
+
+    asyncio.run(scenario())
+
+    assert monitor.max >= 0.05
+    assert monitor.slow >= 1
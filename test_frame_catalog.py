@@ -0,0 +1,78 @@
+# Файл: test_frame_catalog.py
+"""
+Тестове за каталога на прихванатите кадри
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.frame_catalog import FrameCatalog
+
+START = datetime(2024, 7, 15, 6, 0)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = FrameCatalog(str(tmp_path / "frames.db"))
+    for i in range(6):
+        for position_id in (1, 2):
+            catalog.add(
+                f"/archive/position_{position_id}_{i}.jpg", "ptz", position_id,
+                START + timedelta(minutes=30 * i), image_data=b"x" * (100 + i)
+            )
+    return catalog
+
+
+def test_add_is_idempotent_per_path(catalog):
+    catalog.add("/archive/position_1_0.jpg", "ptz", 1, START, image_data=b"new")
+
+    assert catalog.count() == 12
+    frame = catalog.page("ptz", position_id=1, end=START + timedelta(minutes=1))[0][0]
+    assert frame["size"] == 3
+
+
+def test_latest_and_closest(catalog):
+    assert catalog.latest("ptz", 2)["captured_at"] == (START + timedelta(minutes=150)).isoformat(timespec="microseconds")
+
+    # 06:40 е по-близо до 06:30, 06:50 - до 07:00
+    assert catalog.closest("ptz", 1, START + timedelta(minutes=40))["path"] == "/archive/position_1_1.jpg"
+    assert catalog.closest("ptz", 1, START + timedelta(minutes=50))["path"] == "/archive/position_1_2.jpg"
+    # Извън архива - крайният кадър
+    assert catalog.closest("ptz", 1, START - timedelta(days=1))["path"] == "/archive/position_1_0.jpg"
+    assert catalog.closest("ptz", 3, START) is None
+
+
+def test_page_with_cursor(catalog):
+    first, cursor = catalog.page("ptz", position_id=1, limit=4)
+    second, last = catalog.page("ptz", position_id=1, limit=4, cursor=cursor)
+
+    assert last is None
+    assert [frame["path"][-5] for frame in first + second] == ["5", "4", "3", "2", "1", "0"]
+
+
+def test_between_and_summary(catalog):
+    frames = catalog.between("ptz", START + timedelta(minutes=30), START + timedelta(minutes=90), position_ids=[2])
+
+    assert [frame["path"] for frame in frames] == ["/archive/position_2_1.jpg", "/archive/position_2_2.jpg"]
+    assert catalog.summary("ptz")[1] == {
+        "frames": 6,
+        "size_bytes": sum(100 + i for i in range(6)),
+        "last_captured_at": (START + timedelta(minutes=150)).isoformat(timespec="microseconds")
+    }
+
+
+def test_sync_directory_adds_only_new_frames(tmp_path):
+    catalog = FrameCatalog(str(tmp_path / "frames.db"))
+    root = tmp_path / "ptz_captures"
+    (root / "position_3").mkdir(parents=True)
+    for name in ("position_3_20240715_060000.jpg", "position_3_20240715_063000.jpg", "latest.jpg"):
+        (root / "position_3" / name).write_bytes(b"jpeg")
+
+    assert catalog.sync_directory(str(root), "ptz") == 2
+    assert catalog.sync_directory(str(root), "ptz") == 0
+
+    frame = catalog.latest("ptz", 3)
+    assert frame["captured_at"] == "2024-07-15T06:30:00.000000"
+    assert frame["path"] == os.path.join(str(root), "position_3", "position_3_20240715_063000.jpg")
@@ -0,0 +1,97 @@
+# Файл: test_frame_store.py
+"""
+Тестове за последните кадри в паметта - ETag, Last-Modified и 304 Not Modified
+"""
+
+from email.utils import formatdate
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from utils.frame_store import LatestFrameStore, frame_response
+
+MODIFIED = 1721023200.0
+
+
+def _client(store: LatestFrameStore) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/latest.jpg")
+    async def latest(request: Request):
+        return frame_response(request, store.get(("ptz", 1)))
+
+    return TestClient(app)
+
+
+def test_etag_and_if_none_match():
+    store = LatestFrameStore()
+    frame = store.put(("ptz", 1), b"jpeg-1", last_modified=MODIFIED)
+    client = _client(store)
+
+    response = client.get("/latest.jpg")
+    assert response.status_code == 200
+    assert response.content == b"jpeg-1"
+    assert response.headers["etag"] == frame.etag
+    assert response.headers["cache-control"] == "no-cache"
+
+    assert client.get("/latest.jpg", headers={"If-None-Match": frame.etag}).status_code == 304
+    assert client.get("/latest.jpg", headers={"If-None-Match": f'"other", W/{frame.etag}'}).status_code == 304
+
+    # Нов кадър - старият ETag вече не съвпада
+    store.put(("ptz", 1), b"jpeg-2", last_modified=MODIFIED + 60)
+    response = client.get("/latest.jpg", headers={"If-None-Match": frame.etag})
+    assert response.status_code == 200
+    assert response.content == b"jpeg-2"
+
+
+def test_if_modified_since():
+    store = LatestFrameStore()
+    store.put(("ptz", 1), b"jpeg-1", last_modified=MODIFIED + 0.5)
+    client = _client(store)
+
+    assert client.get("/latest.jpg", headers={"If-Modified-Since": formatdate(MODIFIED, usegmt=True)}).status_code == 304
+    assert client.get("/latest.jpg", headers={"If-Modified-Since": formatdate(MODIFIED - 1, usegmt=True)}).status_code == 200
+    assert client.get("/latest.jpg", headers={"If-Modified-Since": "invalid"}).status_code == 200
+
+
+def test_if_none_match_takes_precedence():
+    store = LatestFrameStore()
+    store.put(("ptz", 1), b"jpeg-1", last_modified=MODIFIED)
+    client = _client(store)
+
+    response = client.get("/latest.jpg", headers={
+        "If-None-Match": '"other"',
+        "If-Modified-Since": formatdate(MODIFIED, usegmt=True)
+    })
+    assert response.status_code == 200
+
+
+def test_get_versioned_encodes_once_per_version():
+    store = LatestFrameStore()
+    calls = []
+
+    def encode():
+        calls.append(1)
+        return f"jpeg-{len(calls)}".encode()
+
+    first = store.get_versioned(("rtsp", "latest"), 1.0, encode)
+    again = store.get_versioned(("rtsp", "latest"), 1.0, encode)
+    newer = store.get_versioned(("rtsp", "latest"), 2.0, encode)
+
+    assert again is first
+    assert newer.data == b"jpeg-2"
+    assert len(calls) == 2
+    assert store.get_versioned(("rtsp", "other"), 1.0, lambda: None) is None
+
+
+def test_get_or_load_reads_file_once(tmp_path):
+    path = tmp_path / "latest.jpg"
+    path.write_bytes(b"from-disk")
+    store = LatestFrameStore()
+
+    frame = store.get_or_load(("ptz", 2), str(path))
+    path.write_bytes(b"changed")
+
+    assert frame.data == b"from-disk"
+    assert store.get_or_load(("ptz", 2), str(path)) is frame
+    assert store.get_or_load(("ptz", 3), str(tmp_path / "missing.jpg")) is None
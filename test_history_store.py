@@ -0,0 +1,78 @@
+# Файл: test_history_store.py
+"""
+Тестове за историята на анализите в SQLite - страници с курсор и четене на порции
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.history_store import HistoryStore, encode_cursor, decode_cursor
+
+START = datetime(2024, 7, 15, 6, 0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), retention_days=0)
+    store.add_many("multi", [
+        (
+            START + timedelta(minutes=5 * i),
+            {"avg_cloud_coverage": float(i)},
+            {1: {"cloud_coverage": float(i)}, 2: {"cloud_coverage": float(i) + 0.5}}
+        )
+        for i in range(25)
+    ])
+    return store
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2024-07-15T06:00:00.000000", 42)
+    assert decode_cursor(cursor) == ("2024-07-15T06:00:00.000000", 42)
+
+    with pytest.raises(ValueError):
+        decode_cursor("42")
+
+
+def test_pages_cover_history_without_gaps(store):
+    seen, cursor = [], None
+    while True:
+        records, cursor = store.page("multi", limit=10, cursor=cursor)
+        # Всяка страница е в хронологичен ред
+        assert [r["timestamp"] for r in records] == sorted(r["timestamp"] for r in records)
+        seen = records + seen
+        if cursor is None:
+            break
+
+    assert [r["data"]["avg_cloud_coverage"] for r in seen] == [float(i) for i in range(25)]
+    assert seen[0]["positions"][2] == {"cloud_coverage": 0.5, "timestamp": seen[0]["timestamp"]}
+
+
+def test_same_timestamp_is_split_by_id(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), retention_days=0)
+    store.add_many("single", [(START, {"cloud_coverage": float(i)}, None) for i in range(5)])
+
+    first, cursor = store.page("single", limit=3)
+    second, last = store.page("single", limit=3, cursor=cursor)
+
+    assert last is None
+    values = [r["data"]["cloud_coverage"] for r in second + first]
+    assert values == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_period_and_position_filters(store):
+    records, _ = store.page(
+        "multi", limit=100, position_id=2,
+        start=START + timedelta(minutes=10), end=START + timedelta(minutes=30)
+    )
+
+    assert [r["data"]["cloud_coverage"] for r in records] == [2.5, 3.5, 4.5, 5.5]
+
+
+def test_stream_reads_in_batches(store):
+    records = list(store.stream("multi", batch_size=4))
+
+    assert len(records) == 25
+    assert [r["data"]["avg_cloud_coverage"] for r in records] == [float(i) for i in range(25)]
+    assert all(len(r["positions"]) == 2 for r in records)
+    assert store.latest("multi")["data"]["avg_cloud_coverage"] == 24.0
@@ -0,0 +1,65 @@
+# Файл: test_image_preprocess.py
+"""
+Тестове за подготовката на изображенията преди изпращане към модела
+"""
+
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from utils.image_preprocess import preprocess_image, estimate_upload_time_saved
+
+
+def _jpeg(width: int, height: int, quality: int = 95) -> bytes:
+    """Шумно JPEG изображение - не се компресира добре, както реален кадър"""
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _size(image_data: bytes):
+    return Image.open(BytesIO(image_data)).size
+
+
+def test_downscales_long_edge():
+    original = _jpeg(3200, 1800)
+    processed, stats = preprocess_image(original, max_edge=1568)
+
+    assert _size(processed) == (1568, 882)
+    assert stats["processed_size"] == [1568, 882]
+    assert stats["bytes_saved"] > 0
+    assert stats["processed_bytes"] == len(processed)
+
+
+def test_sky_crop_keeps_top_part():
+    processed, stats = preprocess_image(_jpeg(800, 600), max_edge=0, sky_crop_ratio=0.5)
+
+    assert _size(processed) == (800, 300)
+    assert stats["sky_crop_ratio"] == 0.5
+
+
+def test_small_image_keeps_original_bytes():
+    original = _jpeg(320, 240, quality=30)
+    processed, stats = preprocess_image(original, max_edge=1568, jpeg_quality=95)
+
+    # Прекодирането би увеличило размера - изпраща се оригиналът
+    assert processed is original
+    assert stats["bytes_saved"] == 0
+    assert stats["processed_size"] == [320, 240]
+
+
+def test_upload_time_saved_estimate():
+    stats = {
+        "original_bytes": 3000, "processed_bytes": 1500, "bytes_saved": 1500,
+        "original_size": [100, 100], "processed_size": [50, 50]
+    }
+    estimate_upload_time_saved(stats, upload_time=1.0, payload_bytes=2000)
+
+    # 1500 байта в base64 са 2000 байта - колкото целия payload
+    assert stats["upload_time_saved"] == 1.0
+
+    estimate_upload_time_saved(stats, upload_time=None, payload_bytes=2000)
+    assert stats["upload_time_saved"] is None
@@ -0,0 +1,79 @@
+# Файл: test_local_analyzer.py
+"""
+Тестове за локалния анализ на небето върху синтетични кадри
+"""
+
+import importlib.util
+
+import cv2
+import numpy as np
+
+
+def _load_local_analyzer():
+    """Зарежда local_analyzer.py директно - пакетът modules.image_analysis стартира анализа при import"""
+    spec = importlib.util.spec_from_file_location("local_analyzer", "modules/image_analysis/local_analyzer.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+local_analyzer = _load_local_analyzer()
+
+
+def _scene(sky_bgr, height: int = 480, width: int = 640) -> bytes:
+    """Кадър с еднородно небе в горните 60% и шумен терен отдолу"""
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:int(height * 0.6)] = sky_bgr
+    rng = np.random.default_rng(0)
+    image[int(height * 0.6):] = rng.integers(0, 256, (height - int(height * 0.6), width, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    assert ok
+    return encoded.tobytes()
+
+
+def test_clear_blue_sky():
+    result = local_analyzer.analyze_sky(_scene((230, 170, 90)), sky_ratio=0.6)
+
+    assert not result["is_night"]
+    assert result["cloud_coverage"] <= 5
+    assert result["weather_conditions"] == "Ясно небе"
+    assert result["is_sunny"]
+    assert result["confidence"] >= 80
+
+
+def test_overcast_grey_sky():
+    result = local_analyzer.analyze_sky(_scene((170, 170, 170)), sky_ratio=0.6)
+
+    assert result["cloud_coverage"] >= 95
+    assert result["weather_conditions"] == "Плътна облачност"
+    assert result["confidence"] >= 70
+
+
+def test_night_frame():
+    result = local_analyzer.analyze_sky(_scene((12, 10, 10)), sky_ratio=0.6)
+
+    assert result["is_night"]
+    assert result["confidence"] == 95.0
+
+
+def test_partial_clouds_are_left_to_the_model():
+    height, width = 480, 640
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :width // 2] = (230, 170, 90)
+    image[:, width // 2:] = (200, 200, 200)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    result = local_analyzer.analyze_sky(encoded.tobytes(), sky_ratio=0.6)
+
+    assert 30 <= result["cloud_coverage"] <= 70
+    assert result["weather_conditions"].startswith("Частична облачност")
+    assert result["confidence"] < 50
+
+
+def test_textured_terrain_is_not_sky():
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    result = local_analyzer.analyze_sky(encoded.tobytes(), sky_ratio=0.6)
+
+    assert result["sky_fraction"] < local_analyzer.MIN_SKY_FRACTION
+    assert result["confidence"] == 0.0
@@ -0,0 +1,127 @@
+# Файл: test_mjpeg.py
+"""
+Тестове за разпращача на MJPEG потока (без реална камера)
+"""
+
+import sys
+import time
+import types
+import asyncio
+import importlib
+
+import numpy as np
+
+
+def _load_mjpeg():
+    """Зарежда mjpeg.py и stream.py без __init__.py на пакета - той стартира прихващането при import"""
+    package = types.ModuleType("rtsp_mjpeg_test")
+    package.__path__ = ["modules/rtsp_capture"]
+    sys.modules["rtsp_mjpeg_test"] = package
+    return importlib.import_module("rtsp_mjpeg_test.mjpeg")
+
+
+mjpeg = _load_mjpeg()
+stream = sys.modules["rtsp_mjpeg_test.stream"]
+
+URL = "rtsp://camera/mjpeg"
+
+
+class FakeReader:
+    """Четец, чийто последен кадър се сменя ръчно"""
+
+    running = True
+
+    def __init__(self):
+        self.frame_time = time.time()
+        self.frame = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def start(self):
+        pass
+
+    def get_latest_frame(self, max_age=None):
+        return self.frame_time, self.frame
+
+    def _masked_url(self):
+        return URL
+
+
+def test_new_frames_are_encoded_once_and_broadcast(monkeypatch):
+    reader = FakeReader()
+    monkeypatch.setitem(stream._readers, URL, reader)
+    encoded = []
+
+    def counting_encode(*args):
+        encoded.append(args)
+        return stream.get_latest_jpeg_frame(*args)
+
+    monkeypatch.setattr(mjpeg, "get_latest_jpeg_frame", counting_encode)
+    broadcaster = mjpeg.MJPEGBroadcaster(URL, fps=50, max_age=60)
+
+    async def scenario():
+        viewer = broadcaster.frames()
+        first = await viewer.__anext__()
+        # Няколко такта без нов кадър - нищо не се кодира
+        await asyncio.sleep(0.2)
+        calls_without_new_frame = len(encoded)
+
+        reader.frame_time += 1
+        reader.frame = np.full((8, 8, 3), 255, dtype=np.uint8)
+        second = await asyncio.wait_for(viewer.__anext__(), 1.0)
+        await viewer.aclose()
+        return first, second, calls_without_new_frame
+
+    first, second, calls_without_new_frame = asyncio.run(scenario())
+
+    assert first.startswith(b"--frame\r\nContent-Type: image/jpeg\r\n")
+    assert second != first
+    assert calls_without_new_frame == 1
+    assert len(encoded) == 2
+    assert broadcaster.frames_broadcast == 2
+
+
+def test_slow_viewer_keeps_only_newest_part():
+    broadcaster = mjpeg.MJPEGBroadcaster(URL)
+    queue = asyncio.Queue(maxsize=1)
+    broadcaster._clients.add(queue)
+
+    broadcaster._broadcast(b"first")
+    broadcaster._broadcast(b"second")
+
+    assert queue.get_nowait() == b"second"
+    assert broadcaster.frames_dropped == 1
+
+
+class FailingReader(FakeReader):
+    """Четец, който хвърля грешка при първите failures четения"""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def get_latest_frame(self, max_age=None):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Прекъсната връзка")
+        return super().get_latest_frame(max_age)
+
+
+def test_producer_recovers_after_error(monkeypatch):
+    reader = FailingReader(failures=2)
+    monkeypatch.setitem(stream._readers, URL, reader)
+    monkeypatch.setattr(mjpeg, "RETRY_DELAY", 0.01)
+    broadcaster = mjpeg.MJPEGBroadcaster(URL, fps=50, max_age=60)
+
+    async def scenario():
+        viewer = broadcaster.frames()
+        part = await asyncio.wait_for(viewer.__anext__(), 1.0)
+        running = broadcaster.get_status()["running"]
+        await viewer.aclose()
+        return part, running
+
+    part, running = asyncio.run(scenario())
+
+    # Зрителят получава кадър след грешките, а разпращачът продължава да работи
+    assert part.startswith(b"--frame\r\n")
+    assert running
+    assert broadcaster.errors == 2
+    assert broadcaster.get_status()["last_error"] == "Прекъсната връзка"
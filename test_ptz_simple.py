@@ -0,0 +1,77 @@
+# Файл: test_ptz_simple.py
+"""
+Тестове за ONVIF контролера - повторно свързване и кеш на пресетите (без реална камера)
+"""
+
+import sys
+import types
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+
+class FakeCamera:
+    """ONVIF камера, която е недостъпна, докато online не стане True"""
+
+    online = False
+    connects = 0
+
+    def __init__(self, *args):
+        self.media = SimpleNamespace(GetProfiles=self._get_profiles)
+        self.ptz = SimpleNamespace(GetPresets=self._get_presets, GotoPreset=self._goto_preset)
+        self.moves = []
+
+    async def connect(self):
+        FakeCamera.connects += 1
+        if not FakeCamera.online:
+            raise ConnectionError("Камерата е недостъпна")
+
+    async def close(self):
+        pass
+
+    async def _get_profiles(self):
+        return [SimpleNamespace(token="profile_1")]
+
+    async def _get_presets(self, ProfileToken):
+        return [{"token": str(i), "Name": f"Preset {i}"} for i in range(5)]
+
+    async def _goto_preset(self, ProfileToken, PresetToken, Speed):
+        self.moves.append(PresetToken)
+
+
+def _load_controller():
+    """Зарежда controller.py с фалшива камера - при import той се свързва с нея"""
+    package = types.ModuleType("ptz_simple_test")
+    package.__path__ = ["modules/ptz_simple"]
+    sys.modules["ptz_simple_test"] = package
+    onvif_client = importlib.import_module("ptz_simple_test.onvif_client")
+    onvif_client.AsyncONVIFCamera = FakeCamera
+    return importlib.import_module("ptz_simple_test.controller")
+
+
+controller = _load_controller()
+
+
+def test_presets_load_after_camera_comes_online():
+    # При import камерата е била недостъпна
+    assert controller.ptz is None
+    FakeCamera.online = True
+    connects = FakeCamera.connects
+
+    presets = asyncio.run(asyncio.wait_for(controller.async_get_presets(), 2.0))
+
+    assert sorted(presets) == ["0", "1", "2", "3", "4"]
+    assert FakeCamera.connects == connects + 1
+    assert controller.get_ptz_config().preset_tokens[3] == "3"
+
+
+def test_move_reconnects_without_deadlock(monkeypatch):
+    FakeCamera.online = True
+    monkeypatch.setattr(controller, "ptz", None)
+    monkeypatch.setattr(controller, "profile_token", None)
+    controller.invalidate_presets_cache()
+
+    assert asyncio.run(asyncio.wait_for(controller.async_move_to_position(2), 2.0))
+    assert controller.cam.moves == ["2"]
+    # Пресетите от повторното свързване са в кеша
+    assert controller.get_presets_cache_status()["fresh"]
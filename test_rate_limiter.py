@@ -0,0 +1,156 @@
+# Файл: test_rate_limiter.py
+"""
+Тестове за кофата с жетони, прекъсвача и повторните опити към Anthropic API
+"""
+
+import time
+import asyncio
+
+import httpx
+import pytest
+
+import utils.anthropic_api as anthropic_api
+from utils.rate_limiter import TokenBucket, CircuitBreaker, CircuitOpenError, backoff_delay
+
+
+class FakeClient:
+    """HTTP клиент, който отговаря с поредните статус кодове след delay секунди"""
+
+    def __init__(self, statuses, delay: float = 0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.calls = 0
+
+    async def post(self, url, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return httpx.Response(self.statuses.pop(0), request=httpx.Request("POST", url))
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """Отделен прекъсвач и кофа без ограничение за всеки тест"""
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=0.05)
+    monkeypatch.setattr(anthropic_api, "_breaker", breaker)
+    monkeypatch.setattr(anthropic_api, "_bucket", TokenBucket(rate=1000, capacity=1000))
+    monkeypatch.setattr(anthropic_api, "BACKOFF_BASE", 0.0)
+    return breaker
+
+
+def test_bucket_spreads_burst():
+    bucket = TokenBucket(rate=10, capacity=2)
+    waits = [bucket.reserve() for _ in range(4)]
+
+    # Два жетона веднага, следващите през 0.1 секунди
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_bucket_pause_delays_all_requests():
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.pause(2.0)
+
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.01)
+    assert bucket.get_status()["paused_for"] > 1.9
+
+
+def test_breaker_opens_and_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    # Докато пробата тече, останалите заявки се отказват
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_backoff_respects_retry_after_and_maximum():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=1.0, maximum=5.0) <= 5.0
+    assert backoff_delay(3, base=1.0, maximum=5.0, retry_after=12.0) == 12.0
+
+
+def test_retries_transient_errors(breaker):
+    client = FakeClient([529, 503, 200])
+
+    response = asyncio.run(anthropic_api.post_message(client, "https://api.test/v1/messages", "test"))
+
+    assert response.status_code == 200
+    assert client.calls == 3
+    assert breaker.state == "closed"
+
+
+def test_client_errors_are_not_retried(breaker):
+    client = FakeClient([400])
+
+    response = asyncio.run(anthropic_api.post_message(client, "https://api.test/v1/messages", "test"))
+
+    assert response.status_code == 400
+    assert client.calls == 1
+
+
+def test_cancelled_probe_releases_breaker(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+
+    async def scenario():
+        # Пробната заявка е прекъсната от wait_for
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                anthropic_api.post_message(FakeClient([200], delay=10), "https://api.test/v1/messages", "test"),
+                0.05
+            )
+        assert breaker.state == "open"
+
+        with pytest.raises(CircuitOpenError):
+            await anthropic_api.post_message(FakeClient([200]), "https://api.test/v1/messages", "test")
+
+        # След паузата нова проба минава и затваря прекъсвача
+        await asyncio.sleep(0.06)
+        return await anthropic_api.post_message(FakeClient([200]), "https://api.test/v1/messages", "test")
+
+    response = asyncio.run(scenario())
+
+    assert response.status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_cancelled_ordinary_request_does_not_fail_probe(breaker):
+    async def scenario():
+        # Заявка, допусната преди прекъсвачът да се отвори
+        slow = asyncio.ensure_future(
+            anthropic_api.post_message(FakeClient([200], delay=10), "https://api.test/v1/messages", "test")
+        )
+        await asyncio.sleep(0.01)
+        for _ in range(3):
+            breaker.record_failure()
+        await asyncio.sleep(0.06)
+
+        # Пробата тече, когато обикновената заявка е прекъсната
+        probe = asyncio.ensure_future(
+            anthropic_api.post_message(FakeClient([200], delay=0.05), "https://api.test/v1/messages", "test")
+        )
+        await asyncio.sleep(0.01)
+        slow.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await slow
+        state_after_cancel = breaker.state
+
+        return state_after_cancel, await probe
+
+    state_after_cancel, response = asyncio.run(scenario())
+
+    assert state_after_cancel == "half_open"
+    assert response.status_code == 200
+    assert breaker.state == "closed"
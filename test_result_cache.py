@@ -0,0 +1,88 @@
+# Файл: test_result_cache.py
+"""
+Тестове за кеша на резултатите от анализ - LRU, точно и приблизително съвпадение
+"""
+
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from utils.result_cache import AnalysisResultCache, compute_image_hashes, perceptual_hash, hamming_distance
+
+
+def _jpeg(sky: np.ndarray, ground: np.ndarray) -> bytes:
+    """JPEG с горна половина sky и долна половина ground (сиви 64x64)"""
+    image = Image.fromarray(np.vstack([sky, ground]).astype(np.uint8), "L")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def _gradient(reverse: bool = False) -> np.ndarray:
+    row = np.linspace(255, 0, 64) if reverse else np.linspace(0, 255, 64)
+    return np.tile(row, (32, 1))
+
+
+def _cache(**kwargs) -> AnalysisResultCache:
+    return AnalysisResultCache("test", disk_dir="", **kwargs)
+
+
+def test_exact_hit_and_scope_split():
+    cache = _cache()
+    cache.put("model_a", "digest", None, {"weather": "clear"})
+
+    assert cache.lookup("model_a", "digest", None) == ({"weather": "clear"}, "exact")
+    # Същият кадър при друг модел е нов анализ
+    assert cache.lookup("model_b", "digest", None) == (None, None)
+    assert cache.exact_hits == 1
+    assert cache.misses == 1
+
+
+def test_lru_eviction():
+    cache = _cache(max_items=2)
+    cache.put("s", "a", None, {"n": 1})
+    cache.put("s", "b", None, {"n": 2})
+    # "a" е използван последен - изхвърля се "b"
+    cache.lookup("s", "a", None)
+    cache.put("s", "c", None, {"n": 3})
+
+    assert cache.lookup("s", "a", None)[1] == "exact"
+    assert cache.lookup("s", "b", None) == (None, None)
+    assert cache.lookup("s", "c", None)[1] == "exact"
+
+
+def test_similar_hit_by_hamming_distance():
+    cache = _cache(max_distance=4)
+    cache.put("s", "a", 0b1111, {"weather": "cloudy"})
+
+    assert cache.lookup("s", "b", 0b0111) == ({"weather": "cloudy"}, "similar")
+    assert cache.lookup("s", "c", 0b1111 ^ 0b11111 << 8) == (None, None)
+
+
+def test_similar_hits_expire_before_exact_hits():
+    cache = _cache(max_age=3600, similar_max_age=0.05)
+    cache.put("s", "a", 0b1111, {"weather": "cloudy"})
+    time.sleep(0.1)
+
+    # Почти еднакъв кадър след интервала на анализ - нов анализ
+    assert cache.lookup("s", "b", 0b1111) == (None, None)
+    # Точно същите байтове все още са валидни
+    assert cache.lookup("s", "a", 0b1111)[1] == "exact"
+
+
+def test_perceptual_hash_covers_only_the_sky():
+    ground = _gradient()
+    base = _jpeg(_gradient(), ground)
+    sky_changed = _jpeg(_gradient(reverse=True), ground)
+    ground_changed = _jpeg(_gradient(), _gradient(reverse=True))
+
+    # Промяна в небето дава различен хеш, промяна само в предния план - не
+    assert hamming_distance(perceptual_hash(base, 0.5), perceptual_hash(sky_changed, 0.5)) > 4
+    assert hamming_distance(perceptual_hash(base, 0.5), perceptual_hash(ground_changed, 0.5)) <= 4
+
+    cache = _cache()
+    digest, phash = compute_image_hashes(base, 0.5)
+    cache.put("s", digest, phash, {"weather": "clear"})
+    assert cache.lookup("s", *compute_image_hashes(sky_changed, 0.5)) == (None, None)
@@ -0,0 +1,108 @@
+# Файл: test_route.py
+"""
+Тестове за планирането на реда на обхождане на пресетите
+"""
+
+import os
+import random
+import itertools
+import importlib.util
+
+
+def _load_route():
+    """Зарежда route.py директно - пакетът modules.ptz_capture стартира прихващането при import"""
+    spec = importlib.util.spec_from_file_location("ptz_route", "modules/ptz_capture/route.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+route = _load_route()
+
+
+def _planner_with(timings, **kwargs):
+    planner = route.RoutePlanner(**kwargs)
+    for (a, b), seconds in timings.items():
+        planner.record_move(a, b, seconds)
+    return planner
+
+
+def _random_timings(positions, seed):
+    rng = random.Random(seed)
+    return {
+        (a, b): rng.uniform(1.0, 20.0)
+        for a in positions for b in positions if a != b
+    }
+
+
+def _brute_force(planner, start, positions, end):
+    return min(
+        planner.route_cost(start, list(order), end, 10.0)
+        for order in itertools.permutations(positions)
+    )
+
+
+def test_exact_plan_matches_brute_force():
+    positions = [1, 2, 3, 4, 5, 6]
+    for seed in range(5):
+        planner = _planner_with(_random_timings([0] + positions, seed))
+        planned = planner.plan(0, positions, end=0)
+
+        assert sorted(planned) == positions
+        assert abs(planner.route_cost(0, planned, 0, 10.0) - _brute_force(planner, 0, positions, 0)) < 1e-9
+
+
+def test_heuristic_plan_is_valid_and_not_worse_than_config_order():
+    positions = list(range(1, 12))
+    planner = _planner_with(_random_timings([0] + positions, 42), exact_max_positions=4)
+    planned = planner.plan(0, positions, end=0)
+
+    assert sorted(planned) == positions
+    assert planner.route_cost(0, planned, 0, 10.0) <= planner.route_cost(0, positions, 0, 10.0)
+
+
+def test_two_opt_untangles_crossing_route():
+    # Позиции на права линия - оптималното обхождане е по ред
+    positions = [1, 2, 3, 4, 5]
+    cost = lambda a, b: 0.0 if a is None else abs(a - b)  # noqa: E731
+    planned = route.RoutePlanner._plan_heuristic(0, [3, 1, 5, 2, 4], None, cost)
+
+    assert planned == positions
+
+
+def test_without_timings_keeps_configured_order():
+    planner = route.RoutePlanner()
+    assert planner.plan(0, [3, 1, 2], end=0) == [3, 1, 2]
+
+
+def test_unknown_start_position():
+    planner = _planner_with({(1, 2): 1.0, (2, 3): 1.0, (3, 1): 30.0, (1, 3): 30.0, (3, 2): 1.0, (2, 1): 1.0})
+    planned = planner.plan(None, [3, 1, 2])
+
+    # Без начална позиция първото преместване е безплатно
+    assert planner.route_cost(None, planned, None, 10.0) == 2.0
+
+
+def test_record_move_smoothing_and_reverse_estimate():
+    planner = route.RoutePlanner(smoothing=0.5)
+    planner.record_move(1, 2, 10.0)
+    planner.record_move(1, 2, 20.0)
+
+    assert planner.estimate(1, 2, 99.0) == 15.0
+    # Обратната посока се приема за симетрична
+    assert planner.estimate(2, 1, 99.0) == 15.0
+    assert planner.estimate(1, 3, 99.0) == 99.0
+
+
+def test_timings_are_persisted(tmp_path):
+    path = str(tmp_path / "route_timings.json")
+    planner = route.RoutePlanner(timings_path=path)
+    planner.record_move(0, 1, 7.5)
+    planner.record_move(1, 2, 4.0)
+    # Файлът се записва веднъж, в края на цикъла
+    assert not os.path.exists(path)
+    planner.save()
+
+    reloaded = route.RoutePlanner(timings_path=path)
+    assert reloaded.estimate(0, 1, 99.0) == 7.5
+    assert reloaded.estimate(1, 2, 99.0) == 4.0
@@ -0,0 +1,200 @@
+# Файл: test_scheduler.py
+"""
+Тестове за общия планировчик - cron и интервални задачи, пропуснати
+изпълнения, верижни задачи и ръчно изпълнение с изчакване
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.scheduler import Scheduler, CronTrigger, IntervalTrigger
+
+# Петък
+FRIDAY = datetime(2024, 7, 19, 18, 50)
+
+
+def test_cron_skips_to_next_working_day():
+    trigger = CronTrigger("*/15 8-18 * * 1-5")
+
+    assert trigger.next_fire(FRIDAY.replace(hour=9, minute=7), FRIDAY) == FRIDAY.replace(hour=9, minute=15)
+    assert trigger.next_fire(FRIDAY, FRIDAY) == datetime(2024, 7, 22, 8, 0)
+
+
+def test_cron_day_or_weekday():
+    # Първо число от месеца или неделя - както в cron е достатъчно едното
+    trigger = CronTrigger("0 12 1 * 0")
+
+    assert trigger.next_fire(datetime(2024, 7, 2, 13, 0), FRIDAY) == datetime(2024, 7, 7, 12, 0)
+    assert trigger.next_fire(datetime(2024, 7, 28, 13, 0), FRIDAY) == datetime(2024, 8, 1, 12, 0)
+    assert CronTrigger("0 0 * * 7").weekdays == {0}
+
+
+@pytest.mark.parametrize("expression", ["* * *", "61 * * * *", "*/0 * * * *", "0 0 5-1 * *"])
+def test_invalid_cron_expressions(expression):
+    with pytest.raises(ValueError):
+        CronTrigger(expression)
+
+
+def test_cron_that_never_fires():
+    with pytest.raises(ValueError):
+        CronTrigger("0 0 30 2 *").next_fire(FRIDAY, FRIDAY)
+
+
+def test_interval_counts_from_planned_time():
+    seconds = [60]
+    trigger = IntervalTrigger(lambda: seconds[0])
+
+    # Закъснялото изпълнение не отмества графика
+    assert trigger.next_fire(FRIDAY, FRIDAY + timedelta(seconds=20)) == FRIDAY + timedelta(seconds=60)
+    # Интервалът се чете при всяко планиране
+    seconds[0] = 0
+    assert trigger.next_fire(FRIDAY, FRIDAY) == FRIDAY + timedelta(seconds=1)
+
+
+def _run(scenario):
+    """Изпълнява scenario(scheduler) с планировчик в loop-а на теста"""
+    scheduler = Scheduler()
+
+    async def main():
+        scheduler._loop = asyncio.get_running_loop()
+        scheduler._start_supervisor()
+        try:
+            return await scenario(scheduler)
+        finally:
+            scheduler._shutdown()
+
+    return asyncio.run(main())
+
+
+def _add(scheduler, name, func):
+    """Задача, чието изпълнение по графика е чак след час"""
+    return scheduler.add_job(name, func, IntervalTrigger(3600), jitter=0, first_run=None)
+
+
+def test_late_run_is_skipped_as_misfire():
+    calls = []
+
+    async def job_func():
+        calls.append(1)
+
+    async def scenario(scheduler):
+        job = _add(scheduler, "late", job_func)
+        now = datetime.now()
+        job.next_run = now - timedelta(seconds=job.misfire_grace + 10)
+        scheduler._fire(job, now)
+        await asyncio.sleep(0)
+        return job, now
+
+    job, now = _run(scenario)
+
+    assert calls == []
+    assert job.misfires == 1
+    assert job.last_status == "misfire"
+    assert job.next_run > now
+
+
+def test_run_and_wait_returns_status_and_fires_chain():
+    calls = []
+
+    async def capture():
+        calls.append("capture")
+        return True
+
+    async def analysis():
+        calls.append("analysis")
+
+    async def scenario(scheduler):
+        _add(scheduler, "capture", capture)
+        downstream = _add(scheduler, "analysis", analysis)
+        scheduler.chain("capture", "analysis")
+
+        status = await scheduler.run_and_wait("capture")
+        await downstream.task
+        return status, downstream
+
+    status, downstream = _run(scenario)
+
+    assert status == "ok"
+    assert calls == ["capture", "analysis"]
+    assert downstream.last_reason == "after capture"
+
+
+def test_run_and_wait_with_other_function():
+    calls = []
+
+    async def capture():
+        calls.append("scheduled")
+
+    async def manual_cycle():
+        calls.append("manual")
+        return False
+
+    async def analysis():
+        calls.append("analysis")
+
+    async def scenario(scheduler):
+        job = _add(scheduler, "capture", capture)
+        _add(scheduler, "analysis", analysis)
+        scheduler.chain("capture", "analysis")
+
+        status = await scheduler.run_and_wait("capture", manual_cycle)
+        await asyncio.sleep(0.01)
+        return status, job
+
+    status, job = _run(scenario)
+
+    # Неуспешно изпълнение не стартира веригата
+    assert status == "failed"
+    assert calls == ["manual"]
+    assert job.failures == 1
+    assert job.last_reason == "manual"
+
+
+def test_run_and_wait_does_not_overlap():
+    async def scenario(scheduler):
+        event = asyncio.Event()
+
+        async def slow():
+            await event.wait()
+
+        job = _add(scheduler, "slow", slow)
+        first = asyncio.ensure_future(scheduler.run_and_wait("slow"))
+        while not job.running:
+            await asyncio.sleep(0.005)
+
+        second = await scheduler.run_and_wait("slow")
+        event.set()
+        return second, await first, job, await scheduler.run_and_wait("missing")
+
+    second, first, job, missing = _run(scenario)
+
+    assert second is None
+    assert first == "ok"
+    assert job.skipped == 1
+    assert job.runs == 1
+    assert missing is None
+
+
+def test_pause_with_cancel_stops_running_job():
+    async def scenario(scheduler):
+        async def forever():
+            await asyncio.sleep(3600)
+
+        job = _add(scheduler, "forever", forever)
+        scheduler.run_now("forever")
+        await asyncio.sleep(0.01)
+        assert job.running
+
+        assert scheduler.pause("forever", cancel=True)
+        assert not scheduler.pause("forever")
+        await asyncio.sleep(0.01)
+        return job
+
+    job = _run(scenario)
+
+    assert job.paused
+    assert not job.running
+    assert job.last_status == "cancelled"
+    assert job.get_status()["next_run"] is None
@@ -0,0 +1,108 @@
+# Файл: test_settle.py
+"""
+Тестове за откриването на стабилизиране на PTZ камерата и времената на опашката
+"""
+
+import time
+import asyncio
+import importlib.util
+
+import numpy as np
+
+from utils.command_queue import PTZCommandQueue
+
+
+def _load_settle():
+    """Зарежда settle.py директно - пакетът modules.ptz_capture стартира прихващането при import"""
+    spec = importlib.util.spec_from_file_location("ptz_settle", "modules/ptz_capture/settle.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+settle = _load_settle()
+
+
+class FakeReader:
+    """Четец с предварително зададени кадри (време спрямо началото, кадър)"""
+
+    def __init__(self, start: float, frames):
+        self.frames = [(start + offset, frame) for offset, frame in frames]
+
+    def wait_for_frame(self, after: float = 0.0, timeout: float = 0.0):
+        for frame_time, frame in self.frames:
+            if frame_time >= after:
+                return frame_time, frame
+        return None
+
+
+def _frame(shift: int) -> np.ndarray:
+    """Кадър с хоризонтален градиент, отместен с shift пиксела (имитира движение)"""
+    row = np.tile(np.arange(320, dtype=np.uint8), 2)[shift:shift + 320]
+    gray = np.tile(row, (240, 1))
+    return np.dstack([gray, gray, gray])
+
+
+def test_settles_after_motion_stops():
+    start = time.time()
+    moving = [(0.1 * i, _frame(i * 20)) for i in range(1, 6)]
+    still = [(0.6 + 0.1 * i, _frame(120)) for i in range(5)]
+    reader = FakeReader(start, moving + still)
+
+    settled, elapsed, frame_data = settle.wait_for_settle(
+        reader, start, max_wait=30, stable_frames=3, min_wait=0.5
+    )
+
+    assert settled
+    # Третото спокойно сравнение е на кадъра в 0.6 + 0.3 секунди
+    assert abs(elapsed - 0.9) < 1e-6
+    assert frame_data[0] == start + 0.9
+
+
+def test_no_motion_waits_for_motion_start_timeout():
+    start = time.time()
+    reader = FakeReader(start, [(0.25 * i, _frame(0)) for i in range(1, 20)])
+
+    settled, elapsed, _ = settle.wait_for_settle(
+        reader, start, max_wait=30, stable_frames=3, min_wait=0.5, motion_start_timeout=2.0
+    )
+
+    assert settled
+    assert elapsed >= 2.0
+
+
+def test_constant_motion_is_not_settled():
+    start = time.time()
+    reader = FakeReader(start, [(0.1 * i, _frame((i * 37) % 300)) for i in range(1, 20)])
+
+    settled, _, frame_data = settle.wait_for_settle(reader, start, max_wait=30)
+
+    assert not settled
+    # Последният кадър все пак се връща
+    assert frame_data is not None
+
+
+def test_move_timed_excludes_queue_wait():
+    moves = []
+
+    async def mover(position_id: int) -> bool:
+        moves.append((position_id, time.time()))
+        await asyncio.sleep(0.2)
+        return True
+
+    queue = PTZCommandQueue("test_settle", mover)
+
+    async def scenario():
+        first = asyncio.ensure_future(queue.move_timed(1))
+        await asyncio.sleep(0.05)
+        queued_at = time.time()
+        second = await queue.move_timed(2)
+        return await first, second, queued_at
+
+    (ok1, started1), (ok2, started2), queued_at = asyncio.run(scenario())
+
+    assert ok1 and ok2
+    # Втората команда е чакала първата - времето на движение започва след нея
+    assert started2 >= started1 + 0.2
+    assert started2 - queued_at >= 0.1
+    assert abs(started2 - moves[1][1]) < 0.05
@@ -0,0 +1,291 @@
+"""
+Общи помощни функции за заявките към Anthropic Messages API
+
+Статичните инструкции се изпращат като system блок с cache_control
+(ephemeral, 5 минути от последното четене). Кеширането се активира само ако
+кешираната част е над минималната дължина за модела (1024 токена, 2048 за
+Haiku). Сегашните промптове на анализаторите са под този праг, така че при
+модела по подразбиране API-то ги обработва нормално - маркерът не струва
+нищо и започва да действа, ако промптът порасне или се смени моделът.
+Затова статистиката по модули брои само входните и изходните токени.
+По-дълъг кеш се включва с ANTHROPIC_PROMPT_CACHE_TTL=1h (записът в него е
+по-скъп).
+
+Всички заявки към Messages API минават през post_message: обща кофа с жетони
+(ANTHROPIC_REQUESTS_PER_MINUTE, ANTHROPIC_BURST), повторни опити с
+експоненциално нарастване и jitter при 429/529/5xx и мрежови грешки
+(ANTHROPIC_MAX_RETRIES, ANTHROPIC_BACKOFF_BASE, ANTHROPIC_BACKOFF_MAX), и
+прекъсвач след поредица от неуспехи (ANTHROPIC_BREAKER_THRESHOLD,
+ANTHROPIC_BREAKER_COOLDOWN). Заглавките retry-after и
+anthropic-ratelimit-* спират кофата за всички модули до нулирането на лимита.
+"""
+
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from utils.logger import setup_logger
+from utils.rate_limiter import TokenBucket, CircuitBreaker, CircuitOpenError, backoff_delay
+
+# Инициализиране на логър
+logger = setup_logger("anthropic_api")
+
+PROMPT_CACHE_TTL = os.getenv("ANTHROPIC_PROMPT_CACHE_TTL", "5m")
+
+REQUESTS_PER_MINUTE = float(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "50"))
+BURST = float(os.getenv("ANTHROPIC_BURST", "5"))
+MAX_RETRIES = int(os.getenv("ANTHROPIC_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("ANTHROPIC_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("ANTHROPIC_BACKOFF_MAX", "30"))
+# По-дълъг retry-after не се изчаква в рамките на заявката - цикълът ще опита отново
+RETRY_AFTER_MAX = float(os.getenv("ANTHROPIC_RETRY_AFTER_MAX", "60"))
+
+# 529 - API-то е претоварено
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504, 529}
+
+# Общи за всички модули - лимитите на API-то са за ключа, не за модула
+_bucket = TokenBucket(rate=REQUESTS_PER_MINUTE / 60.0, capacity=BURST)
+_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("ANTHROPIC_BREAKER_THRESHOLD", "5")),
+    cooldown=float(os.getenv("ANTHROPIC_BREAKER_COOLDOWN", "60"))
+)
+_retry_stats = {"retries": 0, "rate_limited": 0, "rejected": 0, "throttled_seconds": 0.0}
+
+# Натрупана статистика за използваните токени по модули
+_usage_stats: Dict[str, Dict[str, int]] = {}
+_usage_lock = threading.Lock()
+
+USAGE_FIELDS = ("input_tokens", "output_tokens")
+
+
+def cached_system_prompt(text: str) -> List[Dict[str, Any]]:
+    """
+    Създава system блок, маркиран за кеширане
+
+    Args:
+        text: Статичният текст на инструкциите
+
+    Returns:
+        List: Стойност за полето "system" на заявката
+    """
+    cache_control = {"type": "ephemeral"}
+    if PROMPT_CACHE_TTL and PROMPT_CACHE_TTL != "5m":
+        cache_control["ttl"] = PROMPT_CACHE_TTL
+
+    return [
+        {
+            "type": "text",
+            "text": text,
+            "cache_control": cache_control
+        }
+    ]
+
+
+def extract_json_object(content: str) -> Optional[Dict[str, Any]]:
+    """
+    Извлича JSON обекта от текстовия отговор на модела
+
+    Returns:
+        Optional[Dict]: Обектът или None, ако отговорът не съдържа валиден JSON
+    """
+    start_idx = content.find('{')
+    end_idx = content.rfind('}') + 1
+    if start_idx < 0 or end_idx <= start_idx:
+        return None
+
+    try:
+        value = json.loads(content[start_idx:end_idx])
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def extract_usage(response_json: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Извлича използваните токени от отговора на API-то
+
+    Returns:
+        Dict: Броят входни и изходни токени
+    """
+    usage = response_json.get("usage") or {}
+    return {field: int(usage.get(field) or 0) for field in USAGE_FIELDS}
+
+
+def record_usage(name: str, usage: Dict[str, Any]) -> None:
+    """
+    Добавя използваните токени към статистиката на модула
+
+    Args:
+        name: Име на модула
+        usage: Резултат от extract_usage
+    """
+    with _usage_lock:
+        stats = _usage_stats.setdefault(name, {"requests": 0, **{field: 0 for field in USAGE_FIELDS}})
+        stats["requests"] += 1
+        for field in USAGE_FIELDS:
+            stats[field] += usage.get(field, 0)
+
+    logger.info(
+        f"[{name}] Токени: вход {usage.get('input_tokens', 0)}, "
+        f"изход {usage.get('output_tokens', 0)}"
+    )
+
+
+def get_usage_stats(name: str) -> Dict[str, Any]:
+    """
+    Връща натрупаната статистика за модула
+
+    Returns:
+        Dict: Броят заявки и токени
+    """
+    with _usage_lock:
+        return dict(_usage_stats.get(name) or {"requests": 0, **{field: 0 for field in USAGE_FIELDS}})
+
+
+def _parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Времето от заглавката retry-after в секунди"""
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """Секунди до момента от anthropic-ratelimit-*-reset (RFC 3339)"""
+    if not value:
+        return None
+    try:
+        reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+def apply_rate_limit_headers(response: httpx.Response) -> None:
+    """
+    Спира общата кофа, ако някой от лимитите на API-то е изчерпан
+
+    Проверяват се лимитите за заявки и за токени - при remaining == 0
+    заявките изчакват до съответния reset.
+    """
+    for kind in ("requests", "tokens", "input-tokens", "output-tokens"):
+        remaining = response.headers.get(f"anthropic-ratelimit-{kind}-remaining")
+        if remaining is None or remaining.strip() not in ("0", "0.0"):
+            continue
+        wait = _parse_reset(response.headers.get(f"anthropic-ratelimit-{kind}-reset"))
+        if wait:
+            logger.warning(f"Изчерпан лимит ({kind}) - заявките изчакват {wait:.1f} секунди")
+            _bucket.pause(wait)
+
+
+def _should_retry(response: httpx.Response) -> bool:
+    """Дали отговорът си заслужава повторен опит (x-should-retry има предимство)"""
+    should_retry = response.headers.get("x-should-retry")
+    if should_retry == "true":
+        return True
+    if should_retry == "false":
+        return False
+    return response.status_code in RETRYABLE_STATUS
+
+
+async def post_message(
+    client: httpx.AsyncClient,
+    url: str,
+    name: str,
+    **kwargs: Any
+) -> httpx.Response:
+    """
+    Изпраща заявка към Messages API през общия ограничител
+
+    Args:
+        client: HTTP клиент (get_http_client)
+        url: Адрес на API-то
+        name: Име на модула (за логовете)
+        **kwargs: Аргументи за client.post (json, headers, timeout, extensions)
+
+    Returns:
+        httpx.Response: Последният отговор - може да е неуспешен, ако опитите
+                        са изчерпани или грешката не е временна
+
+    Raises:
+        CircuitOpenError: Прекъсвачът е отворен след поредица от неуспехи
+        httpx.TransportError: Мрежова грешка и след последния опит
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        admitted = _breaker.allow()
+        if admitted is None:
+            _retry_stats["rejected"] += 1
+            raise CircuitOpenError(
+                f"Anthropic API е временно недостъпно - нов опит след {_breaker.retry_in():.0f} секунди"
+            )
+
+        try:
+            waited = await _bucket.acquire()
+            if waited > 0:
+                _retry_stats["throttled_seconds"] += waited
+
+            response = await client.post(url, **kwargs)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            _breaker.record_failure()
+            if attempt >= MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX)
+            _retry_stats["retries"] += 1
+            logger.warning(f"[{name}] Мрежова грешка ({type(e).__name__}: {e}) - нов опит след {delay:.1f} секунди")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # asyncio.wait_for или спирането на задачата прекъсват заявката
+            _breaker.record_cancelled(probe=admitted == "half_open")
+            raise
+
+        apply_rate_limit_headers(response)
+        retry_after = _parse_retry_after(response)
+        if response.status_code == 429:
+            _retry_stats["rate_limited"] += 1
+            if retry_after is not None:
+                _bucket.pause(retry_after)
+
+        # Прекъсвачът следи само сървърните грешки - 4xx (включително 429)
+        # означава, че API-то отговаря нормално
+        if response.status_code >= 500:
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+
+        if not _should_retry(response):
+            return response
+
+        if attempt >= MAX_RETRIES or (retry_after is not None and retry_after > RETRY_AFTER_MAX):
+            return response
+
+        delay = backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX, retry_after)
+        _retry_stats["retries"] += 1
+        logger.warning(
+            f"[{name}] HTTP {response.status_code} от Anthropic API - "
+            f"опит {attempt + 1}/{MAX_RETRIES}, изчакване {delay:.1f} секунди"
+        )
+        await asyncio.sleep(delay)
+
+    return response
+
+
+def get_rate_limit_status() -> Dict[str, Any]:
+    """Връща състоянието на общия ограничител и прекъсвач"""
+    return {
+        "bucket": _bucket.get_status(),
+        "circuit_breaker": _breaker.get_status(),
+        "max_retries": MAX_RETRIES,
+        "retries": _retry_stats["retries"],
+        "rate_limited": _retry_stats["rate_limited"],
+        "rejected": _retry_stats["rejected"],
+        "throttled_seconds": round(_retry_stats["throttled_seconds"], 1)
+    }
@@ -0,0 +1,153 @@
+"""
+Кеш с време на валидност (TTL) за данни, които рядко се променят
+
+Стойността се зарежда с асинхронна функция. Докато е свежа, се връща
+директно. След изтичане на TTL, но в рамките на stale_ttl, се връща старата
+стойност, а опресняването тече във фона (stale-while-revalidate). Едновременните
+заявки за опресняване се обединяват в едно извикване на зареждащата функция.
+"""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, TypeVar
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("cache")
+
+T = TypeVar("T")
+
+
+class AsyncTTLCache(Generic[T]):
+    """
+    Една кеширана стойност с TTL и фоново опресняване
+
+    Празен резултат от зареждащата функция ({} / [] / None) се счита за
+    неуспех - ако има предишна стойност, тя се запазва.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Awaitable[T]],
+        ttl: float = 300.0,
+        stale_ttl: float = 3600.0,
+        name: str = "cache"
+    ):
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+
+        self._value: Optional[T] = None
+        self._loaded_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def age(self) -> Optional[float]:
+        """Възраст на кешираната стойност в секунди (None ако няма стойност)"""
+        if self._loaded_at is None:
+            return None
+        return time.monotonic() - self._loaded_at
+
+    def peek(self) -> Optional[T]:
+        """Връща кешираната стойност без да я зарежда или опреснява"""
+        return self._value
+
+    def set(self, value: T) -> None:
+        """Записва стойност, заредена извън кеша (напр. при повторно свързване)"""
+        if value:
+            self._value = value
+            self._loaded_at = time.monotonic()
+            self.last_error = None
+
+    def invalidate(self) -> None:
+        """Маркира стойността като изтекла - следващото четене я зарежда наново"""
+        self._loaded_at = None
+        logger.info(f"Кешът {self.name} е инвалидиран")
+
+    async def get(self, force_refresh: bool = False) -> Optional[T]:
+        """
+        Връща стойността от кеша, като я зарежда или опреснява при нужда
+
+        Args:
+            force_refresh: Зарежда стойността наново, дори ако е свежа
+
+        Returns:
+            Optional[T]: Кешираната стойност
+        """
+        age = self.age
+
+        if not force_refresh and age is not None:
+            if age < self.ttl:
+                self.hits += 1
+                return self._value
+
+            if age < self.ttl + self.stale_ttl:
+                # Връщаме старата стойност веднага, опресняването е във фона
+                self.stale_hits += 1
+                self._start_refresh()
+                return self._value
+
+        self.misses += 1
+        return await self.refresh()
+
+    async def refresh(self) -> Optional[T]:
+        """Зарежда стойността наново (обединява едновременните заявки)"""
+        task = self._start_refresh()
+        return await asyncio.shield(task)
+
+    def _start_refresh(self) -> asyncio.Task:
+        """Стартира опресняване, ако вече не тече такова в текущия event loop"""
+        loop = asyncio.get_running_loop()
+
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return self._task
+
+        self._task = loop.create_task(self._load())
+        return self._task
+
+    async def _load(self) -> Optional[T]:
+        """Извиква зареждащата функция и обновява кеша"""
+        try:
+            value = await self.loader()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Грешка при опресняване на кеша {self.name}: {str(e)}")
+            return self._value
+
+        if not value:
+            # Не кешираме празен резултат - следващото четене ще опита отново
+            self.last_error = "Празен резултат"
+            if self._value:
+                logger.warning(
+                    f"Празен резултат при опресняване на кеша {self.name}, запазваме предишната стойност"
+                )
+                return self._value
+            return value
+
+        self._value = value
+        self._loaded_at = time.monotonic()
+        self.last_error = None
+        return value
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за състоянието на кеша"""
+        age = self.age
+        return {
+            "name": self.name,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "age": round(age, 1) if age is not None else None,
+            "fresh": age is not None and age < self.ttl,
+            "refreshing": self._task is not None and not self._task.done(),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,431 @@
+"""
+Опашка с команди към PTZ камера
+
+Всички команди за преместване към една камера минават през една опашка, която
+се обслужва от една задача в контролния event loop. Така движенията никога не
+се застъпват, последователни заявки за един и същ пресет се обединяват в една
+команда, а цикълът на прихващане може да заеме камерата (lease) - докато
+притежава lease-а, се изпълняват само неговите команди.
+
+Функциите submit_* са thread-safe и връщат concurrent.futures.Future, така че
+могат да се извикват от всяка нишка или event loop.
+
+Камерата може да се управлява от няколко модула (ptz_simple през ONVIF,
+ptz_control през Imou API, цикълът на прихващане). Всички те използват една
+опашка за камерата - get_camera_queue(camera_id), където camera_id
+(PTZ_CAMERA_ID) е общ за модулите - и всяка команда носи функцията
+за преместване на своя модул (CameraCommands). Така ръчно преместване през
+който и да е модул изчаква lease-а на цикъла на прихващане.
+"""
+
+import time
+import uuid
+import asyncio
+import threading
+import concurrent.futures
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+from utils.helpers import get_control_loop
+
+# Инициализиране на логър
+logger = setup_logger("command_queue")
+
+
+class PTZBusyError(Exception):
+    """Камерата е заета (lease от друг собственик) и командата не е изпълнена навреме"""
+
+
+class _Command:
+    """Команда в опашката - преместване или заявка за lease"""
+
+    __slots__ = ("kind", "position_id", "lease", "owner", "mover", "futures", "created", "started")
+
+    def __init__(
+        self,
+        kind: str,
+        position_id: Optional[int] = None,
+        lease: Optional[str] = None,
+        owner: Optional[str] = None,
+        mover: Optional[Callable[[int], Awaitable[bool]]] = None
+    ):
+        self.kind = kind
+        self.position_id = position_id
+        self.lease = lease
+        self.owner = owner
+        self.mover = mover
+        self.futures: List[concurrent.futures.Future] = [concurrent.futures.Future()]
+        self.created = time.time()
+        self.started: Optional[float] = None
+
+
+def _set_future(future: concurrent.futures.Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+    """Задава резултат на future, ако още не е завършен или отменен"""
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except concurrent.futures.InvalidStateError:
+        pass
+
+
+class PTZCommandQueue:
+    """
+    Опашка с команди за една камера
+    """
+
+    def __init__(
+        self,
+        name: str,
+        mover: Optional[Callable[[int], Awaitable[bool]]] = None,
+        lease_timeout: float = 900.0
+    ):
+        """
+        Args:
+            name: Име на опашката (за логове и статус)
+            mover: Асинхронна функция, която реално премества камерата (ако
+                   командата не носи собствена)
+            lease_timeout: Максимално време на lease, след което се освобождава автоматично
+        """
+        self.name = name
+        self.mover = mover
+        self.lease_timeout = lease_timeout
+
+        # Състоянието се променя само от контролния loop
+        self._pending: Deque[_Command] = deque()
+        self._current: Optional[_Command] = None
+        self._lease: Optional[str] = None
+        self._lease_owner: Optional[str] = None
+        self._lease_since: Optional[float] = None
+        self._lease_handle: Optional[asyncio.TimerHandle] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.executed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+        # Последната позиция, до която камерата е преместена през опашката
+        self.last_position: Optional[int] = None
+        self.last_move_time: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Thread-safe интерфейс
+
+    def submit_move(
+        self,
+        position_id: int,
+        lease: Optional[str] = None,
+        mover: Optional[Callable[[int], Awaitable[bool]]] = None
+    ) -> concurrent.futures.Future:
+        """
+        Добавя команда за преместване в опашката
+
+        Args:
+            position_id: ID на позицията
+            lease: Токен на lease-а, ако командата е от неговия притежател
+            mover: Функция за преместване (по подразбиране - тази на опашката)
+
+        Returns:
+            concurrent.futures.Future: (успешно ли е преместването, момент на
+            изпращане на командата към камерата)
+        """
+        command = _Command("move", position_id=position_id, lease=lease, mover=mover or self.mover)
+        future = command.futures[0]
+        get_control_loop().call_soon_threadsafe(self._enqueue, command)
+        return future
+
+    def submit_lease(self, owner: str) -> concurrent.futures.Future:
+        """
+        Заявява lease върху камерата - изпълнява се след командите преди него
+
+        Returns:
+            concurrent.futures.Future: Токенът на lease-а
+        """
+        command = _Command("lease", owner=owner)
+        future = command.futures[0]
+        get_control_loop().call_soon_threadsafe(self._enqueue, command)
+        return future
+
+    def release_lease(self, lease: str) -> None:
+        """Освобождава lease"""
+        get_control_loop().call_soon_threadsafe(self._release, lease, False)
+
+    async def move(
+        self,
+        position_id: int,
+        lease: Optional[str] = None,
+        timeout: Optional[float] = None,
+        mover: Optional[Callable[[int], Awaitable[bool]]] = None
+    ) -> bool:
+        """
+        Премества камерата през опашката и изчаква резултата (от всеки event loop)
+
+        Args:
+            position_id: ID на позицията
+            lease: Токен на lease-а, ако командата е от неговия притежател
+            timeout: Максимално време за изчакване (None - без ограничение)
+
+        Raises:
+            PTZBusyError: Командата не е изпълнена в рамките на timeout
+        """
+        success, _ = await self.move_timed(position_id, lease, timeout, mover)
+        return success
+
+    async def move_timed(
+        self,
+        position_id: int,
+        lease: Optional[str] = None,
+        timeout: Optional[float] = None,
+        mover: Optional[Callable[[int], Awaitable[bool]]] = None
+    ) -> Tuple[bool, Optional[float]]:
+        """
+        Като move(), но връща и момента (time.time()), в който командата е
+        изпратена към камерата - без времето, прекарано в опашката
+
+        Returns:
+            Tuple[bool, Optional[float]]: (успешно преместване, начало на движението)
+        """
+        future = self.submit_move(position_id, lease, mover)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise PTZBusyError(
+                f"Камерата е заета ({self._lease_owner or 'опашка'}), "
+                f"преместването към позиция {position_id} е отказано"
+            )
+
+    @asynccontextmanager
+    async def lease(self, owner: str, timeout: Optional[float] = None):
+        """
+        Заема камерата за поредица от команди
+
+        Пример:
+            async with queue.lease("capture_cycle") as lease:
+                await queue.move(1, lease=lease)
+
+        Raises:
+            PTZBusyError: Lease-ът не е получен в рамките на timeout
+        """
+        future = self.submit_lease(owner)
+        try:
+            token = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise PTZBusyError(f"Камерата е заета от {self._lease_owner or 'друга команда'}")
+
+        try:
+            yield token
+        finally:
+            self.release_lease(token)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за състоянието на опашката"""
+        current = self._current
+        return {
+            "name": self.name,
+            "pending": len(self._pending),
+            "current": (
+                {"position_id": current.position_id, "waiters": len(current.futures)}
+                if current is not None else None
+            ),
+            "lease": (
+                {"owner": self._lease_owner, "since": self._lease_since}
+                if self._lease is not None else None
+            ),
+            "last_position": self.last_position,
+            "last_move_time": self.last_move_time,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "executed": self.executed,
+            "failed": self.failed,
+            "cancelled": self.cancelled
+        }
+
+    # ------------------------------------------------------------------
+    # Изпълнява се само в контролния loop
+
+    def _enqueue(self, command: _Command) -> None:
+        """Добавя команда, като я обединява с предходната при същото преместване"""
+        self.submitted += 1
+
+        if command.kind == "move":
+            # Последната чакаща команда, или изпълняваната, ако няма чакащи
+            previous = self._pending[-1] if self._pending else self._current
+            if (previous is not None and previous.kind == "move"
+                    and previous.position_id == command.position_id
+                    and previous.lease == command.lease
+                    and previous.mover is command.mover):
+                future = command.futures[0]
+                if previous is self._current:
+                    # Командата вече тече - новият future е "стартиран" заедно с нея
+                    future.set_running_or_notify_cancel()
+                previous.futures.append(future)
+                self.coalesced += 1
+                logger.info(
+                    f"[{self.name}] Преместване към позиция {command.position_id} "
+                    f"е обединено с предходната заявка"
+                )
+                return
+
+        self._pending.append(command)
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _ensure_worker(self) -> None:
+        """Стартира задачата, която обслужва опашката"""
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _next_command(self) -> Optional[_Command]:
+        """Взима първата команда, която може да се изпълни сега"""
+        for command in self._pending:
+            if self._lease is None or (command.kind == "move" and command.lease == self._lease):
+                self._pending.remove(command)
+                return command
+        return None
+
+    def _grant(self, command: _Command) -> None:
+        """Дава lease на заявилия го"""
+        future = command.futures[0]
+        if not future.set_running_or_notify_cancel():
+            self.cancelled += 1
+            return
+
+        loop = asyncio.get_running_loop()
+        self._lease = uuid.uuid4().hex
+        self._lease_owner = command.owner
+        self._lease_since = time.time()
+        self._lease_handle = loop.call_later(self.lease_timeout, self._release, self._lease, True)
+        logger.info(f"[{self.name}] Камерата е заета от {command.owner}")
+        _set_future(future, self._lease)
+
+    def _release(self, lease: str, expired: bool) -> None:
+        """Освобождава lease и събужда опашката"""
+        if self._lease != lease:
+            return
+
+        if expired:
+            logger.warning(
+                f"[{self.name}] Lease на {self._lease_owner} изтече след "
+                f"{self.lease_timeout} секунди и е освободен принудително"
+            )
+        else:
+            logger.info(f"[{self.name}] Камерата е освободена от {self._lease_owner}")
+
+        if self._lease_handle is not None:
+            self._lease_handle.cancel()
+        self._lease = None
+        self._lease_owner = None
+        self._lease_since = None
+        self._lease_handle = None
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        """Последователно изпълнява командите от опашката"""
+        while True:
+            command = self._next_command()
+            if command is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if command.kind == "lease":
+                self._grant(command)
+                continue
+
+            # Пропускаме команди, чиито заявители вече са се отказали
+            live = [f for f in command.futures if f.set_running_or_notify_cancel()]
+            self.cancelled += len(command.futures) - len(live)
+            if not live:
+                continue
+
+            command.futures = live
+            command.started = time.time()
+            self._current = command
+            try:
+                if command.mover is None:
+                    raise RuntimeError(f"[{self.name}] Няма функция за преместване")
+                result = await command.mover(command.position_id)
+                error = None
+            except Exception as e:
+                result = False
+                error = e
+            finally:
+                self._current = None
+
+            if error is not None or not result:
+                self.failed += 1
+            else:
+                self.last_position = command.position_id
+                self.last_move_time = time.time()
+            self.executed += 1
+
+            for future in command.futures:
+                _set_future(future, (result, command.started), error)
+
+
+class CameraCommands:
+    """
+    Общата опашка на камерата с функцията за преместване на един модул
+
+    Има същия интерфейс като PTZCommandQueue (move, move_timed, lease,
+    get_status), така че модулите не се интересуват, че опашката е обща.
+    """
+
+    def __init__(self, queue: PTZCommandQueue, mover: Callable[[int], Awaitable[bool]]):
+        self.queue = queue
+        self.mover = mover
+
+    @property
+    def last_position(self) -> Optional[int]:
+        return self.queue.last_position
+
+    def submit_move(self, position_id: int, lease: Optional[str] = None) -> concurrent.futures.Future:
+        return self.queue.submit_move(position_id, lease, self.mover)
+
+    async def move(self, position_id: int, lease: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        return await self.queue.move(position_id, lease, timeout, self.mover)
+
+    async def move_timed(
+        self,
+        position_id: int,
+        lease: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Tuple[bool, Optional[float]]:
+        return await self.queue.move_timed(position_id, lease, timeout, self.mover)
+
+    def lease(self, owner: str, timeout: Optional[float] = None):
+        return self.queue.lease(owner, timeout)
+
+    def get_status(self) -> Dict[str, Any]:
+        return self.queue.get_status()
+
+
+# Една опашка за всяка камера (по идентификатор)
+_camera_queues: Dict[str, PTZCommandQueue] = {}
+_camera_queues_lock = threading.Lock()
+
+
+def get_camera_queue(camera_id: str) -> PTZCommandQueue:
+    """
+    Връща общата опашка с команди за дадена камера
+
+    Args:
+        camera_id: Идентификатор на камерата, общ за всички модули, които я управляват
+    """
+    key = (camera_id or "default").strip().lower()
+    with _camera_queues_lock:
+        queue = _camera_queues.get(key)
+        if queue is None:
+            queue = _camera_queues[key] = PTZCommandQueue(key)
+        return queue
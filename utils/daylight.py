@@ -0,0 +1,302 @@
+"""
+Астрономически график на светлата част от денонощието
+
+Изчислява изгрева и залеза (или гражданския здрач) за местоположението на
+камерите и решава кога прихващането и анализите имат смисъл. През нощта
+циклите се спират до зазоряване (suspend) или се разреждат (thin). Всички
+модули използват един и същ график, така че се събуждат едновременно.
+
+Настройки чрез environment променливи:
+    SITE_LATITUDE / SITE_LONGITUDE - координати (по подразбиране Обзор)
+    DAYLIGHT_TWILIGHT - official (изгрев/залез), civil (граждански здрач, по подразбиране)
+    DAYLIGHT_MARGIN_MINUTES - допълнително време преди зазоряване и след смрачаване
+    DAYLIGHT_NIGHT_MODE - suspend (по подразбиране), thin или off
+    DAYLIGHT_NIGHT_INTERVAL - интервал на разредените цикли през нощта в секунди
+    DAYLIGHT_MODE - astronomical (по подразбиране) или fixed (PTZ_ACTIVE_START_HOUR/PTZ_ACTIVE_END_HOUR)
+    TIMEZONE_OFFSET / DST_ENABLED - за показване на местно време (както в PTZ Capture)
+"""
+
+import os
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("daylight")
+
+# Зенитни ъгли: изгрев/залез (с рефракцията и диска на слънцето) и граждански здрач
+ZENITH = {
+    "official": 90.833,
+    "civil": 96.0
+}
+
+_J2000 = 2451545.0
+_J2000_EPOCH = datetime(2000, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _julian_to_datetime(julian: float) -> datetime:
+    """Юлиански ден към UTC datetime"""
+    return _J2000_EPOCH + timedelta(days=julian - _J2000)
+
+
+def _solar_transit(day: date, longitude: float) -> Tuple[float, float]:
+    """
+    Слънчевият обед (юлиански ден) и деклинацията на слънцето (радиани) за деня
+    """
+    # Брой дни от J2000 до средния обед на деня
+    n = day.toordinal() - date(2000, 1, 1).toordinal() + 0.0008
+    mean_noon = n - longitude / 360.0
+
+    anomaly = math.radians((357.5291 + 0.98560028 * mean_noon) % 360)
+    center = 1.9148 * math.sin(anomaly) + 0.0200 * math.sin(2 * anomaly) + 0.0003 * math.sin(3 * anomaly)
+    ecliptic = math.radians((math.degrees(anomaly) + center + 180 + 102.9372) % 360)
+
+    transit = _J2000 + mean_noon + 0.0053 * math.sin(anomaly) - 0.0069 * math.sin(2 * ecliptic)
+    declination = math.asin(math.sin(ecliptic) * math.sin(math.radians(23.4397)))
+    return transit, declination
+
+
+def noon_zenith(day: date, latitude: float, longitude: float) -> float:
+    """Зенитният ъгъл на слънцето в слънчевия обед (в градуси)"""
+    _, declination = _solar_transit(day, longitude)
+    return abs(latitude - math.degrees(declination))
+
+
+def sun_times(day: date, latitude: float, longitude: float, zenith: float = ZENITH["official"]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Изчислява изгрева и залеза за даден ден (уравнение на изгрева, точност ~1 минута)
+
+    Args:
+        day: Дата
+        latitude: Географска ширина (север - положителна)
+        longitude: Географска дължина (изток - положителна)
+        zenith: Зенитен ъгъл на слънцето в момента на изгрева/залеза
+
+    Returns:
+        Tuple: (изгрев, залез) в UTC - (None, None) при полярен ден или нощ
+    """
+    transit, declination = _solar_transit(day, longitude)
+
+    phi = math.radians(latitude)
+    cos_hour_angle = (
+        (math.cos(math.radians(zenith)) - math.sin(phi) * math.sin(declination))
+        / (math.cos(phi) * math.cos(declination))
+    )
+    if cos_hour_angle < -1 or cos_hour_angle > 1:
+        return None, None
+
+    hour_angle = math.degrees(math.acos(cos_hour_angle))
+    return (
+        _julian_to_datetime(transit - hour_angle / 360.0),
+        _julian_to_datetime(transit + hour_angle / 360.0)
+    )
+
+
+def _last_sunday(year: int, month: int) -> date:
+    """Последната неделя от месеца"""
+    day = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+
+class DaylightScheduler:
+    """
+    Общ график на активния (светъл) период за всички модули
+    """
+
+    def __init__(
+        self,
+        latitude: float,
+        longitude: float,
+        twilight: str = "civil",
+        margin_minutes: float = 0.0,
+        night_mode: str = "suspend",
+        night_interval: float = 3600.0,
+        mode: str = "astronomical",
+        fixed_start_hour: int = 6,
+        fixed_end_hour: int = 21,
+        timezone_offset: int = 2,
+        dst_enabled: bool = True
+    ):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.twilight = twilight if twilight in ZENITH else "civil"
+        self.margin = timedelta(minutes=margin_minutes)
+        self.night_mode = night_mode
+        self.night_interval = night_interval
+        self.mode = mode
+        self.fixed_start_hour = fixed_start_hour
+        self.fixed_end_hour = fixed_end_hour
+        self.timezone_offset = timezone_offset
+        self.dst_enabled = dst_enabled
+
+        self._windows: Dict[date, Tuple[datetime, datetime]] = {}
+
+    def local_offset(self, moment: datetime) -> timedelta:
+        """Отместване на местното време (със лятното часово време по правилата на ЕС)"""
+        hours = self.timezone_offset
+        if self.dst_enabled:
+            utc = moment.astimezone(timezone.utc)
+            start = datetime.combine(_last_sunday(utc.year, 3), datetime.min.time(), timezone.utc) + timedelta(hours=1)
+            end = datetime.combine(_last_sunday(utc.year, 10), datetime.min.time(), timezone.utc) + timedelta(hours=1)
+            if start <= utc < end:
+                hours += 1
+        return timedelta(hours=hours)
+
+    def to_local(self, moment: datetime) -> datetime:
+        """UTC време към местно (без tzinfo, както останалите времена в системата)"""
+        return (moment.astimezone(timezone.utc) + self.local_offset(moment)).replace(tzinfo=None)
+
+    def window(self, day: date) -> Tuple[datetime, datetime]:
+        """
+        Активният период за даден (местен) ден
+
+        Returns:
+            Tuple: (начало, край) в UTC
+        """
+        cached = self._windows.get(day)
+        if cached is not None:
+            return cached
+
+        if self.mode == "fixed":
+            noon = datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc)
+            offset = self.local_offset(noon)
+            start = datetime(day.year, day.month, day.day, self.fixed_start_hour, tzinfo=timezone.utc) - offset
+            end = datetime(day.year, day.month, day.day, self.fixed_end_hour, tzinfo=timezone.utc) - offset
+        else:
+            start, end = sun_times(day, self.latitude, self.longitude, ZENITH[self.twilight])
+            if start is None:
+                # Полярен ден или нощ - според височината на слънцето по обед
+                midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+                start = end = midnight
+                if noon_zenith(day, self.latitude, self.longitude) < ZENITH[self.twilight]:
+                    start, end = midnight, midnight + timedelta(days=1)
+            start, end = start - self.margin, end + self.margin
+
+        if len(self._windows) > 16:
+            self._windows.clear()
+        self._windows[day] = (start, end)
+        return start, end
+
+    def _now(self, now: Optional[datetime]) -> datetime:
+        if now is None:
+            return datetime.now(timezone.utc)
+        if now.tzinfo is None:
+            return now.replace(tzinfo=timezone.utc)
+        return now
+
+    def is_daylight(self, now: Optional[datetime] = None) -> bool:
+        """Проверява дали моментът е в активния период"""
+        now = self._now(now)
+        day = self.to_local(now).date()
+        for candidate in (day - timedelta(days=1), day, day + timedelta(days=1)):
+            start, end = self.window(candidate)
+            if start <= now < end:
+                return True
+        return False
+
+    def next_daylight(self, now: Optional[datetime] = None) -> datetime:
+        """Началото на следващия активен период (UTC), или now ако сега е светло"""
+        now = self._now(now)
+        if self.is_daylight(now):
+            return now
+
+        day = self.to_local(now).date()
+        for offset in range(0, 370):
+            start, end = self.window(day + timedelta(days=offset))
+            if start > now and end > start:
+                return start
+        return now
+
+    def next_night(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Краят на текущия активен период (UTC), или None ако сега е нощ"""
+        now = self._now(now)
+        day = self.to_local(now).date()
+        for candidate in (day - timedelta(days=1), day, day + timedelta(days=1)):
+            start, end = self.window(candidate)
+            if start <= now < end:
+                return end
+        return None
+
+    def should_run(self, now: Optional[datetime] = None) -> bool:
+        """
+        Решава дали периодичната задача да се изпълни сега
+
+        През нощта в режим thin задачата се изпълнява, но next_run_delay
+        разрежда изпълненията.
+        """
+        return self.night_mode != "suspend" or self.is_daylight(now)
+
+    def next_run_delay(self, interval: float, now: Optional[datetime] = None) -> float:
+        """
+        Време до следващото изпълнение на периодична задача
+
+        Args:
+            interval: Обичайният интервал на задачата в секунди
+
+        Returns:
+            float: Секунди до следващото изпълнение - през нощта до зазоряване
+                   (suspend) или до по-рядкото от разредения интервал и зазоряването (thin)
+        """
+        now = self._now(now)
+        if self.night_mode == "off" or self.is_daylight(now):
+            return float(interval)
+
+        until_dawn = max(0.0, (self.next_daylight(now) - now).total_seconds())
+        if self.night_mode == "thin":
+            return min(max(float(interval), self.night_interval), until_dawn) or float(interval)
+        # Събуждаме се точно при зазоряване (поне 1 секунда, за да не въртим празен цикъл)
+        return max(1.0, until_dawn)
+
+    def get_status(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Връща информация за графика"""
+        now = self._now(now)
+        today = self.to_local(now).date()
+        start, end = self.window(today)
+        rise, sunset = sun_times(today, self.latitude, self.longitude)
+        next_night = self.next_night(now)
+        return {
+            "mode": self.mode,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "twilight": self.twilight,
+            "night_mode": self.night_mode,
+            "is_daylight": self.is_daylight(now),
+            "sunrise": self.to_local(rise).strftime("%H:%M") if rise else None,
+            "sunset": self.to_local(sunset).strftime("%H:%M") if sunset else None,
+            "active_start": self.to_local(start).strftime("%H:%M"),
+            "active_end": self.to_local(end).strftime("%H:%M"),
+            "next_daylight": self.to_local(self.next_daylight(now)).isoformat(),
+            "next_night": self.to_local(next_night).isoformat() if next_night else None
+        }
+
+
+_scheduler: Optional[DaylightScheduler] = None
+
+
+def get_daylight_scheduler() -> DaylightScheduler:
+    """Връща общия график (създава го от environment при първо извикване)"""
+    global _scheduler
+
+    if _scheduler is None:
+        _scheduler = DaylightScheduler(
+            latitude=float(os.getenv("SITE_LATITUDE", "42.8199")),
+            longitude=float(os.getenv("SITE_LONGITUDE", "27.8800")),
+            twilight=os.getenv("DAYLIGHT_TWILIGHT", "civil"),
+            margin_minutes=float(os.getenv("DAYLIGHT_MARGIN_MINUTES", "0")),
+            night_mode=os.getenv("DAYLIGHT_NIGHT_MODE", "suspend"),
+            night_interval=float(os.getenv("DAYLIGHT_NIGHT_INTERVAL", "3600")),
+            mode=os.getenv("DAYLIGHT_MODE", "astronomical"),
+            fixed_start_hour=int(os.getenv("PTZ_ACTIVE_START_HOUR", "6")),
+            fixed_end_hour=int(os.getenv("PTZ_ACTIVE_END_HOUR", "21")),
+            timezone_offset=int(os.getenv("TIMEZONE_OFFSET", "2")),
+            dst_enabled=os.getenv("DST_ENABLED", "True").lower() in ("true", "1", "yes")
+        )
+        status = _scheduler.get_status()
+        logger.info(
+            f"Активен период днес: {status['active_start']} - {status['active_end']} "
+            f"(изгрев {status['sunrise']}, залез {status['sunset']}, нощем: {_scheduler.night_mode})"
+        )
+
+    return _scheduler
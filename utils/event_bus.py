@@ -0,0 +1,181 @@
+"""
+Шина за събития в процеса (publish/subscribe)
+
+Прихващането и анализите публикуват събития ("frame" - записан нов кадър,
+"analysis" - завършен анализ), а /events ги препраща към браузърите като
+Server-Sent Events. Така страниците се обновяват само при реална промяна
+вместо да презареждат на таймер.
+
+publish() може да се извиква от всяка нишка и event loop (нишките за
+прихващане, контролния loop) - събитията се доставят в loop-а на всеки
+абонат чрез call_soon_threadsafe. Всеки абонат има ограничена опашка - при
+бавен клиент се изпускат най-старите събития, без да се бави публикуването.
+
+Настройки чрез environment променливи:
+    EVENT_QUEUE_SIZE - размер на опашката на абонат (по подразбиране 100)
+    EVENT_REPLAY_SIZE - колко последни събития се пазят за Last-Event-ID (по подразбиране 50)
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("event_bus")
+
+QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+REPLAY_SIZE = int(os.getenv("EVENT_REPLAY_SIZE", "50"))
+
+
+class Event:
+    """Публикувано събитие"""
+
+    __slots__ = ("id", "type", "data", "time")
+
+    def __init__(self, event_id: int, event_type: str, data: Dict[str, Any]):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+        self.time = time.time()
+
+    def to_sse(self) -> str:
+        """Събитието във формата на Server-Sent Events"""
+        payload = json.dumps(self.data, ensure_ascii=False, default=str)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    """Абонамент на един клиент - опашка в event loop-а на абоната"""
+
+    def __init__(self, bus: "EventBus", types: Optional[Set[str]], queue_size: int):
+        self._bus = bus
+        self.types = types
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def wants(self, event: Event) -> bool:
+        return self.types is None or event.type in self.types
+
+    def _put(self, event: Event) -> None:
+        """Добавя събитие в опашката (изпълнява се в loop-а на абоната)"""
+        if self.queue.full():
+            # Бавен клиент - изпускаме най-старото събитие
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    def deliver(self, event: Event) -> None:
+        """Доставя събитие от произволна нишка"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self.loop:
+            self._put(event)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Loop-ът на абоната е затворен
+            self.close()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """Следващото събитие или None при изтичане на timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self._bus.unsubscribe(self)
+
+
+class EventBus:
+    """Шина за събития с абонати в различни event loop-и"""
+
+    def __init__(self, queue_size: int = QUEUE_SIZE, replay_size: int = REPLAY_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: List[Subscription] = []
+        self._recent: Deque[Event] = deque(maxlen=replay_size)
+        self._last_id = 0
+        self._published = 0
+        self._lock = threading.Lock()
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Event:
+        """
+        Публикува събитие към всички абонати
+
+        Args:
+            event_type: Тип на събитието (напр. "frame", "analysis")
+            data: Данни (JSON-сериализируеми)
+        """
+        with self._lock:
+            self._last_id += 1
+            self._published += 1
+            event = Event(self._last_id, event_type, data)
+            self._recent.append(event)
+            subscribers = [subscription for subscription in self._subscribers if subscription.wants(event)]
+
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return event
+
+    def subscribe(self, types: Optional[Iterable[str]] = None, last_event_id: Optional[int] = None) -> Subscription:
+        """
+        Създава абонамент (извиква се от event loop-а на абоната)
+
+        Args:
+            types: Типовете събития (None - всички)
+            last_event_id: Последното получено събитие - пропуснатите след него се доставят веднага
+        """
+        subscription = Subscription(self, set(types) if types else None, self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._recent:
+                    if event.id > last_event_id and subscription.wants(event):
+                        subscription._put(event)
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за шината"""
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self._published,
+                "last_event_id": self._last_id,
+                "dropped": sum(subscription.dropped for subscription in self._subscribers)
+            }
+
+
+_bus = EventBus()
+
+
+def get_event_bus() -> EventBus:
+    """Връща общата шина за събития"""
+    return _bus
+
+
+def publish_event(event_type: str, data: Dict[str, Any]) -> None:
+    """
+    Публикува събитие, без грешка в шината да прекъсва извикващия код
+
+    Използва се от прихващането и анализите.
+    """
+    try:
+        _bus.publish(event_type, data)
+    except Exception as e:
+        logger.error(f"Грешка при публикуване на събитие {event_type}: {e}")
@@ -0,0 +1,256 @@
+"""
+Изпълнители за блокираща работа извън event loop-а
+
+Блокиращите операции (OpenCV, четене и запис на файлове, SQLite, изчакване на
+кадри от RTSP четеца) се изпълняват в общ ограничен пул от нишки - run_io().
+Тежките за процесора операции върху байтове (прекодиране на изображения,
+хешове, локален анализ на небето) се изпълняват в пул от процеси - run_cpu(),
+за да не се конкурират с event loop-а за GIL.
+
+Процесите се създават с fork, а fork на процес с работещи нишки може да
+наследи заключен lock (логване, OpenCV) и работникът да блокира завинаги.
+Затова start_cpu_executor() създава пула и стартира всички процеси при
+стартиране на приложението, преди модулите да пуснат нишките си. Ако пулът
+не е стартиран навреме или се счупи, когато вече има нишки, изчисленията
+остават в пула от нишки.
+
+LoopLagMonitor измерва закъснението на event loop-а: задача, която "спи"
+определено време, и колко по-късно от очакваното се е събудила. Голямо
+закъснение означава блокиращ код в loop-а.
+
+Настройки чрез environment променливи:
+    IO_EXECUTOR_WORKERS - брой нишки за блокиращи операции (по подразбиране 8)
+    CPU_EXECUTOR_WORKERS - брой процеси за тежки изчисления (0 - в пула от нишки)
+    CPU_TASK_TIMEOUT - максимално време за едно изчисление в секунди (по подразбиране 60)
+    LOOP_LAG_INTERVAL - интервал на измерване в секунди (по подразбиране 0.5)
+    LOOP_LAG_WARNING - закъснение в секунди, над което се логва предупреждение
+"""
+
+import os
+import time
+import asyncio
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("executors")
+
+IO_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "8"))
+CPU_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+CPU_TASK_TIMEOUT = float(os.getenv("CPU_TASK_TIMEOUT", "60"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_LAG_WARNING = float(os.getenv("LOOP_LAG_WARNING", "0.25"))
+
+_io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+_cpu_executor: Optional[ProcessPoolExecutor] = None
+# Пул от процеси не може да се създаде безопасно - изчисленията са в пула от нишки
+_cpu_fallback = False
+_cpu_lock = threading.Lock()
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Общият пул от нишки за блокиращи операции"""
+    return _io_executor
+
+
+def _warm_up() -> int:
+    """Празна задача - кара пула да стартира процесите си"""
+    return os.getpid()
+
+
+def start_cpu_executor() -> Executor:
+    """
+    Създава пула от процеси и стартира всички процеси веднага
+
+    Извиква се от app.py преди импортирането на модулите. Процесите се
+    създават с fork - с spawn всеки процес би изпълнил отново app.py. Fork
+    е безопасен само докато процесът няма други нишки, затова след първата
+    нишка нов пул не се създава и се използва пулът от нишки.
+    """
+    global _cpu_executor, _cpu_fallback
+
+    if CPU_WORKERS <= 0:
+        return _io_executor
+
+    with _cpu_lock:
+        if _cpu_executor is not None:
+            return _cpu_executor
+        if _cpu_fallback:
+            return _io_executor
+
+        if threading.active_count() > 1:
+            _cpu_fallback = True
+            logger.warning(
+                "Пулът от процеси не е стартиран преди нишките на приложението - "
+                "изчисленията се изпълняват в пула от нишки"
+            )
+            return _io_executor
+
+        try:
+            context = (
+                multiprocessing.get_context("fork")
+                if "fork" in multiprocessing.get_all_start_methods() else None
+            )
+            executor = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=context)
+            # С fork пулът стартира всички процеси при първата задача
+            executor.submit(_warm_up).result(timeout=CPU_TASK_TIMEOUT)
+        except Exception as e:
+            _cpu_fallback = True
+            logger.warning(f"Пул от процеси не може да се създаде ({e}) - използва се пулът от нишки")
+            return _io_executor
+
+        _cpu_executor = executor
+        logger.info(f"Пул от процеси за изчисления: {CPU_WORKERS} процеса")
+        return _cpu_executor
+
+
+def get_cpu_executor() -> Executor:
+    """Пулът от процеси или пулът от нишки, ако пул от процеси не е стартиран навреме"""
+    cpu = _cpu_executor
+    if cpu is not None:
+        return cpu
+    return start_cpu_executor()
+
+
+def _reset_cpu_executor() -> None:
+    """Изоставя счупен пул от процеси (напр. убит процес) - нов пул се създава само без работещи нишки"""
+    global _cpu_executor
+
+    with _cpu_lock:
+        if _cpu_executor is not None:
+            _cpu_executor.shutdown(wait=False, cancel_futures=True)
+            _cpu_executor = None
+
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """Изпълнява блокираща функция в пула от нишки"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func: Callable, *args, **kwargs) -> Any:
+    """
+    Изпълнява тежка за процесора функция в пула от процеси
+
+    Функцията трябва да е на ниво модул, а аргументите и резултатът - да
+    могат да се сериализират (pickle). Ако пулът се счупи, функцията се
+    изпълнява в пула от нишки.
+
+    Raises:
+        asyncio.TimeoutError: Изчислението не е завършило за CPU_TASK_TIMEOUT секунди
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(get_cpu_executor(), call), CPU_TASK_TIMEOUT)
+    except BrokenProcessPool:
+        logger.error("Пулът от процеси е счупен - изчисленията продължават в пула от нишки")
+        _reset_cpu_executor()
+        return await asyncio.wait_for(loop.run_in_executor(_io_executor, call), CPU_TASK_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error(f"Изчислението {getattr(func, '__name__', func)} не завърши за {CPU_TASK_TIMEOUT:.0f} секунди")
+        raise
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def read_file(path: str) -> bytes:
+    """Чете файл без да блокира event loop-а"""
+    return await run_io(_read_file, path)
+
+
+class LoopLagMonitor:
+    """Измерва закъснението на event loop-а"""
+
+    def __init__(self, name: str, interval: float = LOOP_LAG_INTERVAL, warning: float = LOOP_LAG_WARNING):
+        self.name = name
+        self.interval = interval
+        self.warning = warning
+        self.last = 0.0
+        self.max = 0.0
+        self.average = 0.0
+        self.samples = 0
+        self.slow = 0
+        self.max_at: Optional[float] = None
+
+    def record(self, lag: float) -> None:
+        self.last = lag
+        self.samples += 1
+        # Плъзгаща се средна стойност - последните ~20 измервания
+        self.average += (lag - self.average) / min(self.samples, 20)
+        if lag > self.max:
+            self.max = lag
+            self.max_at = time.time()
+        if lag >= self.warning:
+            self.slow += 1
+            logger.warning(f"Event loop-ът {self.name} е блокиран за {lag * 1000:.0f} ms")
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - started - self.interval))
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "last_ms": round(self.last * 1000, 1),
+            "average_ms": round(self.average * 1000, 1),
+            "max_ms": round(self.max * 1000, 1),
+            "max_at": self.max_at,
+            "samples": self.samples,
+            "slow": self.slow
+        }
+
+
+_monitors: Dict[str, LoopLagMonitor] = {}
+_monitor_tasks: Dict[str, asyncio.Task] = {}
+
+
+def start_loop_lag_monitor(name: str) -> None:
+    """Стартира измерването в текущия event loop (извиква се от loop-а)"""
+    task = _monitor_tasks.get(name)
+    if task is None or task.done():
+        monitor = _monitors[name] = LoopLagMonitor(name)
+        _monitor_tasks[name] = asyncio.get_running_loop().create_task(monitor.run())
+
+
+def get_executors_status() -> Dict[str, Any]:
+    """Връща информация за пуловете и закъснението на event loop-ите"""
+    cpu = _cpu_executor
+    return {
+        "io": {
+            "workers": IO_WORKERS,
+            "threads": len(_io_executor._threads),
+            "queued": _io_executor._work_queue.qsize()
+        },
+        "cpu": {
+            "workers": CPU_WORKERS,
+            "started": cpu is not None,
+            "fallback": _cpu_fallback,
+            "processes": len(cpu._processes or {}) if cpu is not None else 0
+        },
+        "loop_lag": {name: monitor.get_status() for name, monitor in _monitors.items()}
+    }
+
+
+def shutdown_executors() -> None:
+    """Спира пуловете (при спиране на приложението)"""
+    for task in _monitor_tasks.values():
+        # Задачата се отменя в собствения си loop
+        try:
+            task.get_loop().call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            pass  # Loop-ът вече е затворен
+    _monitor_tasks.clear()
+    _reset_cpu_executor()
+    _io_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,297 @@
+"""
+Каталог на прихванатите кадри
+
+Всеки записан кадър се регистрира в SQLite таблица (път, камера, позиция,
+време на прихващане, размер, SHA-256 и размери на изображението) в момента
+на записа. Списъците, последният кадър, "кадърът най-близо до момент T" и
+галерията са заявки по индекс вместо обхождане на директориите.
+
+Кадрите, записани преди каталога, се добавят еднократно с sync_directory.
+
+Настройки чрез environment променливи:
+    FRAME_CATALOG_PATH - път до базата (по подразбиране data/frames.db)
+"""
+
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+from utils.sqlite_store import SQLiteStore, get_data_path
+from utils.result_cache import content_hash
+from utils.history_store import format_timestamp, encode_cursor, decode_cursor
+
+# Инициализиране на логър
+logger = setup_logger("frame_catalog")
+
+# Име на архивен кадър: position_<id>_<YYYYMMDD>_<HHMMSS>.jpg
+FRAME_PATTERN = re.compile(r"position_(\d+)_(\d{8}_\d{6})\.jpg$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    camera TEXT NOT NULL,
+    position_id INTEGER NOT NULL,
+    captured_at TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_frames_position_time ON frames (camera, position_id, captured_at);
+CREATE INDEX IF NOT EXISTS idx_frames_time ON frames (camera, captured_at);
+"""
+
+COLUMNS = "id, path, camera, position_id, captured_at, size, sha256, width, height"
+
+
+def _to_dict(row) -> Dict[str, Any]:
+    return {key: row[key] for key in row.keys()}
+
+
+class FrameCatalog(SQLiteStore):
+    """SQLite каталог на кадрите"""
+
+    SCHEMA = SCHEMA
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__(path or os.getenv("FRAME_CATALOG_PATH") or get_data_path("frames.db"))
+        logger.info(f"Каталог на кадрите: {self.path}")
+
+    def add(
+        self,
+        path: str,
+        camera: str,
+        position_id: int,
+        captured_at: datetime,
+        image_data: Optional[bytes] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None
+    ) -> int:
+        """
+        Регистрира записан кадър
+
+        Args:
+            path: Път към файла
+            camera: Камера (напр. "ptz")
+            position_id: Позиция на камерата
+            captured_at: Време на прихващане
+            image_data: Байтовете на файла - за размера и хеша (None - само размерът от диска)
+            width, height: Размери на изображението
+
+        Returns:
+            int: id на записа
+        """
+        size = len(image_data) if image_data is not None else os.path.getsize(path)
+        digest = content_hash(image_data) if image_data is not None else None
+
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO frames (path, camera, position_id, captured_at, size, sha256, width, height) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET captured_at = excluded.captured_at, size = excluded.size, "
+                "sha256 = excluded.sha256, width = excluded.width, height = excluded.height",
+                (path, camera, position_id, format_timestamp(captured_at), size, digest, width, height)
+            )
+            return cursor.lastrowid
+
+    def remove(self, path: str) -> None:
+        """Премахва кадър от каталога (след изтриване на файла)"""
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM frames WHERE path = ?", (path,))
+
+    def get(self, frame_id: int) -> Optional[Dict[str, Any]]:
+        """Кадър по id"""
+        row = self._connection().execute(f"SELECT {COLUMNS} FROM frames WHERE id = ?", (frame_id,)).fetchone()
+        return _to_dict(row) if row else None
+
+    def latest(self, camera: str, position_id: int) -> Optional[Dict[str, Any]]:
+        """Последният кадър от позицията"""
+        row = self._connection().execute(
+            f"SELECT {COLUMNS} FROM frames WHERE camera = ? AND position_id = ? "
+            "ORDER BY captured_at DESC, id DESC LIMIT 1",
+            (camera, position_id)
+        ).fetchone()
+        return _to_dict(row) if row else None
+
+    def closest(self, camera: str, position_id: int, moment: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Кадърът от позицията, прихванат най-близо до дадения момент
+
+        Две заявки по индекса - последният кадър преди момента и първият след
+        него - и се избира по-близкият.
+        """
+        ts = format_timestamp(moment)
+        connection = self._connection()
+        before = connection.execute(
+            f"SELECT {COLUMNS} FROM frames WHERE camera = ? AND position_id = ? AND captured_at <= ? "
+            "ORDER BY captured_at DESC LIMIT 1",
+            (camera, position_id, ts)
+        ).fetchone()
+        after = connection.execute(
+            f"SELECT {COLUMNS} FROM frames WHERE camera = ? AND position_id = ? AND captured_at > ? "
+            "ORDER BY captured_at LIMIT 1",
+            (camera, position_id, ts)
+        ).fetchone()
+
+        candidates = [_to_dict(row) for row in (before, after) if row is not None]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda frame: abs((datetime.fromisoformat(frame["captured_at"]) - datetime.fromisoformat(ts)).total_seconds())
+        )
+
+    def page(
+        self,
+        camera: str,
+        position_id: Optional[int] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Страница от кадрите - най-новите първи
+
+        Args:
+            camera: Камера
+            position_id: Позиция (None - всички)
+            start: Начало на периода (включително)
+            end: Край на периода (без него)
+            limit: Брой кадри
+            cursor: next_cursor от предишната страница
+
+        Returns:
+            Tuple: (кадри, курсор за по-старите или None)
+        """
+        clauses, params = ["camera = ?"], [camera]
+        if position_id is not None:
+            clauses.append("position_id = ?")
+            params.append(position_id)
+        if start is not None:
+            clauses.append("captured_at >= ?")
+            params.append(format_timestamp(start))
+        if end is not None:
+            clauses.append("captured_at < ?")
+            params.append(format_timestamp(end))
+        if cursor:
+            cursor_ts, cursor_id = decode_cursor(cursor)
+            clauses.append("(captured_at < ? OR (captured_at = ? AND id < ?))")
+            params += [cursor_ts, cursor_ts, cursor_id]
+
+        rows = self._connection().execute(
+            f"SELECT {COLUMNS} FROM frames WHERE {' AND '.join(clauses)} "
+            "ORDER BY captured_at DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        has_more = len(rows) > limit
+        frames = [_to_dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(frames[-1]["captured_at"], frames[-1]["id"]) if has_more else None
+        return frames, next_cursor
+
+    def between(
+        self,
+        camera: str,
+        start: datetime,
+        end: datetime,
+        position_ids: Optional[List[int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Всички кадри за периода [start, end) в хронологичен ред"""
+        clauses, params = ["camera = ?", "captured_at >= ?", "captured_at < ?"], [
+            camera, format_timestamp(start), format_timestamp(end)
+        ]
+        if position_ids:
+            clauses.append(f"position_id IN ({','.join('?' * len(position_ids))})")
+            params += list(position_ids)
+
+        rows = self._connection().execute(
+            f"SELECT {COLUMNS} FROM frames WHERE {' AND '.join(clauses)} ORDER BY captured_at, id",
+            params
+        )
+        return [_to_dict(row) for row in rows]
+
+    def summary(self, camera: str) -> Dict[int, Dict[str, Any]]:
+        """Брой кадри, общ размер и последен кадър за всяка позиция"""
+        rows = self._connection().execute(
+            "SELECT position_id, COUNT(*) AS frames, SUM(size) AS size, MAX(captured_at) AS last_captured_at "
+            "FROM frames WHERE camera = ? GROUP BY position_id",
+            (camera,)
+        )
+        return {
+            row["position_id"]: {
+                "frames": row["frames"],
+                "size_bytes": row["size"] or 0,
+                "last_captured_at": row["last_captured_at"]
+            }
+            for row in rows
+        }
+
+    def count(self) -> int:
+        """Общ брой кадри в каталога"""
+        return self._connection().execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+
+    def sync_directory(self, root: str, camera: str) -> int:
+        """
+        Добавя в каталога архивните кадри от директорията, които още не са в него
+
+        Използва се еднократно за кадрите отпреди каталога - размерите и
+        хешът не се изчисляват, за да не се чете целият архив.
+
+        Returns:
+            int: Брой добавени кадри
+        """
+        if not os.path.isdir(root):
+            return 0
+
+        known = {row[0] for row in self._connection().execute("SELECT path FROM frames WHERE camera = ?", (camera,))}
+        added = []
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                match = FRAME_PATTERN.match(filename)
+                path = os.path.join(directory, filename)
+                if not match or path in known:
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                added.append((
+                    path, camera, int(match.group(1)),
+                    format_timestamp(datetime.strptime(match.group(2), "%Y%m%d_%H%M%S")), size
+                ))
+
+        if added:
+            with self.transaction() as connection:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO frames (path, camera, position_id, captured_at, size) VALUES (?, ?, ?, ?, ?)",
+                    added
+                )
+            logger.info(f"Добавени {len(added)} съществуващи кадъра от {root} в каталога")
+        return len(added)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за каталога"""
+        return {
+            "path": self.path,
+            "size_bytes": self.size_bytes(),
+            "frames": self.count()
+        }
+
+
+_catalog: Optional[FrameCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_frame_catalog() -> FrameCatalog:
+    """Връща общия каталог (създава го при първо извикване)"""
+    global _catalog
+
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = FrameCatalog()
+        return _catalog
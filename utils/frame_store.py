@@ -0,0 +1,161 @@
+"""
+Последните кадри в паметта с ETag и Last-Modified
+
+Модулите за прихващане записват всеки нов кадър и тук, така че
+/rtsp/latest.jpg и /ptz/capture/latest/{id}.jpg се отговарят от паметта, без
+достъп до диска. ETag е хешът на съдържанието, а отговорите са с
+Cache-Control: no-cache - браузърът винаги проверява, но при непроменен кадър
+получава 304 без тяло.
+
+Кадрите се пазят по ключ (камера, позиция), например ("ptz", 2) или
+("rtsp", "latest").
+"""
+
+import os
+import time
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from utils.logger import setup_logger
+from utils.result_cache import content_hash
+
+# Инициализиране на логър
+logger = setup_logger("frame_store")
+
+FrameKey = Tuple[str, Hashable]
+
+
+class StoredFrame:
+    """JPEG кадър с валидаторите за кеширане"""
+
+    __slots__ = ("data", "etag", "last_modified", "version")
+
+    def __init__(self, data: bytes, last_modified: Optional[float] = None, version: Any = None):
+        self.data = data
+        self.etag = f'"{content_hash(data)[:32]}"'
+        self.last_modified = last_modified if last_modified is not None else time.time()
+        self.version = version
+
+
+class LatestFrameStore:
+    """Последният кадър за всяка камера и позиция"""
+
+    def __init__(self):
+        self._frames: Dict[FrameKey, StoredFrame] = {}
+        self._lock = threading.Lock()
+
+    def put(self, key: FrameKey, data: bytes, last_modified: Optional[float] = None, version: Any = None) -> StoredFrame:
+        """Записва нов кадър (хешът се изчислява веднъж тук, а не при всяка заявка)"""
+        frame = StoredFrame(data, last_modified, version)
+        with self._lock:
+            self._frames[key] = frame
+        return frame
+
+    def get(self, key: FrameKey) -> Optional[StoredFrame]:
+        """Последният кадър или None"""
+        with self._lock:
+            return self._frames.get(key)
+
+    def get_versioned(
+        self,
+        key: FrameKey,
+        version: Any,
+        encode: Callable[[], Optional[bytes]],
+        last_modified: Optional[float] = None
+    ) -> Optional[StoredFrame]:
+        """
+        Кадър за дадена версия на източника (напр. времето на кадъра от RTSP четеца)
+
+        encode се извиква само при нова версия - при повторни заявки за същия
+        кадър се връщат вече кодираните байтове.
+        """
+        frame = self.get(key)
+        if frame is not None and frame.version == version:
+            return frame
+
+        data = encode()
+        if data is None:
+            return None
+        return self.put(key, data, last_modified, version)
+
+    def get_or_load(self, key: FrameKey, path: str) -> Optional[StoredFrame]:
+        """
+        Кадърът от паметта или, ако още го няма (напр. след рестарт), от файла
+
+        Файлът се чете само веднъж - следващите заявки се обслужват от паметта.
+        """
+        frame = self.get(key)
+        if frame is not None:
+            return frame
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            last_modified = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            # Междувременно може да е записан по-нов кадър
+            frame = self._frames.get(key)
+            if frame is None:
+                frame = self._frames[key] = StoredFrame(data, last_modified)
+        return frame
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за кадрите в паметта"""
+        with self._lock:
+            return {
+                f"{key[0]}/{key[1]}": {
+                    "size": len(frame.data),
+                    "etag": frame.etag,
+                    "last_modified": formatdate(frame.last_modified, usegmt=True)
+                }
+                for key, frame in self._frames.items()
+            }
+
+
+def _not_modified(request: Request, frame: StoredFrame) -> bool:
+    """Проверява If-None-Match (с предимство) и If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or frame.etag in tags or f"W/{frame.etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            # HTTP датите са с точност до секунда
+            return int(frame.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def frame_response(request: Request, frame: StoredFrame, media_type: str = "image/jpeg") -> Response:
+    """
+    Отговор с кадъра или 304 Not Modified, ако клиентът вече го има
+
+    Cache-Control: no-cache кара браузъра да проверява при всяко зареждане,
+    така че не е нужен ?ts= за заобикаляне на кеша.
+    """
+    headers = {
+        "ETag": frame.etag,
+        "Last-Modified": formatdate(frame.last_modified, usegmt=True),
+        "Cache-Control": "no-cache"
+    }
+    if _not_modified(request, frame):
+        return Response(status_code=304, headers=headers)
+    return Response(content=frame.data, media_type=media_type, headers=headers)
+
+
+_store = LatestFrameStore()
+
+
+def get_frame_store() -> LatestFrameStore:
+    """Връща общото хранилище на последните кадри"""
+    return _store
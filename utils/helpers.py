@@ -0,0 +1,147 @@
+"""
+Общи помощни функции в системата
+
+Контролен event loop - един дълготраен asyncio loop в отделна нишка, на който
+се изпълняват командите към камерите. Синхронният код (нишки за прихващане и
+анализ, синхронните обвивки на контролерите) подава корутини към него вместо
+всеки път да създава и затваря нов event loop.
+"""
+
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Coroutine, Optional
+
+from utils.logger import setup_logger
+from utils.executors import start_loop_lag_monitor
+
+# Инициализиране на логър
+logger = setup_logger("helpers")
+
+# Контролен event loop и нишката, в която работи
+_control_loop: Optional[asyncio.AbstractEventLoop] = None
+_control_thread: Optional[threading.Thread] = None
+_control_lock = threading.Lock()
+
+
+def _run_control_loop(loop: asyncio.AbstractEventLoop, ready: threading.Event) -> None:
+    """Основна функция на нишката на контролния loop"""
+    asyncio.set_event_loop(loop)
+    loop.call_soon(ready.set)
+    try:
+        loop.run_forever()
+    finally:
+        # Отменяме незавършените задачи, за да не останат висящи корутини
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def get_control_loop() -> asyncio.AbstractEventLoop:
+    """
+    Връща контролния event loop (стартира нишката му при първо извикване)
+
+    Returns:
+        asyncio.AbstractEventLoop: Работещ event loop
+    """
+    global _control_loop, _control_thread
+
+    with _control_lock:
+        if _control_loop is not None and _control_thread is not None and _control_thread.is_alive():
+            return _control_loop
+
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        thread = threading.Thread(
+            target=_run_control_loop,
+            args=(loop, ready),
+            name="control-loop",
+            daemon=True
+        )
+        thread.start()
+        ready.wait()
+
+        _control_loop = loop
+        _control_thread = thread
+        logger.info("Контролният event loop е стартиран")
+
+        # Закъснението на контролния loop се вижда в /health
+        loop.call_soon_threadsafe(start_loop_lag_monitor, "control")
+
+        return loop
+
+
+def in_control_loop() -> bool:
+    """Проверява дали текущият код се изпълнява в нишката на контролния loop"""
+    return _control_thread is not None and threading.current_thread() is _control_thread
+
+
+def submit_coroutine(coro: Coroutine) -> concurrent.futures.Future:
+    """
+    Подава корутина към контролния loop без да чака резултата (thread-safe)
+
+    Args:
+        coro: Корутина за изпълнение
+
+    Returns:
+        concurrent.futures.Future: Future с резултата от корутината
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_control_loop())
+
+
+def safe_run_coroutine(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """
+    Изпълнява корутина в контролния loop и изчаква резултата (от синхронен код)
+
+    Args:
+        coro: Корутина за изпълнение
+        timeout: Максимално време за изчакване в секунди (None - без ограничение)
+
+    Returns:
+        Any: Резултатът от корутината
+    """
+    if in_control_loop():
+        # Блокиращо чакане от самия loop никога няма да завърши
+        coro.close()
+        raise RuntimeError(
+            "safe_run_coroutine не може да се извиква от контролния loop - използвайте await"
+        )
+
+    return submit_coroutine(coro).result(timeout)
+
+
+async def run_in_control_loop(coro: Coroutine) -> Any:
+    """
+    Изпълнява корутина в контролния loop от друг event loop (напр. FastAPI)
+
+    Args:
+        coro: Корутина за изпълнение
+
+    Returns:
+        Any: Резултатът от корутината
+    """
+    if in_control_loop():
+        return await coro
+
+    return await asyncio.wrap_future(submit_coroutine(coro))
+
+
+def stop_control_loop(timeout: float = 5.0) -> None:
+    """Спира контролния loop (при спиране на приложението)"""
+    global _control_loop, _control_thread
+
+    with _control_lock:
+        loop, thread = _control_loop, _control_thread
+        _control_loop = None
+        _control_thread = None
+
+    if loop is None or thread is None:
+        return
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    logger.info("Контролният event loop е спрян")
@@ -0,0 +1,316 @@
+"""
+Постоянна история на анализите в SQLite
+
+Резултатите се пазят в SQLite база (SQLiteStore, WAL режим). Обобщените резултати са в analysis_results
+(индекс по модул и време), а резултатите по позиции - в position_results
+(индекс по позиция и време).
+
+Заявките са по страници с курсор (време + id) вместо OFFSET, така че
+страниците от дълъг период се четат еднакво бързо, а stream() чете на
+порции с постоянна памет.
+
+Настройки чрез environment променливи:
+    HISTORY_DB_PATH - път до базата (по подразбиране data/history.db)
+    HISTORY_RETENTION_DAYS - колко дни да се пазят резултатите (0 - без ограничение)
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.logger import setup_logger
+from utils.sqlite_store import SQLiteStore, get_data_path
+
+# Инициализиране на логър
+logger = setup_logger("history_store")
+
+RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "365"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_results (
+    id INTEGER PRIMARY KEY,
+    module TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    cloud_coverage REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_module_time ON analysis_results (module, timestamp);
+
+CREATE TABLE IF NOT EXISTS position_results (
+    id INTEGER PRIMARY KEY,
+    analysis_id INTEGER NOT NULL REFERENCES analysis_results (id) ON DELETE CASCADE,
+    position_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    cloud_coverage REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_position_time ON position_results (position_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_position_analysis ON position_results (analysis_id);
+"""
+
+
+def format_timestamp(value: datetime) -> str:
+    """Време в ISO формат с фиксирана дължина - подреждането като текст съвпада с хронологичното"""
+    if value.tzinfo is not None:
+        # Анализите се записват в местно време без часова зона
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat(timespec="microseconds")
+
+
+def encode_cursor(timestamp: str, row_id: int) -> str:
+    """Курсор за следващата страница"""
+    return f"{timestamp}_{row_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Разчита курсор от encode_cursor
+
+    Raises:
+        ValueError: При невалиден курсор
+    """
+    timestamp, _, row_id = cursor.rpartition("_")
+    if not timestamp:
+        raise ValueError(f"Невалиден курсор: {cursor}")
+    return timestamp, int(row_id)
+
+
+class HistoryStore(SQLiteStore):
+    """SQLite хранилище за историята на анализите"""
+
+    SCHEMA = SCHEMA
+
+    def __init__(self, path: Optional[str] = None, retention_days: int = RETENTION_DAYS):
+        super().__init__(path or os.getenv("HISTORY_DB_PATH") or get_data_path("history.db"))
+        self.retention_days = retention_days
+        self._last_prune = 0.0
+        logger.info(f"История на анализите: {self.path}")
+
+    def add(
+        self,
+        module: str,
+        timestamp: datetime,
+        data: Dict[str, Any],
+        positions: Optional[Dict[int, Dict[str, Any]]] = None
+    ) -> int:
+        """
+        Записва резултат
+
+        Args:
+            module: Име на модула
+            timestamp: Време на анализа
+            data: Обобщеният резултат (JSON-сериализируем)
+            positions: Резултатите по позиции
+
+        Returns:
+            int: id на записа
+        """
+        return self.add_many(module, [(timestamp, data, positions)])[0]
+
+    def add_many(
+        self,
+        module: str,
+        items: List[Tuple[datetime, Dict[str, Any], Optional[Dict[int, Dict[str, Any]]]]]
+    ) -> List[int]:
+        """Записва няколко резултата в една транзакция"""
+        ids = []
+        with self.transaction() as connection:
+            for timestamp, data, positions in items:
+                ts = format_timestamp(timestamp)
+                cursor = connection.execute(
+                    "INSERT INTO analysis_results (module, timestamp, cloud_coverage, data) VALUES (?, ?, ?, ?)",
+                    (module, ts, data.get("cloud_coverage", data.get("avg_cloud_coverage")), json.dumps(data, ensure_ascii=False))
+                )
+                analysis_id = cursor.lastrowid
+                ids.append(analysis_id)
+
+                for position_id, position_data in (positions or {}).items():
+                    # Позициите без собствено време получават времето на анализа
+                    position_data = {**position_data, "timestamp": position_data.get("timestamp") or ts}
+                    connection.execute(
+                        "INSERT INTO position_results (analysis_id, position_id, timestamp, cloud_coverage, data) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (
+                            analysis_id,
+                            int(position_id),
+                            format_timestamp(datetime.fromisoformat(position_data["timestamp"])),
+                            position_data.get("cloud_coverage"),
+                            json.dumps(position_data, ensure_ascii=False)
+                        )
+                    )
+
+        self._maybe_prune()
+        return ids
+
+    def _maybe_prune(self) -> None:
+        """Изтрива старите резултати (най-много веднъж на час)"""
+        if self.retention_days <= 0 or time.time() - self._last_prune < 3600:
+            return
+        self._last_prune = time.time()
+
+        cutoff = format_timestamp(datetime.now() - timedelta(days=self.retention_days))
+        with self.transaction() as connection:
+            deleted = connection.execute(
+                "DELETE FROM analysis_results WHERE timestamp < ?", (cutoff,)
+            ).rowcount
+        if deleted:
+            logger.info(f"Изтрити {deleted} резултата, по-стари от {self.retention_days} дни")
+
+    def _attach_positions(self, records: List[Dict[str, Any]]) -> None:
+        """Добавя резултатите по позиции към страница от обобщени резултати"""
+        if not records:
+            return
+        by_id = {record["id"]: record for record in records}
+        placeholders = ",".join("?" * len(by_id))
+        rows = self._connection().execute(
+            f"SELECT analysis_id, position_id, data FROM position_results WHERE analysis_id IN ({placeholders})",
+            list(by_id)
+        )
+        for row in rows:
+            by_id[row["analysis_id"]]["positions"][row["position_id"]] = json.loads(row["data"])
+
+    def _where(
+        self,
+        module: Optional[str],
+        position_id: Optional[int],
+        start: Optional[datetime],
+        end: Optional[datetime]
+    ) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        if position_id is not None:
+            clauses.append("position_id = ?")
+            params.append(position_id)
+        else:
+            clauses.append("module = ?")
+            params.append(module)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(format_timestamp(start))
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(format_timestamp(end))
+        return " AND ".join(clauses), params
+
+    def page(
+        self,
+        module: str,
+        limit: int = 10,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        position_id: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Страница от историята - най-новите резултати преди курсора
+
+        Args:
+            module: Име на модула
+            limit: Брой резултати
+            start: Начало на периода (включително)
+            end: Край на периода (без него)
+            cursor: next_cursor от предишната страница
+            position_id: Само резултатите за тази позиция (от position_results)
+
+        Returns:
+            Tuple: (записи в хронологичен ред, курсор за по-старите или None)
+        """
+        table = "position_results" if position_id is not None else "analysis_results"
+        where, params = self._where(module, position_id, start, end)
+        if cursor:
+            cursor_ts, cursor_id = decode_cursor(cursor)
+            where += " AND (timestamp < ? OR (timestamp = ? AND id < ?))"
+            params += [cursor_ts, cursor_ts, cursor_id]
+
+        rows = self._connection().execute(
+            f"SELECT id, timestamp, data FROM {table} WHERE {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        records = [
+            {"id": row["id"], "timestamp": row["timestamp"], "data": json.loads(row["data"]), "positions": {}}
+            for row in reversed(rows)
+        ]
+        if position_id is None:
+            self._attach_positions(records)
+
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"]) if has_more else None
+        return records, next_cursor
+
+    def stream(
+        self,
+        module: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        position_id: Optional[int] = None,
+        batch_size: int = 500
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Всички резултати за периода в хронологичен ред, четени на порции
+
+        Паметта не зависи от дължината на периода - във всеки момент се
+        държи само една порция.
+        """
+        table = "position_results" if position_id is not None else "analysis_results"
+        base_where, base_params = self._where(module, position_id, start, end)
+        last: Optional[Tuple[str, int]] = None
+
+        while True:
+            where, params = base_where, list(base_params)
+            if last is not None:
+                where += " AND (timestamp > ? OR (timestamp = ? AND id > ?))"
+                params += [last[0], last[0], last[1]]
+
+            rows = self._connection().execute(
+                f"SELECT id, timestamp, data FROM {table} WHERE {where} ORDER BY timestamp, id LIMIT ?",
+                params + [batch_size]
+            ).fetchall()
+            if not rows:
+                return
+
+            records = [
+                {"id": row["id"], "timestamp": row["timestamp"], "data": json.loads(row["data"]), "positions": {}}
+                for row in rows
+            ]
+            if position_id is None:
+                self._attach_positions(records)
+            yield from records
+
+            last = (rows[-1]["timestamp"], rows[-1]["id"])
+
+    def latest(self, module: str) -> Optional[Dict[str, Any]]:
+        """Последният резултат на модула"""
+        records, _ = self.page(module, limit=1)
+        return records[0] if records else None
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за базата"""
+        connection = self._connection()
+        counts = {
+            row["module"]: row["count"]
+            for row in connection.execute("SELECT module, COUNT(*) AS count FROM analysis_results GROUP BY module")
+        }
+        return {
+            "path": self.path,
+            "size_bytes": self.size_bytes(),
+            "retention_days": self.retention_days,
+            "results": counts
+        }
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """Връща общото хранилище (създава го при първо извикване)"""
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
@@ -0,0 +1,153 @@
+"""
+Споделени HTTP клиенти с пул от връзки
+
+Вместо нов httpx.AsyncClient (нова TCP и TLS връзка) за всяка заявка, всички
+модули използват един клиент с keep-alive връзки. httpx клиентът е обвързан
+с event loop-а, в който е използван, затова се пази по един клиент за всеки
+работещ loop (на практика - FastAPI loop-а и контролния loop).
+
+Настройки чрез environment променливи:
+    HTTP_MAX_CONNECTIONS - максимален брой връзки (по подразбиране 20)
+    HTTP_MAX_KEEPALIVE - максимален брой неактивни keep-alive връзки (10)
+    HTTP_KEEPALIVE_EXPIRY - време за живот на неактивна връзка в секунди (60)
+    HTTP_TIMEOUT - timeout по подразбиране в секунди (30)
+    HTTP2_ENABLED - HTTP/2, ако пакетът h2 е инсталиран (true)
+"""
+
+import os
+import time
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("http_client")
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+DEFAULT_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "True").lower() in ("true", "1", "yes")
+
+# Клиенти по event loop - записът изчезва заедно с loop-а
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    """Проверява дали HTTP/2 е включен и пакетът h2 е наличен"""
+    if not HTTP2_ENABLED:
+        return False
+
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _create_client() -> httpx.AsyncClient:
+    """Създава нов клиент с пул от връзки"""
+    http2 = http2_available()
+    client = httpx.AsyncClient(
+        http2=http2,
+        timeout=DEFAULT_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+    )
+    logger.info(
+        f"Създаден споделен HTTP клиент (HTTP/2: {'да' if http2 else 'не'}, "
+        f"връзки: {MAX_CONNECTIONS}, keep-alive: {MAX_KEEPALIVE})"
+    )
+    return client
+
+
+class UploadTimer:
+    """
+    Измерва времето за изпращане на тялото на заявката
+
+    Подава се като trace разширение на httpx:
+        timer = UploadTimer()
+        await client.post(url, json=payload, extensions={"trace": timer})
+        timer.elapsed  # секунди
+    """
+
+    def __init__(self):
+        self._started: Optional[float] = None
+        self.elapsed: Optional[float] = None
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name.endswith("send_request_body.started"):
+            self._started = time.perf_counter()
+        elif event_name.endswith("send_request_body.complete") and self._started is not None:
+            self.elapsed = time.perf_counter() - self._started
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Връща споделения HTTP клиент за текущия event loop
+
+    Клиентът не трябва да се затваря от извикващия (без `async with`).
+
+    Returns:
+        httpx.AsyncClient: Клиент с пул от връзки
+    """
+    loop = asyncio.get_running_loop()
+
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            client = _create_client()
+            _clients[loop] = client
+
+    return client
+
+
+async def close_http_clients() -> None:
+    """
+    Затваря всички споделени клиенти (при спиране на приложението)
+
+    Клиентът на текущия loop се затваря директно, а тези на другите
+    работещи loop-ове - в техния собствен loop.
+    """
+    current = asyncio.get_running_loop()
+
+    with _clients_lock:
+        clients = list(_clients.items())
+        _clients.clear()
+
+    for loop, client in clients:
+        if client.is_closed:
+            continue
+        try:
+            if loop is current:
+                await client.aclose()
+            elif loop.is_running():
+                future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+                await asyncio.wait_for(asyncio.wrap_future(future), 5.0)
+        except Exception as e:
+            logger.warning(f"Грешка при затваряне на HTTP клиент: {str(e)}")
+
+    logger.info(f"Затворени {len(clients)} споделени HTTP клиента")
+
+
+def get_http_clients_status() -> Dict[str, Any]:
+    """Връща информация за споделените клиенти"""
+    with _clients_lock:
+        count = sum(1 for client in _clients.values() if not client.is_closed)
+
+    return {
+        "clients": count,
+        "http2": http2_available(),
+        "max_connections": MAX_CONNECTIONS,
+        "max_keepalive_connections": MAX_KEEPALIVE,
+        "keepalive_expiry": KEEPALIVE_EXPIRY
+    }
@@ -0,0 +1,121 @@
+"""
+Подготовка на изображенията преди изпращане към модела
+
+Кадрите от камерите са в пълна резолюция, а моделът така или иначе ги намалява
+до около 1568 пиксела по дългата страна. Намаляването и повторното кодиране
+преди заявката намаляват base64 payload-а многократно, без загуба на
+информация за анализа. По желание се оставя само горната част на кадъра
+(небето), за да не се изпращат сгради и терен.
+"""
+
+import time
+from io import BytesIO
+from typing import Any, Dict, Tuple
+
+from PIL import Image
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("image_preprocess")
+
+
+def preprocess_image(
+    image_data: bytes,
+    max_edge: int = 1568,
+    jpeg_quality: int = 85,
+    sky_crop_ratio: float = 1.0
+) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Намалява, изрязва и прекодира изображение за изпращане към модела
+
+    Ако обработеното изображение не е по-малко от оригинала, се връща оригиналът.
+
+    Args:
+        image_data: Оригиналните байтове на изображението
+        max_edge: Максимален размер на дългата страна в пиксели (0 - без намаляване)
+        jpeg_quality: JPEG качество при повторното кодиране
+        sky_crop_ratio: Каква част от височината да се запази отгоре (1.0 - целия кадър)
+
+    Returns:
+        Tuple: (байтове за изпращане, статистика за обработката)
+    """
+    start_time = time.time()
+
+    image = Image.open(BytesIO(image_data))
+    original_size = image.size
+
+    crop_ratio = min(max(sky_crop_ratio, 0.1), 1.0)
+    target_width, target_height = original_size[0], int(original_size[1] * crop_ratio)
+    scale = 1.0
+    if max_edge > 0 and max(target_width, target_height) > max_edge:
+        scale = max_edge / max(target_width, target_height)
+
+    # При JPEG декодираме директно в по-малка резолюция (кратна на 1/2, 1/4, 1/8)
+    image.draft("RGB", (int(original_size[0] * scale), int(original_size[1] * scale)))
+    image = image.convert("RGB")
+
+    if crop_ratio < 1.0:
+        image = image.crop((0, 0, image.width, int(image.height * crop_ratio)))
+
+    if scale < 1.0:
+        new_size = (
+            max(1, round(target_width * scale)),
+            max(1, round(target_height * scale))
+        )
+        if image.size != new_size:
+            image = image.resize(new_size, Image.LANCZOS)
+
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+    processed = buffer.getvalue()
+
+    used_original = len(processed) >= len(image_data) and crop_ratio >= 1.0
+    if used_original:
+        processed = image_data
+
+    stats = {
+        "original_bytes": len(image_data),
+        "processed_bytes": len(processed),
+        "bytes_saved": len(image_data) - len(processed),
+        "original_size": list(original_size),
+        "processed_size": list(original_size if used_original else image.size),
+        "sky_crop_ratio": crop_ratio,
+        "preprocess_time": time.time() - start_time
+    }
+
+    return processed, stats
+
+
+def estimate_upload_time_saved(stats: Dict[str, Any], upload_time: float, payload_bytes: int) -> Dict[str, Any]:
+    """
+    Добавя към статистиката измереното и спестеното време за качване
+
+    Спестеното време е оценка по измерената скорост на качване на текущата
+    заявка, приложена към разликата в размера на base64 данните.
+
+    Args:
+        stats: Статистика от preprocess_image
+        upload_time: Измерено време за изпращане на тялото на заявката в секунди
+        payload_bytes: Размер на тялото на заявката в байтове
+
+    Returns:
+        Dict: Статистиката с добавени upload_time и upload_time_saved
+    """
+    stats["upload_time"] = upload_time
+    if upload_time and payload_bytes > 0:
+        # base64 увеличава размера с 4/3
+        saved_payload = stats["bytes_saved"] * 4 / 3
+        stats["upload_time_saved"] = upload_time * saved_payload / payload_bytes
+    else:
+        stats["upload_time_saved"] = None
+
+    logger.info(
+        f"Изображение {stats['original_size'][0]}x{stats['original_size'][1]} -> "
+        f"{stats['processed_size'][0]}x{stats['processed_size'][1]}, "
+        f"{stats['original_bytes']} -> {stats['processed_bytes']} bytes "
+        f"(спестени {stats['bytes_saved']}), качване {upload_time or 0:.3f} сек"
+        + (f", спестени ~{stats['upload_time_saved']:.3f} сек" if stats["upload_time_saved"] else "")
+    )
+
+    return stats
@@ -0,0 +1,214 @@
+"""
+Ограничаване на честотата на заявките и прекъсвач на веригата
+
+TokenBucket разпределя заявките във времето (капацитет = допустим изблик,
+скорост = заявки в секунда). Когато сървърът върне retry-after или изчерпан
+лимит, кофата се "замразява" до указания момент за всички заявки.
+
+CircuitBreaker спира заявките след поредица от неуспехи и пропуска една
+пробна заявка след изтичане на паузата.
+
+Състоянието се пази с threading.Lock, а чакането е с asyncio.sleep, затова
+един обект може да се използва едновременно от няколко event loop-а
+(FastAPI и контролния loop).
+"""
+
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("rate_limiter")
+
+
+class CircuitOpenError(RuntimeError):
+    """Заявката е отказана, защото прекъсвачът е отворен"""
+
+
+class TokenBucket:
+    """
+    Кофа с жетони за заявки
+
+    Всяка заявка резервира жетон - ако няма свободен, чака толкова, колкото е
+    нужно за натрупването му. Резервацията е честна: едновременните заявки
+    се подреждат една след друга вместо да се изпращат наведнъж.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """
+        Резервира жетон
+
+        Returns:
+            float: Секунди, които заявката трябва да изчака
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    async def acquire(self) -> float:
+        """Изчаква свободен жетон и връща времето на изчакване"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Спира всички заявки за дадения брой секунди (retry-after, изчерпан лимит)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за състоянието на кофата"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "rate_per_minute": round(self.rate * 60, 1),
+                "capacity": self.capacity,
+                "available": round(max(self._tokens, 0.0), 2),
+                "queued": max(0, int(-self._tokens // 1)),
+                "paused_for": round(max(0.0, self._paused_until - now), 1)
+            }
+
+
+class CircuitBreaker:
+    """
+    Прекъсвач на веригата
+
+    closed - заявките минават; след failure_threshold поредни неуспеха -> open
+    open - заявките се отказват до изтичане на cooldown -> half_open
+    half_open - минава една пробна заявка; успех -> closed, неуспех -> open
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = "half_open"
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> Optional[str]:
+        """
+        Проверява дали заявката може да бъде изпратена
+
+        Returns:
+            Optional[str]: None - заявката се отказва; "closed" - обикновена
+                           заявка; "half_open" - заявката е пробата
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == "closed":
+                return state
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return state
+            return None
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != "closed":
+                logger.info("Прекъсвачът е затворен - API-то отговаря отново")
+            self._state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == "half_open" or self._failures >= self.failure_threshold:
+                if state != "open":
+                    logger.warning(
+                        f"Прекъсвачът е отворен след {self._failures} поредни неуспеха - "
+                        f"заявките спират за {self.cooldown:.0f} секунди"
+                    )
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def record_cancelled(self, probe: bool) -> None:
+        """
+        Заявката е прекъсната без отговор (изтекло време, спряна задача)
+
+        Прекъсната пробна заявка се брои за неуспех - иначе прекъсвачът остава
+        в half_open със заета проба и отказва всички следващи заявки.
+        Прекъснатите обикновени заявки не променят състоянието.
+
+        Args:
+            probe: Заявката е допусната като проба (allow() е върнал "half_open")
+        """
+        if not probe:
+            return
+        with self._lock:
+            if not self._probe_in_flight:
+                return
+        self.record_failure()
+
+    def retry_in(self) -> float:
+        """Секунди до пробната заявка (0, ако прекъсвачът не е отворен)"""
+        with self._lock:
+            if self._current_state() != "open":
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за състоянието на прекъсвача"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "cooldown": self.cooldown,
+            "retry_in": round(self.retry_in(), 1)
+        }
+
+
+def backoff_delay(attempt: int, base: float, maximum: float, retry_after: Optional[float] = None) -> float:
+    """
+    Време за изчакване преди повторен опит
+
+    Експоненциално нарастване с пълен jitter (равномерно между 0 и горната
+    граница), за да не се синхронизират едновременните заявки. Ако сървърът
+    е подал retry-after, се чака поне толкова.
+
+    Args:
+        attempt: Номер на повторния опит (от 0)
+        base: Начално време в секунди
+        maximum: Горна граница в секунди
+        retry_after: Времето, поискано от сървъра
+    """
+    delay = random.uniform(0, min(maximum, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
@@ -0,0 +1,341 @@
+"""
+Кеш на резултатите от анализ по съдържание на изображението
+
+Ключът е SHA-256 на байтовете на изображението. Освен точното съвпадение, кешът
+открива и почти еднакви кадри чрез перцептивен хеш (dHash, 64 бита) - два
+кадъра с разстояние на Хеминг до max_distance се считат за еднакви. Хешът се
+смята само върху горната част на кадъра (небето, sky_ratio от височината), за
+да не се губи промяна в облачността зад неподвижния преден план, а почти
+еднаквите кадри се приемат само за един интервал на анализ. Паметта
+е ограничена с LRU, а по желание резултатите се пазят и на диска, така че
+да оцеляват при рестарт.
+
+Настройки чрез environment променливи:
+    RESULT_CACHE_SIZE - максимален брой резултати в паметта (по подразбиране 128)
+    RESULT_CACHE_MAX_DISTANCE - максимално разстояние между перцептивните хешове (4)
+    RESULT_CACHE_MAX_AGE - максимална възраст на резултат в секунди (3600)
+    RESULT_CACHE_SIMILAR_MAX_AGE - максимална възраст при почти еднакъв кадър в секунди (300)
+    RESULT_CACHE_SKY_RATIO - част от височината на кадъра (отгоре) за перцептивния хеш (0.6)
+    RESULT_CACHE_DIR - директория за дисковия кеш (празно - само в паметта)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from PIL import Image
+
+from utils.logger import setup_logger
+from utils.executors import run_io, run_cpu
+
+# Инициализиране на логър
+logger = setup_logger("result_cache")
+
+CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "128"))
+MAX_DISTANCE = int(os.getenv("RESULT_CACHE_MAX_DISTANCE", "4"))
+MAX_AGE = float(os.getenv("RESULT_CACHE_MAX_AGE", "3600"))
+SIMILAR_MAX_AGE = float(os.getenv("RESULT_CACHE_SIMILAR_MAX_AGE", "300"))
+SKY_RATIO = float(os.getenv("RESULT_CACHE_SKY_RATIO", "0.6"))
+CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+
+
+def content_hash(image_data: bytes) -> str:
+    """SHA-256 на байтовете на изображението"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def perceptual_hash(image_data: bytes, sky_ratio: float = 1.0) -> int:
+    """
+    Изчислява dHash (разлика между съседни пиксели в 9x8 сива миниатюра)
+
+    Args:
+        image_data: JPEG/PNG байтове
+        sky_ratio: Каква част от височината на кадъра (отгоре) да се хешира
+
+    Returns:
+        int: 64-битов перцептивен хеш
+    """
+    image = Image.open(BytesIO(image_data))
+    # При JPEG декодираме директно в намален размер - многократно по-бързо
+    image.draft("L", (64, 64))
+    image = image.convert("L")
+    if sky_ratio < 1.0:
+        width, height = image.size
+        image = image.crop((0, 0, width, max(1, int(height * sky_ratio))))
+    pixels = list(image.resize((9, 8), Image.BILINEAR).getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Брой различни битове между два хеша"""
+    return bin(a ^ b).count("1")
+
+
+def compute_image_hashes(image_data: bytes, sky_ratio: float = SKY_RATIO) -> Tuple[str, Optional[int]]:
+    """Връща SHA-256 и перцептивния хеш на небето (None, ако изображението не може да се декодира)"""
+    try:
+        phash = perceptual_hash(image_data, sky_ratio)
+    except Exception as e:
+        logger.warning(f"Грешка при изчисляване на перцептивен хеш: {str(e)}")
+        phash = None
+    return content_hash(image_data), phash
+
+
+class AnalysisResultCache:
+    """
+    LRU кеш на резултати от анализ с точно и приблизително съвпадение
+
+    Резултатите са разделени по scope (напр. модел и позиция), защото един и
+    същ кадър дава различен резултат при различен промпт или модел.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_items: int = CACHE_SIZE,
+        max_distance: int = MAX_DISTANCE,
+        max_age: float = MAX_AGE,
+        similar_max_age: float = SIMILAR_MAX_AGE,
+        sky_ratio: float = SKY_RATIO,
+        disk_dir: Optional[str] = None
+    ):
+        """
+        Args:
+            name: Име на кеша (за логове и поддиректория на дисковия кеш)
+            max_items: Максимален брой резултати в паметта
+            max_distance: Максимално разстояние на Хеминг за почти еднакви кадри (0 - само точно съвпадение)
+            max_age: Максимална възраст на резултат в секунди
+            similar_max_age: Максимална възраст на резултат при почти еднакъв кадър
+                (около един интервал на анализ - облаците се менят бавно, но се менят)
+            sky_ratio: Част от височината на кадъра (отгоре), върху която се смята перцептивният хеш
+            disk_dir: Директория за дисковия кеш (None - по RESULT_CACHE_DIR)
+        """
+        self.name = name
+        self.max_items = max_items
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.similar_max_age = similar_max_age
+        self.sky_ratio = sky_ratio
+
+        base_dir = CACHE_DIR if disk_dir is None else disk_dir
+        self.disk_dir = os.path.join(base_dir, name) if base_dir else None
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            except Exception as e:
+                logger.warning(f"Дисковият кеш {self.disk_dir} е изключен: {str(e)}")
+                self.disk_dir = None
+
+        # (scope, sha256) -> {"phash", "created", "value"}
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, scope: str, digest: str) -> str:
+        """Път до файла на резултата в дисковия кеш"""
+        safe_scope = "".join(c if c.isalnum() or c in "-_." else "_" for c in scope)
+        return os.path.join(self.disk_dir, f"{safe_scope}_{digest}.json")
+
+    def _load_from_disk(self, scope: str, digest: str) -> Optional[Dict[str, Any]]:
+        """Чете запис от дисковия кеш"""
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(scope, digest)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Невалиден запис в дисковия кеш {path}: {str(e)}")
+            return None
+
+    def _save_to_disk(self, scope: str, digest: str, entry: Dict[str, Any]) -> None:
+        """Записва резултат в дисковия кеш и премахва най-старите записи"""
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(scope, digest)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+
+            # Дисковият кеш е до 10 пъти по-голям от този в паметта
+            files = [
+                os.path.join(self.disk_dir, name)
+                for name in os.listdir(self.disk_dir) if name.endswith(".json")
+            ]
+            excess = len(files) - self.max_items * 10
+            if excess > 0:
+                for old_path in sorted(files, key=os.path.getmtime)[:excess]:
+                    os.remove(old_path)
+        except Exception as e:
+            logger.warning(f"Грешка при запис в дисковия кеш {path}: {str(e)}")
+
+    def _is_fresh(self, entry: Dict[str, Any], max_age: Optional[float] = None) -> bool:
+        """Проверява дали записът не е по-стар от max_age"""
+        return time.time() - entry["created"] < (self.max_age if max_age is None else max_age)
+
+    def lookup(
+        self,
+        scope: str,
+        digest: str,
+        phash: Optional[int]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Търси резултат за изображение
+
+        Args:
+            scope: Обхват на резултата (модел, позиция)
+            digest: SHA-256 на изображението
+            phash: Перцептивен хеш (None - само точно съвпадение)
+
+        Returns:
+            Tuple: (резултат или None, вид на съвпадението - "exact", "similar", "disk" или None)
+        """
+        key = (scope, digest)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_fresh(entry):
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    return entry["value"], "exact"
+                del self._entries[key]
+
+            if phash is not None and self.max_distance > 0:
+                best_key, best_distance = None, None
+                for other_key, other in self._entries.items():
+                    if other_key[0] != scope or other["phash"] is None:
+                        continue
+                    if not self._is_fresh(other, min(self.max_age, self.similar_max_age)):
+                        continue
+                    distance = hamming_distance(phash, other["phash"])
+                    if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                        best_key, best_distance = other_key, distance
+
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.similar_hits += 1
+                    logger.info(
+                        f"[{self.name}] Почти еднакъв кадър ({scope}, разстояние {best_distance}), "
+                        f"използваме кеширания резултат"
+                    )
+                    return self._entries[best_key]["value"], "similar"
+
+        entry = self._load_from_disk(scope, digest)
+        if entry is not None and self._is_fresh(entry):
+            with self._lock:
+                self._store(key, entry)
+                self.disk_hits += 1
+            return entry["value"], "disk"
+
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def put(self, scope: str, digest: str, phash: Optional[int], value: Dict[str, Any]) -> None:
+        """
+        Запазва резултат за изображение
+
+        Args:
+            scope: Обхват на резултата (модел, позиция)
+            digest: SHA-256 на изображението
+            phash: Перцептивен хеш
+            value: Резултатът от анализа
+        """
+        entry = {"phash": phash, "created": time.time(), "value": value}
+
+        with self._lock:
+            self._store((scope, digest), entry)
+
+        self._save_to_disk(scope, digest, entry)
+
+    def _store(self, key: Tuple[str, str], entry: Dict[str, Any]) -> None:
+        """Добавя запис и премахва най-отдавна използваните (под self._lock)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+
+    async def analyze(
+        self,
+        scope: str,
+        image_data: bytes,
+        analyze: Callable[[], Awaitable[Tuple[bool, Dict[str, Any]]]],
+        use_cache: bool = True
+    ) -> Tuple[bool, Dict[str, Any], Optional[str]]:
+        """
+        Връща кеширания резултат за изображението или извиква анализа
+
+        Args:
+            scope: Обхват на резултата (модел, позиция)
+            image_data: Байтовете на изображението
+            analyze: Асинхронна функция, която анализира изображението
+            use_cache: False - винаги нов анализ (резултатът пак се кешира)
+
+        Returns:
+            Tuple: (успех, резултат, вид на съвпадението или None при нов анализ)
+        """
+        start_time = time.time()
+        digest, phash = await run_cpu(compute_image_hashes, image_data, self.sky_ratio)
+
+        if use_cache:
+            value, hit = await run_io(self.lookup, scope, digest, phash)
+            if value is not None:
+                # Времето за анализ отразява само търсенето в кеша
+                value = dict(value)
+                value["analysis_time"] = time.time() - start_time
+                return True, value, hit
+
+        success, value = await analyze()
+        if success:
+            await run_io(self.put, scope, digest, phash, value)
+        return success, value, None
+
+    def clear(self) -> None:
+        """Изчиства кеша в паметта"""
+        with self._lock:
+            self._entries.clear()
+        logger.info(f"Кешът {self.name} е изчистен")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща информация за състоянието на кеша"""
+        with self._lock:
+            items = len(self._entries)
+
+        return {
+            "name": self.name,
+            "items": items,
+            "max_items": self.max_items,
+            "max_distance": self.max_distance,
+            "max_age": self.max_age,
+            "similar_max_age": self.similar_max_age,
+            "sky_ratio": self.sky_ratio,
+            "disk_dir": self.disk_dir,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,570 @@
+"""
+Общ планировчик на периодичните задачи
+
+Прихващането (PTZ и RTSP) и анализите се изпълняват като задачи в един
+планировчик в контролния event loop, вместо всеки модул да държи собствена
+нишка с time.sleep. Задачите се спират и пускат веднага (без да се чака
+изтичането на интервала), а изпълнението, което е в ход, може да бъде отменено.
+
+Възможности:
+    - интервални задачи (IntervalTrigger) - интервалът може да се чете от
+      конфигурацията при всяко планиране, така че промяната важи веднага;
+    - cron задачи (CronTrigger) - "минута час ден месец ден_от_седмицата";
+    - jitter - случайно отместване, за да не тръгват всички задачи в една секунда;
+    - пропуснати изпълнения (misfire) - ако задачата закъснее повече от
+      misfire_grace секунди (напр. заради спрян процес), изпълнението се
+      пропуска, а пропуснатите се обединяват в едно следващо;
+    - най-много едно изпълнение на задача - ако предишното още върви,
+      поредното се пропуска;
+    - верижни задачи - chain(upstream, downstream) изпълнява downstream веднага
+      след успешно изпълнение на upstream (напр. анализ веднага след цикъл на
+      прихващане);
+    - светлата част от денонощието - задачите с daylight=True се планират и
+      пропускат по общия график от utils.daylight.
+
+Задачите са async функции; блокиращите функции се обвиват с run_io().
+
+Настройки чрез environment променливи:
+    SCHEDULER_JITTER - jitter по подразбиране в секунди (по подразбиране 5)
+    SCHEDULER_MISFIRE_GRACE - допустимо закъснение в секунди (по подразбиране 300)
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from utils.logger import setup_logger
+from utils.helpers import get_control_loop
+from utils.daylight import get_daylight_scheduler
+
+# Инициализиране на логър
+logger = setup_logger("scheduler")
+
+DEFAULT_JITTER = float(os.getenv("SCHEDULER_JITTER", "5"))
+DEFAULT_MISFIRE_GRACE = float(os.getenv("SCHEDULER_MISFIRE_GRACE", "300"))
+
+# Най-дългото непрекъснато чакане - при промяна на системния часовник
+# планировчикът се "събужда" и преизчислява
+MAX_SLEEP = 60.0
+
+
+class IntervalTrigger:
+    """
+    Изпълнение на всеки N секунди
+
+    Следващото изпълнение се отброява от планираното (а не от края на
+    предишното), така че графикът не се отмества с времето на работата.
+    """
+
+    def __init__(self, seconds: Union[float, Callable[[], float]], daylight: bool = False):
+        """
+        Args:
+            seconds: Интервал в секунди или функция, която го връща (напр. от конфигурацията)
+            daylight: През нощта следващото изпълнение е при зазоряване (или разредено)
+        """
+        self.seconds = seconds
+        self.daylight = daylight
+
+    @property
+    def interval(self) -> float:
+        seconds = self.seconds() if callable(self.seconds) else self.seconds
+        return max(1.0, float(seconds))
+
+    def next_fire(self, anchor: datetime, now: datetime) -> datetime:
+        interval = self.interval
+        if self.daylight:
+            delay = get_daylight_scheduler().next_run_delay(interval)
+            if delay != interval:
+                # Нощ - графикът започва отначало от зазоряването
+                return now + timedelta(seconds=delay)
+        return anchor + timedelta(seconds=interval)
+
+    def describe(self) -> str:
+        return f"every {self.interval:g}s"
+
+
+class CronTrigger:
+    """
+    Изпълнение по cron израз "минута час ден месец ден_от_седмицата"
+
+    Поддържат се *, списъци (1,15), диапазони (8-18) и стъпки (*/10, 8-18/2).
+    Денят от седмицата е 0-6 (0 и 7 - неделя). Както в cron, ако са зададени
+    и денят от месеца, и денят от седмицата, е достатъчно да съвпадне единият.
+    Времето е местното време на сървъра.
+    """
+
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Невалиден cron израз (очакват се 5 полета): {expression}")
+
+        self.expression = expression
+        values = [self._parse(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> Set[int]:
+        values: Set[int] = set()
+        for item in field.split(","):
+            step = 1
+            if "/" in item:
+                item, step_text = item.split("/", 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"Невалидна стъпка в cron израз: {field}")
+
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start_text, end_text = item.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+
+            if start < low or end > high or start > end:
+                raise ValueError(f"Стойност извън диапазона {low}-{high} в cron израз: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # В cron неделя е 0, а в Python понеделник е 0
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    def next_fire(self, anchor: datetime, now: datetime) -> datetime:
+        moment = anchor.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+
+        while moment < limit:
+            if moment.month not in self.months:
+                # Първи ден от следващия месец
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+
+        raise ValueError(f"Cron изразът никога не се изпълнява: {self.expression}")
+
+    def describe(self) -> str:
+        return f"cron {self.expression}"
+
+
+Trigger = Union[IntervalTrigger, CronTrigger]
+
+
+class Job:
+    """Задача в планировчика и статистиката за нея"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        trigger: Trigger,
+        jitter: float,
+        misfire_grace: float,
+        daylight: bool,
+        paused: bool
+    ):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.misfire_grace = misfire_grace
+        self.daylight = daylight
+        self.paused = paused
+
+        self.anchor: Optional[datetime] = None
+        self.next_run: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+        self.last_run: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_status: Optional[str] = None
+        self.last_reason: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.failures = 0
+        self.misfires = 0
+        self.skipped = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "trigger": self.trigger.describe(),
+            "paused": self.paused,
+            "running": self.running,
+            "daylight": self.daylight,
+            "next_run": self.next_run.isoformat() if self.next_run and not self.paused else None,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_duration": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "last_status": self.last_status,
+            "last_reason": self.last_reason,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "failures": self.failures,
+            "misfires": self.misfires,
+            "skipped": self.skipped
+        }
+
+
+class Scheduler:
+    """
+    Планировчик в контролния event loop
+
+    Методите за управление (add_job, pause, resume, run_now) могат да се
+    извикват от всяка нишка - промените по задачите се изпълняват в loop-а
+    на планировчика.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._chains: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Управление (от всяка нишка) ---
+
+    def add_job(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        trigger: Trigger,
+        jitter: float = DEFAULT_JITTER,
+        misfire_grace: float = DEFAULT_MISFIRE_GRACE,
+        daylight: bool = False,
+        paused: bool = False,
+        first_run: Optional[float] = 0.0
+    ) -> Job:
+        """
+        Добавя (или заменя) задача
+
+        Args:
+            name: Уникално име на задачата
+            func: Async функция без аргументи; резултат False се отчита като неуспех
+            trigger: IntervalTrigger или CronTrigger
+            jitter: Максимално случайно отместване в секунди
+            misfire_grace: Допустимо закъснение в секунди, след което изпълнението се пропуска
+            daylight: През нощта изпълненията се пропускат (според utils.daylight)
+            paused: Задачата е спряна до resume()
+            first_run: След колко секунди е първото изпълнение (None - по графика)
+        """
+        job = Job(name, func, trigger, jitter, misfire_grace, daylight, paused)
+        self._ensure_started()
+        self._call(self._add, job, first_run)
+        return job
+
+    def chain(self, upstream: str, downstream: str) -> None:
+        """Изпълнява downstream веднага след всяко успешно изпълнение на upstream"""
+        with self._lock:
+            downstreams = self._chains.setdefault(upstream, [])
+            if downstream not in downstreams:
+                downstreams.append(downstream)
+
+    def pause(self, name: str, cancel: bool = False) -> bool:
+        """
+        Спира задачата
+
+        Args:
+            cancel: Отменя и изпълнението, което е в ход
+
+        Returns:
+            bool: False, ако задачата вече е спряна или не съществува
+        """
+        job = self.get_job(name)
+        if job is None or job.paused:
+            return False
+        job.paused = True
+        if cancel:
+            self._call(self._cancel, job)
+        logger.info(f"Задачата {name} е спряна")
+        return True
+
+    def resume(self, name: str, run_now: bool = True) -> bool:
+        """
+        Пуска спряна задача
+
+        Args:
+            run_now: Изпълнява задачата веднага, а не след интервала
+
+        Returns:
+            bool: False, ако задачата вече работи или не съществува
+        """
+        job = self.get_job(name)
+        if job is None or not job.paused:
+            return False
+        job.paused = False
+        self._call(self._resume, job, run_now)
+        logger.info(f"Задачата {name} е пусната")
+        return True
+
+    def run_now(self, name: str) -> bool:
+        """Изпълнява задачата веднага (извън графика)"""
+        job = self.get_job(name)
+        if job is None:
+            return False
+        self._call(self._start, job, "manual")
+        return True
+
+    async def run_and_wait(
+        self,
+        name: str,
+        func: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Optional[str]:
+        """
+        Изпълнява задачата веднага и изчаква края на изпълнението (от всеки event loop)
+
+        Изпълнението минава през планировчика - брои се в статистиката на
+        задачата, не се застъпва с изпълнение по графика и стартира веригата
+        след задачата.
+
+        Args:
+            func: Async функция вместо тази на задачата (напр. ръчно изпълнение с други параметри)
+
+        Returns:
+            Optional[str]: Резултатът ("ok", "failed", "error", "cancelled") или None,
+                           ако задачата не съществува или вече се изпълнява
+        """
+        job = self.get_job(name)
+        if job is None:
+            return None
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._run_once(job, func), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def get_job(self, name: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(name)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Връща състоянието на планировчика и задачите"""
+        with self._lock:
+            jobs = dict(self._jobs)
+            chains = {upstream: list(downstreams) for upstream, downstreams in self._chains.items()}
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "chains": chains,
+            "jobs": {name: job.get_status() for name, job in jobs.items()}
+        }
+
+    def stop(self) -> None:
+        """Спира планировчика и изпълненията в ход (при спиране на приложението)"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._shutdown)
+        except RuntimeError:
+            pass  # Loop-ът вече е затворен
+
+    # --- Вътрешни (в loop-а на планировчика) ---
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                return
+            self._loop = get_control_loop()
+        self._loop.call_soon_threadsafe(self._start_supervisor)
+
+    def _start_supervisor(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info("Планировчикът е стартиран")
+
+    def _call(self, func: Callable, *args) -> None:
+        """Изпълнява func в loop-а на планировчика"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is loop:
+            func(*args)
+        else:
+            loop.call_soon_threadsafe(func, *args)
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _add(self, job: Job, first_run: Optional[float]) -> None:
+        with self._lock:
+            previous = self._jobs.get(job.name)
+            self._jobs[job.name] = job
+        if previous is not None:
+            self._cancel(previous)
+
+        if first_run is None:
+            self._schedule(job)
+        else:
+            job.anchor = datetime.now() + timedelta(seconds=first_run)
+            job.next_run = job.anchor + timedelta(seconds=random.uniform(0, job.jitter))
+        logger.info(f"Задача {job.name}: {job.trigger.describe()}")
+        self._wake()
+
+    def _resume(self, job: Job, run_now: bool) -> None:
+        job.anchor = None
+        if run_now:
+            job.anchor = job.next_run = datetime.now()
+        else:
+            self._schedule(job)
+        self._wake()
+
+    def _cancel(self, job: Job) -> None:
+        if job.running:
+            job.task.cancel()
+
+    def _schedule(self, job: Job, after: Optional[datetime] = None) -> None:
+        """Пресмята следващото изпълнение (спрямо планираното, без натрупване на закъснение)"""
+        now = datetime.now()
+        anchor = after or job.anchor or now
+        try:
+            next_fire = job.trigger.next_fire(anchor, now)
+            if next_fire <= now:
+                # Изостанали сме (пропуснати изпълнения) - обединяваме ги в едно
+                next_fire = job.trigger.next_fire(now, now)
+        except ValueError as e:
+            logger.error(f"Задачата {job.name} не може да бъде планирана: {e}")
+            job.next_run = None
+            return
+
+        job.anchor = next_fire
+        job.next_run = next_fire + timedelta(seconds=random.uniform(0, job.jitter))
+
+    def _fire(self, job: Job, now: datetime) -> None:
+        """Изпълнение по графика"""
+        lateness = (now - job.next_run).total_seconds()
+        self._schedule(job)
+
+        if job.running:
+            job.skipped += 1
+            logger.warning(f"Задачата {job.name} още се изпълнява - пропуска се поредното изпълнение")
+        elif lateness > job.misfire_grace:
+            job.misfires += 1
+            job.last_status = "misfire"
+            logger.warning(f"Задачата {job.name} закъсня с {lateness:.0f} s - изпълнението се пропуска")
+        elif job.daylight and not get_daylight_scheduler().should_run():
+            job.skipped += 1
+            job.last_status = "night"
+        else:
+            self._start(job, "schedule")
+
+    def _start(self, job: Job, reason: str, func: Optional[Callable[[], Awaitable[Any]]] = None) -> bool:
+        if job.running:
+            job.skipped += 1
+            logger.info(f"Задачата {job.name} вече се изпълнява ({reason})")
+            return False
+        job.task = asyncio.get_running_loop().create_task(self._execute(job, reason, func))
+        return True
+
+    async def _run_once(self, job: Job, func: Optional[Callable[[], Awaitable[Any]]]) -> Optional[str]:
+        if not self._start(job, "manual", func):
+            return None
+        # shield - прекъснатата заявка не отменя самото изпълнение
+        return await asyncio.shield(job.task)
+
+    async def _execute(self, job: Job, reason: str, func: Optional[Callable[[], Awaitable[Any]]] = None) -> str:
+        started = time.monotonic()
+        job.last_run = datetime.now()
+        job.last_reason = reason
+        job.runs += 1
+        status = "ok"
+
+        try:
+            if await (func or job.func)() is False:
+                status = "failed"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            logger.info(f"Изпълнението на задачата {job.name} е отменено")
+        except Exception as e:
+            status = "error"
+            job.last_error = str(e)
+            logger.error(f"Грешка в задачата {job.name}: {str(e)}")
+        finally:
+            job.last_duration = time.monotonic() - started
+            job.last_status = status
+            if status in ("failed", "error"):
+                job.failures += 1
+
+        if status != "ok":
+            return status
+
+        with self._lock:
+            downstreams = [self._jobs.get(name) for name in self._chains.get(job.name, [])]
+        for downstream in downstreams:
+            if downstream is None or downstream.paused:
+                continue
+            self._start(downstream, f"after {job.name}")
+            # Интервалът на веригата се отброява от това изпълнение
+            downstream.anchor = None
+            self._schedule(downstream)
+        self._wake()
+        return status
+
+    async def _run(self) -> None:
+        """Основен цикъл - чака до най-близкото изпълнение или до промяна"""
+        while True:
+            now = datetime.now()
+            with self._lock:
+                jobs = [job for job in self._jobs.values() if not job.paused and job.next_run is not None]
+
+            for job in jobs:
+                if job.next_run <= now:
+                    self._fire(job, now)
+
+            due = [job.next_run for job in jobs if job.next_run is not None]
+            timeout = MAX_SLEEP
+            if due:
+                timeout = min(MAX_SLEEP, max(0.0, (min(due) - datetime.now()).total_seconds()))
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _shutdown(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            self._cancel(job)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        logger.info("Планировчикът е спрян")
+
+
+_scheduler = Scheduler()
+
+
+def get_scheduler() -> Scheduler:
+    """Връща общия планировчик"""
+    return _scheduler
@@ -0,0 +1,69 @@
+"""
+Обща основа за SQLite хранилищата (история на анализите, каталог на кадрите)
+
+Базите са в WAL режим - записите от фоновите цикли не блокират четенето от
+API-то. Всяка нишка използва собствена връзка, а записите се сериализират
+с lock, за да не се чака за заключването на базата.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from utils.logger import setup_logger
+
+# Инициализиране на логър
+logger = setup_logger("sqlite_store")
+
+
+def get_data_path(filename: str) -> str:
+    """Път до файл в директорията за данни - /app/data в Docker среда"""
+    base_path = "/app/data" if os.path.exists("/app") else "data"
+    return os.path.join(os.getenv("DATA_DIR", base_path), filename)
+
+
+class SQLiteStore:
+    """
+    SQLite база с връзка за всяка нишка
+
+    Наследниците задават SCHEMA - изпълнява се при създаването на обекта.
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self.transaction() as connection:
+            connection.executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection: Optional[sqlite3.Connection] = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Транзакция за запис (commit при успех, rollback при грешка)"""
+        with self._write_lock:
+            connection = self._connection()
+            with connection:
+                yield connection
+
+    def size_bytes(self) -> int:
+        """Размер на файла на базата"""
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0